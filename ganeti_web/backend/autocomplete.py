@@ -0,0 +1,162 @@
+# Copyright (C) 2012 Oregon State University
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+"""
+Search suggestions from an in-memory index of hostnames.
+
+Suggestions are requested on every keystroke, so they are made without the
+search engine. Each process keeps the hostnames of all virtual machines,
+nodes and clusters in a sorted list, where the hostnames starting with a
+prefix are found by bisection. The list is rebuilt from the database when
+objects are added, removed or renamed; see invalidate_hostnames().
+"""
+
+from bisect import bisect_left
+from threading import Lock
+
+from django.conf import settings
+
+from ganeti_web.backend.permissions import (objects_any_perms,
+                                            permission_sets)
+from ganeti_web.models import (Cluster, Node, VirtualMachine,
+                               hostname_generation)
+
+
+class HostnameIndex(object):
+    """
+    The hostnames of virtual machines, nodes and clusters, sorted.
+
+    Entries are (type, pk, cluster_id, hostname) tuples, where type is one of
+    "vm", "node" and "cluster". The cluster_id of a cluster is its own pk.
+    """
+
+    # The models indexed, by type.
+    models = (("vm", VirtualMachine), ("node", Node), ("cluster", Cluster))
+
+    def __init__(self):
+        self.generation = None
+        # Lowercased hostnames, and the entries they belong to, as a single
+        # tuple. Searches read it once, so they never see half an index.
+        self.index = [], []
+        self.lock = Lock()
+
+    def build(self):
+        """
+        Load every hostname from the database.
+        """
+
+        rows = []
+        for type, model in self.models:
+            cluster = "pk" if model is Cluster else "cluster"
+            for pk, cluster_id, hostname in model.objects.order_by() \
+                    .values_list("pk", cluster, "hostname"):
+                rows.append((hostname.lower(), (type, pk, cluster_id,
+                                                hostname)))
+        rows.sort()
+
+        self.index = [r[0] for r in rows], [r[1] for r in rows]
+
+    def current(self):
+        """
+        Rebuild the index if any hostname changed since it was built.
+        """
+
+        generation = hostname_generation()
+        if generation != self.generation:
+            with self.lock:
+                if generation != self.generation:
+                    self.build()
+                    self.generation = generation
+        return self
+
+    def search(self, prefix, visible=None, limit=10):
+        """
+        Find the entries whose hostnames start with a prefix, in order.
+
+        :param visible: a function that tells whether an entry may be
+                        suggested, or None for all entries
+        :param limit: the most entries to return
+        """
+
+        keys, entries = self.index
+        prefix = prefix.lower()
+        results = []
+        for i in xrange(bisect_left(keys, prefix), len(keys)):
+            if not keys[i].startswith(prefix) or len(results) == limit:
+                break
+            if visible is None or visible(entries[i]):
+                results.append(entries[i])
+        return results
+
+
+# The index of this process.
+hostname_index = HostnameIndex()
+
+
+def visible_to(user):
+    """
+    Returns a function telling whether ``user`` may see an index entry.
+
+    Clusters and their nodes are visible with any permission on the cluster.
+    Virtual machines are visible with any permission on them, or as admin of
+    their cluster. Permissions come from the cached permission sets when
+    they are enabled. Otherwise they are looked up once, and the virtual
+    machines only if one is suggested.
+    """
+
+    if user.is_superuser:
+        return None
+
+    sets = permission_sets(user)
+
+    def ids(model, perms=None):
+        if sets is not None:
+            return sets.ids(model, perms)
+        return set(objects_any_perms(user, model, perms)
+                   .values_list("pk", flat=True))
+
+    clusters = ids(Cluster)
+    admin = ids(Cluster, ["admin"])
+    vms = []
+
+    def visible(entry):
+        type, pk, cluster_id, hostname = entry
+        if type != "vm":
+            return cluster_id in clusters
+        if cluster_id in admin:
+            return True
+        if not vms:
+            vms.append(ids(VirtualMachine))
+        return pk in vms[0]
+
+    return visible
+
+
+def suggest(user, prefix, limit=None):
+    """
+    Suggest the objects that ``user`` may see whose hostnames start with
+    ``prefix``.
+
+    :param limit: the most suggestions to make. Defaults to
+                  AUTOCOMPLETE_LIMIT.
+    :returns: a list of (type, hostname) tuples
+    """
+
+    if limit is None:
+        limit = getattr(settings, "AUTOCOMPLETE_LIMIT", 10)
+    entries = hostname_index.current().search(prefix, visible_to(user), limit)
+    return [(type, hostname) for type, pk, cluster_id, hostname in entries]
@@ -0,0 +1,136 @@
+# Copyright (C) 2012 Oregon State University
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+"""
+Server-sent event streams of job progress and object state.
+
+Pages used to poll the job_status views every few seconds, and every poll
+loaded the object's jobs, which could refresh each of them from Ganeti. A
+stream instead holds one request open and watches the rows that watch_jobs
+and refresh_cache keep current. Ganeti is never contacted, objects are never
+instantiated, and an event is only sent when a row actually changed.
+"""
+
+import time
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.utils import simplejson as json
+
+from ganeti_web.models import Job, VirtualMachine
+from ganeti_web.util import serializers
+
+
+# Statuses of the jobs shown on pages, as returned by the job_status views.
+SHOWN_STATUSES = ("error", "running", "waiting")
+
+# Seconds between comments sent to keep idle connections open.
+HEARTBEAT = 15
+
+
+def format_event(name, data):
+    """
+    Format an event for the text/event-stream protocol.
+    """
+    return "event: %s\ndata: %s\n\n" % (name, json.dumps(data))
+
+
+def job_feed(model, pk):
+    """
+    A feed of the shown jobs of an object.
+
+    :returns: a (fetch, render) tuple. ``fetch`` returns the stored info of
+              the jobs without decoding it, ``render`` decodes it into the
+              list returned by the job_status views.
+    """
+    ct = ContentType.objects.get_for_model(model)
+    jobs = Job.objects.filter(status__in=SHOWN_STATUSES, content_type=ct,
+                              object_id=pk).order_by("job_id")
+
+    def fetch():
+        return list(jobs.values_list("serialized_info", flat=True))
+
+    def render(rows):
+        return filter(None, map(serializers.loads, rows))
+
+    return fetch, render
+
+
+def vm_state_feed(pk):
+    """
+    A feed of the state of a virtual machine.
+
+    The state is None once the virtual machine has been deleted.
+    """
+    fields = ("status", "mtime", "last_job_id", "pending_delete")
+    vms = VirtualMachine.objects.filter(pk=pk)
+
+    def fetch():
+        return list(vms.values_list(*fields))
+
+    def render(rows):
+        if not rows:
+            return None
+        state = dict(zip(fields, rows[0]))
+        if state["mtime"] is not None:
+            state["mtime"] = state["mtime"].isoformat()
+        return state
+
+    return fetch, render
+
+
+def stream(feeds, interval=1, duration=None):
+    """
+    Generate events whenever the value of a feed changes.
+
+    Every feed is sent once when the stream starts. The stream ends after
+    ``duration`` seconds so that connections are recycled; browsers
+    reconnect by themselves.
+
+    :type feeds: dict
+    :param feeds: (fetch, render) tuples, keyed by event name
+    :param interval: seconds between checks of the feeds
+    :param duration: seconds before the stream ends, or None for never
+    """
+
+    if duration is not None:
+        deadline = time.time() + duration
+    beat = time.time()
+
+    # Tell the browser how soon to reconnect.
+    yield "retry: %d\n\n" % (interval * 1000)
+
+    last = {}
+    while True:
+        for name, (fetch, render) in feeds.items():
+            value = fetch()
+            if name not in last or last[name] != value:
+                last[name] = value
+                yield format_event(name, render(value))
+                beat = time.time()
+
+        # End the transaction so the next check sees new commits.
+        transaction.commit_unless_managed()
+
+        if duration is not None and time.time() >= deadline:
+            break
+
+        if time.time() - beat >= HEARTBEAT:
+            yield ":\n\n"
+            beat = time.time()
+
+        time.sleep(interval)
@@ -0,0 +1,242 @@
+# Copyright (C) 2012 Oregon State University
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+"""
+Tracking of jobs while they run on Ganeti.
+
+Jobs are watched with WaitForJobChange, which Ganeti answers as soon as a job
+changes. All unfinished jobs are watched at once and each answer is handled as
+it arrives, so a finished job is noticed within moments no matter how many
+jobs are running. The progress of jobs is stored as it changes, so pages
+don't have to ask Ganeti about jobs at all.
+"""
+
+from functools import partial
+from Queue import Empty, Queue
+import time
+
+from ganeti_web.models import Cluster, Job
+from ganeti_web.util.client import GanetiApiError
+from ganeti_web.util.fanout import start_call
+
+
+# Statuses of jobs that Ganeti has not finished yet.
+PENDING_STATUSES = ("queued", "waiting", "canceling", "running")
+
+
+def wait_for_job_change(rapi, job_id, status, log_serial, timeout=None):
+    """
+    Wait for the status or the log of a job to change.
+
+    :returns: the new status and log serial. They are the ones passed in if
+              Ganeti gave up waiting before anything changed.
+    """
+
+    previous = [status] if status else None
+    result = rapi.WaitForJobChange(job_id, ["status"], previous, log_serial,
+                                   timeout=timeout)
+    if not result:
+        return status, log_serial
+
+    status = result["job_info"][0]
+    for entry in result["log_entries"] or ():
+        # Log entries are (serial, timestamp, type, message).
+        if log_serial is None or entry[0] > log_serial:
+            log_serial = entry[0]
+    return status, log_serial
+
+
+class JobWatcher(object):
+    """
+    Watches the unfinished jobs of some or all clusters.
+
+    Every job is watched by its own long poll, in its own thread. Call
+    ``poll()`` repeatedly. Each call waits until at least one long poll
+    returns, because its job changed or Ganeti's wait timed out, and then
+    handles every poll that returned so far. Jobs that finished are
+    completed right away, whatever the other jobs are doing, and the jobs
+    whose polls returned are watched again on the next call.
+
+    A job is only completed once its final status is stored. If its cluster
+    fails to answer, storing it is retried on the following calls.
+    """
+
+    # Seconds to wait before retrying to store the final status of jobs,
+    # when no other job is being watched.
+    retry_delay = 5
+
+    def __init__(self, clusters=None, timeout=15):
+        """
+        :param clusters: a queryset of the clusters to watch, or None for all
+        :param timeout: seconds to wait for Ganeti to answer a long poll. It
+                        should be longer than Ganeti's own wait of ten seconds.
+        """
+        self.clusters = clusters
+        self.timeout = timeout
+        # The last status and log serial seen for each Job, by pk.
+        self.seen = {}
+        # The long polls in flight, by Job pk, as (token, started, previous)
+        # tuples. Polls answer into the queue with their pk and token.
+        self.watching = {}
+        self.queue = Queue()
+        # The pks of Jobs that Ganeti finished, whose final status is not
+        # stored yet.
+        self.finishing = set()
+
+    def pending(self):
+        """
+        The unfinished jobs, as (pk, job_id, cluster_id, status) tuples.
+        """
+
+        jobs = Job.objects.filter(ignore_cache=True)
+        if self.clusters is not None:
+            jobs = jobs.filter(cluster__in=self.clusters)
+        return list(jobs.values_list("pk", "job_id", "cluster_id", "status"))
+
+    def watch(self, pending, clusters):
+        """
+        Start a long poll for every pending job that isn't being watched.
+        """
+
+        now = time.time()
+        for pk, job_id, cluster_id, status in pending:
+            if pk in self.finishing:
+                # nothing is left to wait for
+                continue
+            if pk in self.watching:
+                token, started, previous = self.watching[pk]
+                if now - started <= self.timeout + 1:
+                    continue
+                # Ganeti never answered. Give up on the poll and start over.
+
+            status, log_serial = self.seen.get(pk, (status, None))
+            token = object()
+            self.watching[pk] = token, now, (status, log_serial)
+            start_call((pk, token),
+                       partial(wait_for_job_change, clusters[cluster_id].rapi,
+                               job_id, status, log_serial, self.timeout),
+                       self.queue)
+
+    def poll(self):
+        """
+        Wait for the long polls of pending jobs, and complete the jobs that
+        finished.
+
+        :returns: the pks of the Jobs that finished
+        """
+
+        pending = self.pending()
+        cluster_ids = dict((pk, cluster_id)
+                           for pk, job_id, cluster_id, status in pending)
+
+        # Forget about jobs that were completed elsewhere. Their polls are
+        # ignored when they return.
+        for pk in set(self.seen) - set(cluster_ids):
+            del self.seen[pk]
+        for pk in set(self.watching) - set(cluster_ids):
+            del self.watching[pk]
+        self.finishing &= set(cluster_ids)
+        if not pending:
+            return []
+
+        # Clusters are loaded here, so that only RAPI calls happen in the
+        # threads. Their cached info is never needed.
+        clusters = Cluster.objects.defer("serialized_info") \
+                                  .in_bulk(set(cluster_ids.values()))
+        self.watch(pending, clusters)
+
+        # Give Ganeti a moment longer than a single wait to answer, then
+        # take whatever else answered meanwhile.
+        answers = []
+        wait = self.timeout + 1 if self.watching else self.retry_delay
+        try:
+            answers.append(self.queue.get(timeout=wait))
+        except Empty:
+            pass
+        while True:
+            try:
+                answers.append(self.queue.get_nowait())
+            except Empty:
+                break
+
+        changed = []
+        for (pk, token), result, error in answers:
+            if self.watching.get(pk, (None,))[0] is not token:
+                # an abandoned poll, or one for a job no longer pending
+                continue
+            previous = self.watching.pop(pk)[2]
+
+            if error is None:
+                self.seen[pk] = result
+                if result != previous:
+                    changed.append(pk)
+                # New jobs have no status until Ganeti reports one.
+                if result[0] and result[0] not in PENDING_STATUSES:
+                    self.finishing.add(pk)
+            elif isinstance(error, GanetiApiError) and error.code == 404:
+                # The job was archived before it could be seen finishing.
+                self.finishing.add(pk)
+
+        # Store the progress of every job that changed, so that pages
+        # streaming it see it, and the final status of every job that
+        # finished. All jobs of a cluster are fetched at once.
+        finished = set()
+        refresh = set(cluster_ids[pk] for pk in self.finishing)
+        refresh.update(cluster_ids[pk] for pk in changed)
+        for cluster_id in refresh:
+            jobs = Job.objects.refresh_pending(clusters[cluster_id])
+            if jobs is not None:
+                finished.update(job.pk for job in jobs)
+
+        # Jobs that Ganeti finished but not as a success or an error, for
+        # instance because they were canceled, stay pending. Their status is
+        # stored all the same.
+        finished.update(Job.objects.filter(pk__in=self.finishing - finished)
+                        .exclude(status__in=PENDING_STATUSES + ("",))
+                        .values_list("pk", flat=True))
+
+        for pk in finished:
+            self.finishing.discard(pk)
+            self.seen.pop(pk, None)
+            self.watching.pop(pk, None)
+            self.complete(pk)
+
+        return sorted(finished)
+
+    def complete(self, pk):
+        """
+        Stop watching a finished job and update the object it ran on.
+
+        The final status of the job must already be stored.
+        """
+
+        try:
+            job = Job.objects.get(pk=pk)
+        except Job.DoesNotExist:
+            return
+
+        if job.ignore_cache:
+            # Ganeti finished the job but not as a success or an error, for
+            # instance because it was canceled. Stop watching it.
+            job.ignore_cache = False
+            job.save()
+
+        obj = job.obj
+        if obj is not None and obj.last_job_id == job.pk:
+            # Refreshing clears last_job and applies the outcome of the job,
+            # such as deleting a removed VM.
+            obj.refresh()
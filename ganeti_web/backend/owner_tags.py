@@ -0,0 +1,100 @@
+# Copyright (C) 2012 Oregon State University
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+"""
+Tagging of virtual machines in Ganeti with their owners.
+
+Saving a virtual machine whose owner tag is out of date only flags it with
+owner_tag_pending. The tags of all flagged virtual machines of a cluster are
+then updated together, so changing the owner of many virtual machines never
+waits for Ganeti. However often the owner changed, a virtual machine is only
+tagged with its latest owner, and virtual machines that could not be tagged
+stay flagged to be tried again.
+"""
+
+from django.db import transaction
+
+from ganeti_web.models import VirtualMachine, cache_serializer
+from ganeti_web.util import serializers
+from ganeti_web.util.client import GanetiApiError
+
+
+def sync_owner_tags(cluster):
+    """
+    Update the owner tags in Ganeti of the flagged virtual machines of a
+    cluster.
+
+    Virtual machines are not instantiated, so none of them is refreshed.
+
+    :returns: the hostnames of the virtual machines that could not be tagged
+    """
+
+    pending = VirtualMachine.objects.filter(cluster=cluster,
+                                            owner_tag_pending=True)
+    rows = list(pending.values_list("pk", "hostname", "owner", "mtime",
+                                    "serialized_info"))
+    if not rows:
+        return []
+
+    if not cluster.username:
+        # Tags can't be changed without credentials.
+        pending.update(owner_tag_pending=False)
+        return []
+
+    # values_list() skips field conversion, so do it manually.
+    to_datetime = VirtualMachine._meta.get_field("mtime").to_python
+
+    rapi = cluster.rapi
+    synced = []
+    failed = []
+    for pk, hostname, owner_id, mtime, data in rows:
+        mtime = to_datetime(mtime)
+        info = serializers.loads(data)
+        if info is None:
+            synced.append((pk, owner_id, mtime, None))
+            continue
+
+        remove, add = VirtualMachine.owner_tag_changes(info["tags"], owner_id)
+        try:
+            if remove:
+                rapi.DeleteInstanceTags(hostname, remove)
+            if add:
+                rapi.AddInstanceTags(hostname, add)
+        except GanetiApiError, e:
+            # The instance is gone from Ganeti, there is nothing to tag.
+            if e.code != 404:
+                failed.append(hostname)
+                continue
+
+        info["tags"] = [t for t in info["tags"] if t not in remove] + add
+        synced.append((pk, owner_id, mtime, info))
+
+    format = cache_serializer()
+    with transaction.commit_on_success():
+        for pk, owner_id, mtime, info in synced:
+            # Leave virtual machines whose owner changed again flagged.
+            qs = VirtualMachine.objects.filter(pk=pk, owner=owner_id)
+            # Only write the tags into the info that was read. Info stored
+            # by a refresh meanwhile is newer, and the tags just changed
+            # reach it with the next refresh.
+            if info is not None and qs.filter(mtime=mtime).update(
+                    owner_tag_pending=False,
+                    serialized_info=serializers.dumps(info, format)):
+                continue
+            qs.update(owner_tag_pending=False)
+
+    return failed
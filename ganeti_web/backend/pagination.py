@@ -0,0 +1,310 @@
+# Copyright (C) 2012 Oregon State University
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+"""
+Keyset pagination of querysets.
+
+Offset pagination makes the database read and skip every row before a page,
+and count every row for the page links, so the deeper the page the slower it
+gets. Keyset pagination continues from the sort key of the last row shown
+instead, which an index seeks to directly, so every page costs the same as
+the first.
+
+Pages are requested with opaque cursors. A cursor is signed, so clients can't
+forge one to filter on arbitrary values.
+
+Several querysets, such as errors and failed jobs, can be paged as one feed
+ordered by time. Each page reads at most one page of rows from each queryset
+and merges them, however long the feed is.
+"""
+
+from datetime import datetime
+
+from django.core import signing
+from django.db.models import Q
+
+
+CURSOR_SALT = "ganeti_web.backend.pagination"
+
+
+class InvalidCursor(Exception):
+    """
+    A cursor was tampered with, or belongs to a different ordering.
+    """
+
+
+def encode_cursor(data):
+    """
+    Make an opaque, URL-safe cursor from JSON-serializable data.
+    """
+    return signing.dumps(data, salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(cursor):
+    """
+    Recover the data of a cursor made by ``encode_cursor()``.
+
+    :raises InvalidCursor: if the cursor is not one of ours
+    """
+    try:
+        return signing.loads(cursor, salt=CURSOR_SALT)
+    except signing.BadSignature:
+        raise InvalidCursor(cursor)
+
+
+def keyset_filter(fields, values, descending=False, after=True):
+    """
+    Select the rows after, or before, the given sort key.
+
+    For fields (a, b) ascending, the rows after (x, y) are those with
+    ``a > x``, or ``a = x and b > y``. The last field must be unique. Fields
+    must not be nullable, since NULL compares neither less nor greater.
+    """
+
+    op = "gt" if after != descending else "lt"
+    q = None
+    for i, field in enumerate(fields):
+        clause = dict(zip(fields[:i], values[:i]))
+        clause["%s__%s" % (field, op)] = values[i]
+        q = Q(**clause) if q is None else q | Q(**clause)
+    return q
+
+
+def sort_value(obj, field):
+    """
+    The value of a sort field, following relations across ``__``.
+    """
+    for name in field.split("__"):
+        obj = getattr(obj, name)
+    return obj
+
+
+class KeysetPage(object):
+    """
+    A page of a keyset paginated queryset.
+
+    It has the parts of ``django.core.paginator.Page`` that don't need to
+    know the page number.
+    """
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None,
+                 count=None, count_capped=False):
+        """
+        :param count: how many objects there are in all, or None if they were
+                      not counted
+        :param count_capped: whether there are more objects than ``count``
+        """
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.count = count
+        self.count_capped = count_capped
+
+    def __repr__(self):
+        return "<KeysetPage of %d objects>" % len(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def paginate_by_keyset(queryset, fields, page_size, cursor=None,
+                       descending=False, count_limit=None, scope=None):
+    """
+    Get a page of a queryset, ordered by the given fields.
+
+    :param fields: the fields to order by. The last one must be unique, to
+                   break ties.
+    :param cursor: a cursor from the previous page, or None for the first
+    :param count_limit: count the objects, up to this many. The count only
+                        reads primary keys, but reads them all, so it is
+                        capped. None for not counting.
+    :param scope: what cursors belong to, such as the path of the list.
+                  Cursors made for another scope are invalid.
+    :raises InvalidCursor: if the cursor is not valid for this ordering and
+                           scope
+    :returns: a ``KeysetPage``
+    """
+
+    fields = list(fields)
+    ordering = ["-%s" % f if descending else f for f in fields]
+
+    after = True
+    values = None
+    if cursor:
+        data = decode_cursor(cursor)
+        if (data.get("o") != ordering or data.get("s") != scope
+                or len(data.get("v", ())) != len(fields)):
+            raise InvalidCursor(cursor)
+        values = data["v"]
+        after = not data.get("b")
+
+    page = queryset
+    if values is not None:
+        page = page.filter(keyset_filter(fields, values, descending, after))
+    if after:
+        page = page.order_by(*ordering)
+    else:
+        # Read backwards from the cursor, and turn the page around again.
+        page = page.order_by(*["-%s" % f if not descending else f
+                               for f in fields])
+
+    # One more object tells whether there is another page.
+    object_list = list(page[:page_size + 1])
+    more = len(object_list) > page_size
+    object_list = object_list[:page_size]
+    if not after:
+        object_list.reverse()
+
+    def make_cursor(obj, before=False):
+        values = [sort_value(obj, f) for f in fields]
+        return encode_cursor({"o": ordering, "s": scope, "v": values,
+                              "b": before})
+
+    if after:
+        has_next, has_previous = more, values is not None
+    else:
+        # Reading backwards always starts from a page that follows.
+        has_next, has_previous = True, more
+
+    next_cursor = previous_cursor = None
+    if object_list:
+        if has_next:
+            next_cursor = make_cursor(object_list[-1])
+        if has_previous:
+            previous_cursor = make_cursor(object_list[0], before=True)
+
+    count = None
+    count_capped = False
+    if count_limit:
+        count = len(queryset.order_by().values_list("pk")[:count_limit + 1])
+        if count > count_limit:
+            count = count_limit
+            count_capped = True
+
+    return KeysetPage(object_list, next_cursor, previous_cursor, count,
+                      count_capped)
+
+
+def merge_descending(iterables, key):
+    """
+    Merge iterables that are each sorted by descending key into one
+    iterator sorted the same way.
+
+    Items are only taken from the iterables as they are needed.
+    """
+
+    heads = []
+    for iterable in iterables:
+        iterator = iter(iterable)
+        for item in iterator:
+            heads.append([key(item), item, iterator])
+            break
+
+    while heads:
+        head = max(heads, key=lambda h: h[0])
+        yield head[1]
+        for item in head[2]:
+            head[0], head[1] = key(item), item
+            break
+        else:
+            heads.remove(head)
+
+
+def paginate_merged(sources, page_size, cursor=None):
+    """
+    Get a page of several querysets merged into a single feed, newest first.
+
+    Each queryset is ordered by a date field and then by pk, both descending.
+    Rows with the same date are ordered by the position of their queryset in
+    ``sources``, last first.
+
+    :param sources: a sequence of (queryset, field) tuples. The date fields
+                    must not be nullable.
+    :param page_size: the number of objects per page, at least one
+    :param cursor: a cursor from the previous page, or None for the first
+    :raises InvalidCursor: if the cursor is not valid for these sources
+    :raises ValueError: if ``page_size`` is less than one
+    :returns: a ``KeysetPage`` of (index, object) tuples, where index is the
+              position in ``sources`` of the object's queryset. Only the
+              following page has a cursor.
+    """
+
+    if page_size < 1:
+        raise ValueError("page_size must be at least 1, not %r" % page_size)
+
+    position = None
+    if cursor:
+        data = decode_cursor(cursor)
+        try:
+            if data["n"] != len(sources):
+                raise InvalidCursor(cursor)
+            position = datetime(*data["t"]), data["s"], data["p"]
+        except (KeyError, TypeError, ValueError):
+            raise InvalidCursor(cursor)
+
+    def source_rows(index, field, queryset):
+        for obj in queryset:
+            yield (getattr(obj, field), index, obj.pk), obj
+
+    rows = []
+    for index, (queryset, field) in enumerate(sources):
+        queryset = queryset.order_by("-%s" % field, "-pk")
+        if position is not None:
+            date, source, pk = position
+            if index < source:
+                queryset = queryset.filter(**{"%s__lte" % field: date})
+            elif index > source:
+                queryset = queryset.filter(**{"%s__lt" % field: date})
+            else:
+                queryset = queryset.filter(
+                    keyset_filter([field, "pk"], [date, pk], descending=True))
+
+        # No source can contribute more than a page, and one more object
+        # that tells whether there is another page.
+        rows.append(source_rows(index, field, queryset[:page_size + 1]))
+
+    object_list = []
+    next_cursor = None
+    for key, obj in merge_descending(rows, key=lambda row: row[0]):
+        if len(object_list) == page_size:
+            date, index, pk = object_list[-1][0]
+            next_cursor = encode_cursor({
+                "n": len(sources),
+                "t": list(date.timetuple()[:6]) + [date.microsecond],
+                "s": index,
+                "p": pk,
+            })
+            break
+        object_list.append((key, obj))
+
+    return KeysetPage([(key[1], obj) for key, obj in object_list],
+                      next_cursor)
@@ -0,0 +1,165 @@
+# Copyright (C) 2012 Oregon State University
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+"""
+Cached sets of the clusters and virtual machines users may access.
+
+Nearly every page asks what the user may access, often several times. Rather
+than joining through the permission tables each time, the ids of the objects
+granted to each user and group are cached, and dropped when permissions or
+group memberships change; see invalidate_permission_sets().
+"""
+
+from array import array
+
+from django.core.cache import cache
+
+from object_permissions.registration import get_model_perms, permission_map
+
+from ganeti_web.models import (Cluster, PERMISSION_SETS_KEY, VirtualMachine,
+                               permission_cache_timeout)
+
+
+# The models whose permissions are cached.
+MODELS = (Cluster, VirtualMachine)
+
+# Sets larger than this are looked up by joining through the permission
+# tables instead. Databases limit the parameters of a query, and long IN
+# lists aren't faster than the join.
+MAX_IDS = 500
+
+
+def pack(ids):
+    """
+    Store a list of ids compactly, as a string of machine integers.
+    """
+    return array("l", sorted(ids)).tostring()
+
+
+def unpack(packed):
+    """
+    Read a list of ids stored by pack().
+    """
+    ids = array("l")
+    ids.fromstring(packed)
+    return ids
+
+
+def load_grants(**owner):
+    """
+    Load the permissions granted to a user or a group.
+
+    :param owner: ``user=`` or ``group=``
+    :returns: a dict of the packed ids of the objects granted each
+              permission, by model name and permission
+    """
+
+    grants = {}
+    for model in MODELS:
+        perms = get_model_perms(model)
+        ids = dict((perm, []) for perm in perms)
+        rows = permission_map[model].objects.filter(**owner) \
+                                    .values_list("obj", *perms)
+        for row in rows:
+            for perm, value in zip(perms, row[1:]):
+                if value:
+                    ids[perm].append(row[0])
+        grants[model.__name__] = dict((perm, pack(v))
+                                      for perm, v in ids.items() if v)
+    return grants
+
+
+class PermissionSets(object):
+    """
+    The objects granted to a user, directly and through their groups.
+    """
+
+    def __init__(self, grants, group_grants):
+        self.grants = grants
+        self.group_grants = group_grants
+
+    def perms(self, model, groups=True):
+        """
+        The permissions the user has on any object of a model.
+        """
+
+        sources = [self.grants] + (self.group_grants if groups else [])
+        perms = set()
+        for grants in sources:
+            perms.update(grants[model.__name__])
+        return perms
+
+    def ids(self, model, perms=None, groups=True):
+        """
+        The ids of the objects of a model that the user has any of ``perms``
+        on, or any permission if ``perms`` is None.
+        """
+
+        sources = [self.grants] + (self.group_grants if groups else [])
+        ids = set()
+        for grants in sources:
+            for perm, packed in grants[model.__name__].items():
+                if perms is None or perm in perms:
+                    ids.update(unpack(packed))
+        return ids
+
+
+def permission_sets(user):
+    """
+    Get the PermissionSets of a user, or None if permissions aren't cached.
+
+    Costs two cache lookups when the user and their groups are cached.
+    """
+
+    timeout = permission_cache_timeout()
+    if not timeout or user.is_anonymous():
+        return None
+
+    key = PERMISSION_SETS_KEY % ("user", user.pk)
+    entry = cache.get(key)
+    if entry is None:
+        entry = {
+            "groups": list(user.groups.values_list("pk", flat=True)),
+            "grants": load_grants(user=user),
+        }
+        cache.set(key, entry, timeout)
+
+    keys = [PERMISSION_SETS_KEY % ("group", pk) for pk in entry["groups"]]
+    cached = cache.get_many(keys) if keys else {}
+    group_grants = []
+    for key, pk in zip(keys, entry["groups"]):
+        if key not in cached:
+            cached[key] = load_grants(group=pk)
+            cache.set(key, cached[key], timeout)
+        group_grants.append(cached[key])
+
+    return PermissionSets(entry["grants"], group_grants)
+
+
+def objects_any_perms(user, model, perms=None, groups=True):
+    """
+    Get a queryset of the objects of a model that the user has any of
+    ``perms`` on, like ``user.get_objects_any_perms()``, from the cached
+    permission sets when possible.
+    """
+
+    sets = permission_sets(user)
+    if sets is not None:
+        ids = sets.ids(model, perms, groups)
+        if len(ids) <= MAX_IDS:
+            return model.objects.filter(pk__in=ids)
+    return user.get_objects_any_perms(model, perms, groups=groups)
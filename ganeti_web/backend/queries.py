@@ -15,11 +15,14 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
 # USA.
 
+from django.contrib.contenttypes.models import ContentType
 from django.db.models import Q
 
 from object_permissions import get_users_any
 
-from ganeti_web.models import Cluster, ClusterUser, VirtualMachine
+from ganeti_web.backend.permissions import objects_any_perms
+from ganeti_web.models import (Cluster, ClusterUser, Organization, Profile,
+                               VirtualMachine)
 
 
 def cluster_qs_for_user(user):
@@ -28,6 +31,8 @@ def cluster_qs_for_user(user):
     elif user.is_anonymous():
         qs = Cluster.objects.none()
     else:
+        # Users may create virtual machines on these, so they are never
+        # read from cached permission sets, which may be stale.
         qs = user.get_objects_any_perms(Cluster, ['admin','create_vm'], False)
 
     # Exclude all read-only clusters.
@@ -56,6 +61,69 @@ def owner_qs_for_cluster(cluster):
     return qs
 
 
+def cluster_user_labels():
+    """
+    The label of each kind of ClusterUser, by the id of its real_type.
+    """
+
+    # ContentTypes are cached, so this doesn't query after the first time.
+    get = ContentType.objects.get_for_model
+    return {get(Profile).id: "user", get(Organization).id: "group"}
+
+
+def cluster_users_by_prefix(term, limit=10):
+    """
+    Find the users and groups whose names start with a term.
+
+    Names equal to the term rank first, and the rest follow in order of name.
+    Users and groups are both ClusterUsers, so they are searched together,
+    labelled by their real_type, without loading the users or groups
+    themselves.
+
+    :returns: a list of (name, label, pk) tuples, where label is "user",
+              "group" or "other"
+    """
+
+    qs = ClusterUser.objects.filter(name__istartswith=term) \
+                            .values_list("name", "real_type", "pk")
+    results = list(qs.filter(name__iexact=term).order_by("pk")[:limit])
+    if len(results) < limit:
+        # Ordered as the index on name, so the database can stop at the
+        # limit instead of sorting every match.
+        results.extend(qs.exclude(name__iexact=term)
+                         .order_by("name", "pk")[:limit - len(results)])
+
+    labels = cluster_user_labels()
+    return [(name, labels.get(real_type, "other"), pk)
+            for name, real_type, pk in results]
+
+
+# The orderings of the VM tables, for PagedListView.sort_keys. Only fields
+# that can't be NULL may be used, since pages by cursor compare them.
+VM_SORT_KEYS = {
+    "hostname": ("hostname",),
+    "cluster": ("cluster__hostname", "hostname"),
+    "status": ("status", "hostname"),
+    "operating_system": ("operating_system", "hostname"),
+    "ram": ("ram", "hostname"),
+    "disk_size": ("disk_size", "hostname"),
+    "virtual_cpus": ("virtual_cpus", "hostname"),
+}
+
+
+def vm_qs_for_table(qs):
+    """
+    Trim a queryset of virtual machines down to what the VM tables display.
+
+    The cached info of the VMs, and of their clusters and primary nodes, is
+    deferred. Objects loaded this way are never refreshed from Ganeti.
+    """
+
+    return qs.select_related("cluster", "primary_node") \
+             .defer("serialized_info", "cluster__serialized_info",
+                    "primary_node__serialized_info")
+
+
 def vm_qs_for_admins(user):
     """
     Retrieve a queryset of all of the virtual machines for which this user is
@@ -67,8 +135,7 @@ def vm_qs_for_admins(user):
     elif user.is_anonymous():
         qs = VirtualMachine.objects.none()
     else:
-        qs = user.get_objects_any_perms(VirtualMachine, groups=True,
-                                        perms=["admin"])
+        qs = objects_any_perms(user, VirtualMachine, ["admin"])
 
     return qs
 
@@ -85,6 +152,6 @@ def vm_qs_for_users(user):
     else:
         # If no permissions are listed, then *any* permission will cause a VM
         # to be added to the query.
-        qs = user.get_objects_any_perms(VirtualMachine, groups=True)
+        qs = objects_any_perms(user, VirtualMachine)
 
     return qs
@@ -16,6 +16,7 @@
 # USA.
 
 from django.conf import settings
+from ganeti_web.backend.permissions import permission_sets
 from ganeti_web.models import Cluster
 
 
@@ -61,7 +62,11 @@ def common_permissions(request):
         if user.is_superuser:
             return CLUSTER_ADMIN_PERMISSIONS
 
-        perms = user.get_perms_any(Cluster)
+        sets = permission_sets(user)
+        if sets is not None:
+            perms = sets.perms(Cluster)
+        else:
+            perms = user.get_perms_any(Cluster)
 
         if 'admin' in perms:
             return CLUSTER_ADMIN_PERMISSIONS
@@ -248,3 +248,15 @@ class SumIf(models.Aggregate):
     def add_to_query(self, query, alias, col, source, is_summary):
         aggregate = SQLSumIf(col, source=source, is_summary=is_summary, **self.extra)
         query.aggregates[alias] = aggregate
+
+
+class SQLCountIf(SQLSumIf):
+    sql_function = 'COUNT'
+
+
+class CountIf(models.Aggregate):
+    name = 'COUNT'
+
+    def add_to_query(self, query, alias, col, source, is_summary):
+        aggregate = SQLCountIf(col, source=source, is_summary=is_summary, **self.extra)
+        query.aggregates[alias] = aggregate
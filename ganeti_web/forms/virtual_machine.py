@@ -33,7 +33,6 @@ log_action = LogItem.objects.log_action
 from ganeti_web.backend.queries import (cluster_qs_for_user,
                                         owner_qs_for_cluster)
 from ganeti_web.backend.templates import template_to_instance
-from ganeti_web.caps import has_cdrom2, requires_maxmem
 from ganeti_web.constants import (EMPTY_CHOICE_FIELD, HV_DISK_TEMPLATES,
                                   HV_NIC_MODES, KVM_CHOICES, HV_USB_MICE,
                                   HV_SECURITY_MODELS, KVM_FLAGS,
@@ -648,42 +647,44 @@ class VMWizardBasicsForm(Form):
 
         self.cluster = cluster
 
+        # Everything below comes from the cluster's snapshot, so stepping
+        # through the wizard never waits on Ganeti.
+        snapshot = cluster.get_snapshot()
+
         # Get a look at the list of available hypervisors, and set the initial
         # hypervisor appropriately.
-        hvs = cluster.info["enabled_hypervisors"]
+        hvs = snapshot["enabled_hypervisors"]
         prettified = [hv_prettify(hv) for hv in hvs]
-        hv = cluster.info["default_hypervisor"]
+        hv = snapshot["default_hypervisor"]
         self.fields["hv"].choices = zip(hvs, prettified)
         self.fields["hv"].initial = hv
 
         # Get the OS list.
-        self.fields["os"].choices = cluster_os_list(cluster)
+        self.fields["os"].choices = snapshot["os_list"]
 
         # Set the default CPU count based on the backend parameters.
-        beparams = cluster.info["beparams"]["default"]
+        beparams = snapshot["beparams"]
         self.fields["vcpus"].initial = beparams["vcpus"]
 
         # If this cluster operates on the "maxmem" parameter instead of
         # "memory", use that for now.
-        if requires_maxmem(cluster):
+        if snapshot["requires_maxmem"]:
             self.fields["memory"].initial = beparams["maxmem"]
         else:
             self.fields["memory"].initial = beparams["memory"]
 
         # If there are ipolicy limits in place, add validators for them.
-        if "ipolicy" in cluster.info:
-            if "max" in cluster.info["ipolicy"]:
-                v = cluster.info["ipolicy"]["max"]["disk-size"]
-                self.fields["disk_size"].validators.append(
-                    MaxValueValidator(v))
-                v = cluster.info["ipolicy"]["max"]["memory-size"]
-                self.fields["memory"].validators.append(MaxValueValidator(v))
-            if "min" in cluster.info["ipolicy"]:
-                v = cluster.info["ipolicy"]["min"]["disk-size"]
-                self.fields["disk_size"].validators.append(
-                    MinValueValidator(v))
-                v = cluster.info["ipolicy"]["min"]["memory-size"]
-                self.fields["memory"].validators.append(MinValueValidator(v))
+        ipolicy = snapshot["ipolicy"]
+        if "max" in ipolicy:
+            v = ipolicy["max"]["disk-size"]
+            self.fields["disk_size"].validators.append(MaxValueValidator(v))
+            v = ipolicy["max"]["memory-size"]
+            self.fields["memory"].validators.append(MaxValueValidator(v))
+        if "min" in ipolicy:
+            v = ipolicy["min"]["disk-size"]
+            self.fields["disk_size"].validators.append(MinValueValidator(v))
+            v = ipolicy["min"]["memory-size"]
+            self.fields["memory"].validators.append(MinValueValidator(v))
 
     def _configure_for_template(self, template):
         if not template:
@@ -749,7 +750,7 @@ class VMWizardPVMForm(Form):
             return
 
         self.cluster = cluster
-        params = cluster.info["hvparams"]["xen-pvm"]
+        params = cluster.get_snapshot()["hvparams"]["xen-pvm"]
 
         self.fields["kernel_path"].initial = params["kernel_path"]
         self.fields["root_path"].initial = params["root_path"]
@@ -777,7 +778,7 @@ class VMWizardHVMForm(Form):
             return
 
         self.cluster = cluster
-        params = cluster.info["hvparams"]["xen-pvm"]
+        params = cluster.get_snapshot()["hvparams"]["xen-pvm"]
 
         self.fields["boot_order"].initial = params["boot_order"]
         self.fields["disk_type"].initial = params["disk_type"]
@@ -815,7 +816,8 @@ class VMWizardKVMForm(Form):
             return
 
         self.cluster = cluster
-        params = cluster.info["hvparams"]["kvm"]
+        snapshot = cluster.get_snapshot()
+        params = snapshot["hvparams"]["kvm"]
 
         self.fields["boot_order"].initial = params["boot_order"]
         self.fields["disk_type"].initial = params["disk_type"]
@@ -825,7 +827,7 @@ class VMWizardKVMForm(Form):
         self.fields["serial_console"].initial = params["serial_console"]
 
         # Remove cdrom2 if the cluster doesn't have it; see #11655.
-        if not has_cdrom2(cluster):
+        if not snapshot["has_cdrom2"]:
             del self.fields["cdrom2_image_path"]
 
     def _configure_for_template(self, template):
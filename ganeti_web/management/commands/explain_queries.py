@@ -0,0 +1,270 @@
+# Copyright (C) 2012 Oregon State University
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+from datetime import datetime, timedelta
+from optparse import make_option
+import time
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from ganeti_web.models import (Cluster, ClusterUser, GanetiError, Job, Node,
+                               VirtualMachine)
+
+
+# The composite indexes added by migrations 0019 and 0021, as (table,
+# columns).
+COMPOSITE_INDEXES = (
+    ("ganeti_web_virtualmachine", ["cluster_id", "status"]),
+    ("ganeti_web_virtualmachine", ["owner_id", "cluster_id"]),
+    ("ganeti_web_virtualmachine", ["primary_node_id", "status"]),
+    ("ganeti_web_virtualmachine", ["secondary_node_id", "status"]),
+    ("ganeti_web_job", ["content_type_id", "object_id"]),
+    ("ganeti_web_job", ["cluster_id", "status"]),
+    ("ganeti_web_ganetierror", ["obj_type_id", "obj_id", "cleared"]),
+    ("ganeti_web_ganetierror", ["cluster_id", "cleared"]),
+    ("ganeti_web_ganetierror", ["cleared", "timestamp", "id"]),
+    ("ganeti_web_ganetierror", ["cluster_id", "timestamp", "id"]),
+    ("ganeti_web_job", ["status", "finished", "id"]),
+)
+
+CLUSTERS = 10
+NODES_PER_CLUSTER = 20
+OWNERS = 1000
+
+# One of every so many virtual machines has a job, or an error.
+VMS_PER_JOB = 5
+VMS_PER_ERROR = 10
+
+# Statuses of the synthetic virtual machines and jobs, cycled through.
+VM_STATUSES = ("running",) * 8 + ("ADMIN_down", "ERROR_down")
+JOB_STATUSES = ("success",) * 7 + ("error", "running", "waiting")
+
+
+def populate(count):
+    """
+    Fill the database with clusters, nodes and owners for ``count`` virtual
+    machines, and with the virtual machines and some jobs and errors.
+
+    No signals are sent and Ganeti is never contacted.
+    """
+
+    Cluster.objects.bulk_create([
+        Cluster(hostname="cluster%d.example.test" % i, slug="cluster%d" % i,
+                hash="%040d" % i)
+        for i in xrange(CLUSTERS)])
+    clusters = list(Cluster.objects.order_by("pk").values_list("pk", "hash"))
+
+    Node.objects.bulk_create([
+        Node(cluster_id=cluster_id, cluster_hash=hash,
+             hostname="node%d.cluster%d.example.test" % (n, i), role="R")
+        for i, (cluster_id, hash) in enumerate(clusters)
+        for n in xrange(NODES_PER_CLUSTER)])
+    nodes = {}
+    for pk, cluster_id in Node.objects.order_by("pk") \
+            .values_list("pk", "cluster"):
+        nodes.setdefault(cluster_id, []).append(pk)
+
+    ClusterUser.objects.bulk_create([ClusterUser(name="owner%d" % i)
+                                     for i in xrange(OWNERS)])
+    owners = list(ClusterUser.objects.order_by("pk")
+                  .values_list("pk", flat=True))
+
+    vms = []
+    for i in xrange(count):
+        cluster_id, hash = clusters[i % len(clusters)]
+        node_ids = nodes[cluster_id]
+        vms.append(VirtualMachine(
+            cluster_id=cluster_id, cluster_hash=hash,
+            hostname="vm%d.example.test" % i, owner_id=owners[i % len(owners)],
+            status=VM_STATUSES[i % len(VM_STATUSES)],
+            primary_node_id=node_ids[i % len(node_ids)],
+            secondary_node_id=node_ids[(i + 1) % len(node_ids)],
+            ram=512, disk_size=5120, virtual_cpus=1))
+    VirtualMachine.objects.bulk_create(vms)
+
+    ct = ContentType.objects.get_for_model(VirtualMachine)
+    now = datetime.now()
+    jobs = []
+    errors = []
+    rows = VirtualMachine.objects.order_by("pk") \
+        .values_list("pk", "cluster", "cluster_hash")
+    for i, (pk, cluster_id, hash) in enumerate(rows):
+        # one job or error a second, going back in time
+        when = now - timedelta(seconds=i)
+        if not i % VMS_PER_JOB:
+            jobs.append(Job(job_id=i, content_type=ct, object_id=pk,
+                            cluster_id=cluster_id, cluster_hash=hash,
+                            status=JOB_STATUSES[i % len(JOB_STATUSES)],
+                            op="OP_INSTANCE_STARTUP", finished=when))
+        if not i % VMS_PER_ERROR:
+            errors.append(GanetiError(cluster_id=cluster_id, msg="error",
+                                      code=500, timestamp=when, obj_type=ct,
+                                      obj_id=pk, cleared=bool(i % 2)))
+    Job.objects.bulk_create(jobs)
+    GanetiError.objects.bulk_create(errors)
+
+
+def hot_queries():
+    """
+    The queries that pages run most, as (description, queryset) tuples.
+    """
+
+    cluster = Cluster.objects.order_by("pk").only("pk")[0]
+    node = Node.objects.order_by("pk").only("pk")[0]
+    owner = ClusterUser.objects.order_by("pk")[0]
+    vm = VirtualMachine.objects.order_by("pk").only("pk")[0]
+    ct = ContentType.objects.get_for_model(VirtualMachine)
+
+    vms = VirtualMachine.objects.order_by()
+    errors = GanetiError.objects.filter(cleared=False)
+    # A page of the errors feed reads at most this many rows of each source.
+    page = settings.ITEMS_PER_PAGE + 1
+    return (
+        ("overview: running VMs of a cluster",
+         vms.filter(cluster=cluster, status="running")),
+        ("overview: VMs of an owner on a cluster",
+         vms.filter(owner=owner, cluster=cluster)),
+        ("node: running primary VMs",
+         vms.filter(primary_node=node, status="running")),
+        ("node: running secondary VMs",
+         vms.filter(secondary_node=node, status="running")),
+        ("errors: errors of a VM", errors.get_errors(obj=vm)),
+        ("errors: errors of a cluster", errors.get_errors(obj=cluster)),
+        ("jobs: jobs of a VM",
+         Job.objects.filter(status__in=("error", "running", "waiting"),
+                            content_type=ct, object_id=vm.pk)),
+        ("jobs: failed jobs of a cluster",
+         Job.objects.filter(cluster=cluster, status="error")),
+        ("feed: newest errors not cleared",
+         errors.order_by("-timestamp", "-pk")[:page]),
+        ("feed: newest errors of a cluster",
+         GanetiError.objects.filter(cluster=cluster)
+         .order_by("-timestamp", "-pk")[:page]),
+        ("feed: newest failed jobs",
+         Job.objects.filter(status="error").exclude(finished=None)
+         .order_by("-finished", "-pk")[:page]),
+    )
+
+
+def explain(queryset):
+    """
+    The query plan of a queryset, as lines of text.
+    """
+
+    sql, params = queryset.values_list("pk").query.sql_with_params()
+    if connection.vendor == "sqlite":
+        sql = "EXPLAIN QUERY PLAN " + sql
+    else:
+        sql = "EXPLAIN " + sql
+
+    cursor = connection.cursor()
+    cursor.execute(sql, params)
+    return [" ".join(unicode(column) for column in row)
+            for row in cursor.fetchall()]
+
+
+def best_time(queryset, repeat):
+    """
+    The fastest of ``repeat`` runs of a queryset, in milliseconds.
+    """
+
+    times = []
+    for i in xrange(repeat):
+        start = time.time()
+        list(queryset.values_list("pk"))
+        times.append(time.time() - start)
+    return min(times) * 1000
+
+
+def analyze():
+    """
+    Update the statistics that the query planner chooses indexes by.
+    """
+
+    if connection.vendor in ("sqlite", "postgresql"):
+        connection.cursor().execute("ANALYZE")
+        transaction.commit_unless_managed()
+
+
+class Command(BaseCommand):
+    """
+    Show the query plans and timings of the queries that pages run most,
+    without and with the composite indexes of migrations 0019 and 0021.
+
+    A synthetic dataset is loaded into a test database, which is destroyed
+    afterwards, so the configured database is never touched.
+    """
+
+    help = ("Compare query plans of frequent queries without and with "
+            "composite indexes, on a synthetic dataset in a test database.")
+
+    option_list = BaseCommand.option_list + (
+        make_option("--vms", type="int", dest="vms", default=50000,
+                    metavar="COUNT",
+                    help="How many virtual machines to create. Defaults to "
+                         "50000."),
+        make_option("--repeat", type="int", dest="repeat", default=5,
+                    help="How often to run each query when timing it. The "
+                         "fastest run is shown. Defaults to 5."),
+        make_option("--noinput", action="store_false", dest="interactive",
+                    default=True,
+                    help="Don't ask before deleting a leftover test "
+                         "database."),
+    )
+
+    def handle(self, *args, **options):
+        verbosity = int(options["verbosity"])
+
+        # Objects must never be refreshed from the synthetic clusters.
+        settings.CACHE_REFRESH_ON_LOAD = False
+
+        # Create the tables from the models, without the composite indexes
+        # that only the migration adds.
+        from south.management.commands import patch_for_test_db_setup
+        settings.SOUTH_TESTS_MIGRATE = False
+        patch_for_test_db_setup()
+        from south.db import db
+
+        old_name = connection.creation.create_test_db(
+            verbosity=verbosity, autoclobber=not options["interactive"])
+        try:
+            if verbosity > 0:
+                self.stdout.write("Creating %d virtual machines\n"
+                                  % options["vms"])
+            with transaction.commit_on_success():
+                populate(options["vms"])
+            analyze()
+            self.report("Without composite indexes", options["repeat"])
+
+            with transaction.commit_on_success():
+                for table, columns in COMPOSITE_INDEXES:
+                    db.create_index(table, columns)
+            analyze()
+            self.report("With composite indexes", options["repeat"])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity)
+
+    def report(self, title, repeat):
+        self.stdout.write("\n%s\n%s\n" % (title, "=" * len(title)))
+        for description, queryset in hot_queries():
+            self.stdout.write("\n%s (%.2f ms)\n"
+                              % (description, best_time(queryset, repeat)))
+            for line in explain(queryset):
+                self.stdout.write("    %s\n" % line)
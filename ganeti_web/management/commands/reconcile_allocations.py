@@ -0,0 +1,72 @@
+# Copyright (C) 2012 Oregon State University
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ganeti_web.models import Cluster, ClusterCapacity, Node
+
+
+class Command(BaseCommand):
+    """
+    Recount the resources allocated on each Node from its VirtualMachines,
+    and the capacity snapshot of each Cluster.
+
+    The totals are kept current as nodes and virtual machines are saved and
+    deleted.
+    This corrects them after virtual machines were changed some other way,
+    such as by editing the database directly.
+    """
+
+    help = ("Recount the ram, disk and cpus allocated on nodes, and the "
+            "capacity of clusters.")
+
+    option_list = BaseCommand.option_list + (
+        make_option("--cluster", action="append", dest="clusters",
+                    default=[], metavar="SLUG",
+                    help="Only recount nodes of this cluster. May be given "
+                         "more than once. Defaults to all clusters."),
+    )
+
+    def handle(self, *args, **options):
+        slugs = options["clusters"]
+        verbosity = int(options["verbosity"])
+
+        clusters = nodes = None
+        if slugs:
+            clusters = Cluster.objects.filter(slug__in=slugs)
+            if not clusters.exists():
+                raise CommandError("No clusters match: %s" % ", ".join(slugs))
+            nodes = Node.objects.filter(cluster__in=clusters)
+
+        changed = Node.objects.update_allocations(nodes)
+        changed_clusters = ClusterCapacity.objects.recount(clusters)
+
+        if verbosity > 1:
+            hostnames = Node.objects.filter(pk__in=changed) \
+                .values_list("hostname", flat=True)
+            for hostname in hostnames:
+                self.stdout.write("Corrected %s\n" % hostname)
+            hostnames = Cluster.objects.filter(pk__in=changed_clusters) \
+                .values_list("hostname", flat=True)
+            for hostname in hostnames:
+                self.stdout.write("Corrected capacity of %s\n" % hostname)
+        if verbosity > 0:
+            self.stdout.write("Corrected %d node(s)\n" % len(changed))
+            self.stdout.write("Corrected capacity of %d cluster(s)\n"
+                              % len(changed_clusters))
@@ -0,0 +1,111 @@
+# Copyright (C) 2012 Oregon State University
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+from optparse import make_option
+import time
+import traceback
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import reset_queries
+
+from ganeti_web.backend.owner_tags import sync_owner_tags
+from ganeti_web.models import Cluster, Job
+
+
+def refresh_cluster(cluster):
+    """
+    Refresh the cached info of a cluster and everything that belongs to it.
+
+    Pending jobs are refreshed first so that objects see their final status.
+    Owner tags are updated last, against the tags just fetched.
+    """
+
+    Job.objects.refresh_pending(cluster)
+
+    cluster.refresh_all()
+
+    sync_owner_tags(cluster)
+
+
+class Command(BaseCommand):
+    """
+    Keep the cache of Ganeti data warm for all Clusters, Nodes and
+    VirtualMachines.
+
+    Run once from cron, or pass --interval to run as a long-lived worker.
+    """
+
+    help = ("Refresh cached Ganeti data for clusters, nodes and virtual "
+            "machines.")
+
+    option_list = BaseCommand.option_list + (
+        make_option("--cluster", action="append", dest="clusters",
+                    default=[], metavar="SLUG",
+                    help="Only refresh this cluster. May be given more than "
+                         "once. Defaults to all clusters."),
+        make_option("--interval", type="int", dest="interval", default=0,
+                    metavar="SECONDS",
+                    help="Keep running, starting a new pass every SECONDS "
+                         "seconds. By default a single pass is made."),
+    )
+
+    def handle(self, *args, **options):
+        interval = options["interval"]
+        slugs = options["clusters"]
+        verbosity = int(options["verbosity"])
+
+        if interval < 0:
+            raise CommandError("--interval must not be negative")
+
+        # This process owns the cache. Loading objects here must never
+        # trigger a second, lazy refresh of the same object.
+        settings.CACHE_REFRESH_ON_LOAD = False
+
+        while True:
+            started = time.time()
+
+            clusters = Cluster.objects.all()
+            if slugs:
+                clusters = clusters.filter(slug__in=slugs)
+                if not clusters.exists():
+                    raise CommandError("No clusters match: %s"
+                                       % ", ".join(slugs))
+
+            for cluster in clusters:
+                if verbosity > 1:
+                    self.stdout.write("Refreshing %s\n" % cluster.hostname)
+                try:
+                    refresh_cluster(cluster)
+                except Exception:
+                    # A single broken cluster must not stop the worker.
+                    if not interval:
+                        raise
+                    self.stderr.write("Error refreshing %s:\n%s"
+                                      % (cluster.hostname,
+                                         traceback.format_exc()))
+
+            if verbosity > 0:
+                self.stdout.write("Refreshed %d cluster(s) in %.2fs\n"
+                                  % (len(clusters), time.time() - started))
+
+            if not interval:
+                break
+
+            # Avoid unbounded growth of connection.queries when DEBUG is on.
+            reset_queries()
+            time.sleep(max(interval - (time.time() - started), 0))
@@ -0,0 +1,64 @@
+# Copyright (C) 2012 Oregon State University
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ganeti_web.backend.owner_tags import sync_owner_tags
+from ganeti_web.models import Cluster
+
+
+class Command(BaseCommand):
+    """
+    Tag virtual machines in Ganeti with their owners.
+
+    Saving a virtual machine only records that its owner tag must change.
+    refresh_cache does this after every refresh; this command does it
+    without refreshing anything.
+    """
+
+    help = "Update the owner tags of virtual machines in Ganeti."
+
+    option_list = BaseCommand.option_list + (
+        make_option("--cluster", action="append", dest="clusters",
+                    default=[], metavar="SLUG",
+                    help="Only tag virtual machines of this cluster. May be "
+                         "given more than once. Defaults to all clusters."),
+    )
+
+    def handle(self, *args, **options):
+        slugs = options["clusters"]
+        verbosity = int(options["verbosity"])
+
+        clusters = Cluster.objects.filter(
+            virtual_machines__owner_tag_pending=True).distinct()
+        if slugs:
+            if not Cluster.objects.filter(slug__in=slugs).exists():
+                raise CommandError("No clusters match: %s" % ", ".join(slugs))
+            clusters = clusters.filter(slug__in=slugs)
+
+        failed = []
+        for cluster in clusters.defer("serialized_info"):
+            failed.extend(sync_owner_tags(cluster))
+
+        if verbosity > 1:
+            for hostname in failed:
+                self.stdout.write("Could not tag %s\n" % hostname)
+        if verbosity > 0:
+            self.stdout.write("Could not tag %d virtual machine(s)\n"
+                              % len(failed))
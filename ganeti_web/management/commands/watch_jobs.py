@@ -0,0 +1,89 @@
+# Copyright (C) 2012 Oregon State University
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+from optparse import make_option
+import time
+import traceback
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import reset_queries
+
+from ganeti_web.backend.jobs import JobWatcher
+from ganeti_web.models import Cluster
+
+
+class Command(BaseCommand):
+    """
+    Track running Ganeti jobs and record their outcome as soon as they
+    finish.
+    """
+
+    help = "Watch running jobs and update them as they finish."
+
+    option_list = BaseCommand.option_list + (
+        make_option("--cluster", action="append", dest="clusters",
+                    default=[], metavar="SLUG",
+                    help="Only watch jobs on this cluster. May be given more "
+                         "than once. Defaults to all clusters."),
+        make_option("--idle", type="float", dest="idle", default=1,
+                    metavar="SECONDS",
+                    help="How long to sleep when no jobs are running. "
+                         "Defaults to 1 second."),
+        make_option("--once", action="store_true", dest="once",
+                    default=False,
+                    help="Wait for jobs once and exit."),
+    )
+
+    def handle(self, *args, **options):
+        slugs = options["clusters"]
+        verbosity = int(options["verbosity"])
+
+        # Jobs and objects are only ever refreshed explicitly here.
+        settings.CACHE_REFRESH_ON_LOAD = False
+
+        clusters = None
+        if slugs:
+            clusters = Cluster.objects.filter(slug__in=slugs)
+            if not clusters.exists():
+                raise CommandError("No clusters match: %s" % ", ".join(slugs))
+
+        watcher = JobWatcher(clusters)
+
+        while True:
+            try:
+                finished = watcher.poll()
+            except Exception:
+                # A single broken cluster must not stop the watcher.
+                if options["once"]:
+                    raise
+                self.stderr.write("Error watching jobs:\n%s"
+                                  % traceback.format_exc())
+                time.sleep(options["idle"])
+                continue
+
+            if verbosity > 1:
+                for pk in finished:
+                    self.stdout.write("Job %d finished\n" % pk)
+
+            if options["once"]:
+                break
+
+            # Avoid unbounded growth of connection.queries when DEBUG is on.
+            reset_queries()
+            if not watcher.seen:
+                time.sleep(options["idle"])
@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+import datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+from django.db.models import Count, Sum
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding model 'ClusterCapacity'
+        db.create_table('ganeti_web_clustercapacity', (
+            ('cluster', self.gf('django.db.models.fields.related.OneToOneField')(related_name='capacity', unique=True, primary_key=True, to=orm['ganeti_web.Cluster'])),
+            ('ram_total', self.gf('django.db.models.fields.IntegerField')(default=0)),
+            ('ram_free', self.gf('django.db.models.fields.IntegerField')(default=0)),
+            ('ram_allocated', self.gf('django.db.models.fields.IntegerField')(default=0)),
+            ('disk_total', self.gf('django.db.models.fields.IntegerField')(default=0)),
+            ('disk_free', self.gf('django.db.models.fields.IntegerField')(default=0)),
+            ('disk_allocated', self.gf('django.db.models.fields.IntegerField')(default=0)),
+            ('nodes_online', self.gf('django.db.models.fields.IntegerField')(default=0)),
+            ('nodes_offline', self.gf('django.db.models.fields.IntegerField')(default=0)),
+            ('vms_running', self.gf('django.db.models.fields.IntegerField')(default=0)),
+            ('vms_total', self.gf('django.db.models.fields.IntegerField')(default=0)),
+        ))
+        db.send_create_signal('ganeti_web', ['ClusterCapacity'])
+
+        if not db.dry_run:
+            self.count_capacity(orm)
+
+    def count_capacity(self, orm):
+        # The same counts as ClusterCapacityManager.recount().
+        counts = {}
+        for pk in orm.Cluster.objects.values_list('pk', flat=True):
+            counts[pk] = {}
+
+        nodes = orm.Node.objects.order_by()
+        for pk, offline, count in nodes.values_list('cluster', 'offline').annotate(Count('pk')):
+            column = 'nodes_offline' if offline else 'nodes_online'
+            counts[pk][column] = counts[pk].get(column, 0) + count
+        for values in nodes.exclude(ram_total=-1).values('cluster').annotate(total=Sum('ram_total'), free=Sum('ram_free')):
+            counts[values['cluster']]['ram_total'] = max(values['total'] or 0, 0)
+            counts[values['cluster']]['ram_free'] = max(values['free'] or 0, 0)
+        for values in nodes.exclude(disk_total=-1).values('cluster').annotate(total=Sum('disk_total'), free=Sum('disk_free')):
+            counts[values['cluster']]['disk_total'] = max(values['total'] or 0, 0)
+            counts[values['cluster']]['disk_free'] = max(values['free'] or 0, 0)
+
+        vms = orm.VirtualMachine.objects.order_by()
+        for pk, status, count in vms.values_list('cluster', 'status').annotate(Count('pk')):
+            counts[pk]['vms_total'] = counts[pk].get('vms_total', 0) + count
+            if status == 'running':
+                counts[pk]['vms_running'] = counts[pk].get('vms_running', 0) + count
+        for pk, allocated in vms.filter(status='running').exclude(ram=-1).values_list('cluster').annotate(Sum('ram')):
+            counts[pk]['ram_allocated'] = allocated or 0
+        for pk, allocated in vms.exclude(disk_size=-1).values_list('cluster').annotate(Sum('disk_size')):
+            counts[pk]['disk_allocated'] = allocated or 0
+
+        for pk, values in counts.items():
+            orm.ClusterCapacity.objects.create(cluster_id=pk, **values)
+
+
+    def backwards(self, orm):
+        # Deleting model 'ClusterCapacity'
+        db.delete_table('ganeti_web_clustercapacity')
+
+
+    models = {
+        'auth.group': {
+            'Meta': {'object_name': 'Group'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '80'}),
+            'permissions': ('django.db.models.fields.related.ManyToManyField', [], {'to': "orm['auth.Permission']", 'symmetrical': 'False', 'blank': 'True'})
+        },
+        'auth.permission': {
+            'Meta': {'ordering': "('content_type__app_label', 'content_type__model', 'codename')", 'unique_together': "(('content_type', 'codename'),)", 'object_name': 'Permission'},
+            'codename': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'content_type': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['contenttypes.ContentType']"}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '50'})
+        },
+        'auth.user': {
+            'Meta': {'object_name': 'User'},
+            'date_joined': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'email': ('django.db.models.fields.EmailField', [], {'max_length': '75', 'blank': 'True'}),
+            'first_name': ('django.db.models.fields.CharField', [], {'max_length': '30', 'blank': 'True'}),
+            'groups': ('django.db.models.fields.related.ManyToManyField', [], {'to': "orm['auth.Group']", 'symmetrical': 'False', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'is_active': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'is_staff': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'is_superuser': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'last_login': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'last_name': ('django.db.models.fields.CharField', [], {'max_length': '30', 'blank': 'True'}),
+            'password': ('django.db.models.fields.CharField', [], {'max_length': '128'}),
+            'user_permissions': ('django.db.models.fields.related.ManyToManyField', [], {'to': "orm['auth.Permission']", 'symmetrical': 'False', 'blank': 'True'}),
+            'username': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '30'})
+        },
+        'contenttypes.contenttype': {
+            'Meta': {'ordering': "('name',)", 'unique_together': "(('app_label', 'model'),)", 'object_name': 'ContentType', 'db_table': "'django_content_type'"},
+            'app_label': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'model': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '100'})
+        },
+        'ganeti_web.cluster': {
+            'Meta': {'ordering': "['hostname', 'description']", 'object_name': 'Cluster'},
+            'cached': ('ganeti_web.fields.PreciseDateTimeField', [], {'null': 'True', 'max_digits': '18', 'decimal_places': '6'}),
+            'description': ('django.db.models.fields.CharField', [], {'max_length': '128', 'blank': 'True'}),
+            'disk': ('django.db.models.fields.IntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'hash': ('django.db.models.fields.CharField', [], {'max_length': '40'}),
+            'hostname': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '128'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'ignore_cache': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'last_job': ('django.db.models.fields.related.ForeignKey', [], {'blank': 'True', 'related_name': "'cluster_last_job'", 'null': 'True', 'to': "orm['ganeti_web.Job']"}),
+            'mtime': ('ganeti_web.fields.PreciseDateTimeField', [], {'null': 'True', 'max_digits': '18', 'decimal_places': '6'}),
+            'password': ('ganeti_web.fields.PatchedEncryptedCharField', [], {'default': "''", 'max_length': '293', 'cipher': "'AES'", 'blank': 'True'}),
+            'port': ('django.db.models.fields.PositiveIntegerField', [], {'default': '5080'}),
+            'ram': ('django.db.models.fields.IntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'serialized_info': ('django.db.models.fields.TextField', [], {'default': "''"}),
+            'slug': ('django.db.models.fields.SlugField', [], {'unique': 'True', 'max_length': '50'}),
+            'username': ('django.db.models.fields.CharField', [], {'max_length': '128', 'blank': 'True'}),
+            'virtual_cpus': ('django.db.models.fields.IntegerField', [], {'null': 'True', 'blank': 'True'})
+        },
+        'ganeti_web.cluster_perms': {
+            'Meta': {'object_name': 'Cluster_Perms'},
+            'admin': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'create_vm': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'export': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'group': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'Cluster_gperms'", 'null': 'True', 'to': "orm['auth.Group']"}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'migrate': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'obj': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'operms'", 'to': "orm['ganeti_web.Cluster']"}),
+            'replace_disks': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'tags': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'user': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'Cluster_uperms'", 'null': 'True', 'to': "orm['auth.User']"})
+        },
+        'ganeti_web.clustercapacity': {
+            'Meta': {'object_name': 'ClusterCapacity'},
+            'cluster': ('django.db.models.fields.related.OneToOneField', [], {'related_name': "'capacity'", 'unique': 'True', 'primary_key': 'True', 'to': "orm['ganeti_web.Cluster']"}),
+            'disk_allocated': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'disk_free': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'disk_total': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'nodes_offline': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'nodes_online': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'ram_allocated': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'ram_free': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'ram_total': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'vms_running': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'vms_total': ('django.db.models.fields.IntegerField', [], {'default': '0'})
+        },
+        'ganeti_web.clusteruser': {
+            'Meta': {'object_name': 'ClusterUser'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '128'}),
+            'real_type': ('django.db.models.fields.related.ForeignKey', [], {'blank': 'True', 'related_name': "'+'", 'null': 'True', 'to': "orm['contenttypes.ContentType']"})
+        },
+        'ganeti_web.ganetierror': {
+            'Meta': {'ordering': "('-timestamp', 'code', 'msg')", 'object_name': 'GanetiError'},
+            'cleared': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'cluster': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'errors'", 'to': "orm['ganeti_web.Cluster']"}),
+            'code': ('django.db.models.fields.PositiveIntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'msg': ('django.db.models.fields.TextField', [], {}),
+            'obj_id': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'obj_type': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'ganeti_errors'", 'to': "orm['contenttypes.ContentType']"}),
+            'timestamp': ('django.db.models.fields.DateTimeField', [], {})
+        },
+        'ganeti_web.job': {
+            'Meta': {'object_name': 'Job'},
+            'cached': ('ganeti_web.fields.PreciseDateTimeField', [], {'null': 'True', 'max_digits': '18', 'decimal_places': '6'}),
+            'cluster': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'jobs'", 'to': "orm['ganeti_web.Cluster']"}),
+            'cluster_hash': ('django.db.models.fields.CharField', [], {'max_length': '40'}),
+            'content_type': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'+'", 'to': "orm['contenttypes.ContentType']"}),
+            'finished': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'ignore_cache': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'job_id': ('django.db.models.fields.IntegerField', [], {}),
+            'mtime': ('ganeti_web.fields.PreciseDateTimeField', [], {'null': 'True', 'max_digits': '18', 'decimal_places': '6'}),
+            'object_id': ('django.db.models.fields.IntegerField', [], {}),
+            'op': ('django.db.models.fields.CharField', [], {'max_length': '50'}),
+            'serialized_info': ('django.db.models.fields.TextField', [], {'default': "''"}),
+            'status': ('django.db.models.fields.CharField', [], {'max_length': '10'})
+        },
+        'ganeti_web.node': {
+            'Meta': {'object_name': 'Node'},
+            'cached': ('ganeti_web.fields.PreciseDateTimeField', [], {'null': 'True', 'max_digits': '18', 'decimal_places': '6'}),
+            'cluster': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'nodes'", 'to': "orm['ganeti_web.Cluster']"}),
+            'cluster_hash': ('django.db.models.fields.CharField', [], {'max_length': '40'}),
+            'cpus': ('django.db.models.fields.IntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'cpus_allocated': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'disk_allocated': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'disk_free': ('django.db.models.fields.IntegerField', [], {'default': '-1'}),
+            'disk_total': ('django.db.models.fields.IntegerField', [], {'default': '-1'}),
+            'hostname': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '128'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'ignore_cache': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'last_job': ('django.db.models.fields.related.ForeignKey', [], {'blank': 'True', 'related_name': "'+'", 'null': 'True', 'to': "orm['ganeti_web.Job']"}),
+            'mtime': ('ganeti_web.fields.PreciseDateTimeField', [], {'null': 'True', 'max_digits': '18', 'decimal_places': '6'}),
+            'offline': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'ram_allocated': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'ram_free': ('django.db.models.fields.IntegerField', [], {'default': '-1'}),
+            'ram_total': ('django.db.models.fields.IntegerField', [], {'default': '-1'}),
+            'role': ('django.db.models.fields.CharField', [], {'max_length': '1'}),
+            'serialized_info': ('django.db.models.fields.TextField', [], {'default': "''"})
+        },
+        'ganeti_web.organization': {
+            'Meta': {'object_name': 'Organization', '_ormbases': ['ganeti_web.ClusterUser']},
+            'clusteruser_ptr': ('django.db.models.fields.related.OneToOneField', [], {'to': "orm['ganeti_web.ClusterUser']", 'unique': 'True', 'primary_key': 'True'}),
+            'group': ('django.db.models.fields.related.OneToOneField', [], {'related_name': "'organization'", 'unique': 'True', 'to': "orm['auth.Group']"})
+        },
+        'ganeti_web.profile': {
+            'Meta': {'object_name': 'Profile', '_ormbases': ['ganeti_web.ClusterUser']},
+            'clusteruser_ptr': ('django.db.models.fields.related.OneToOneField', [], {'to': "orm['ganeti_web.ClusterUser']", 'unique': 'True', 'primary_key': 'True'}),
+            'user': ('django.db.models.fields.related.OneToOneField', [], {'to': "orm['auth.User']", 'unique': 'True'})
+        },
+        'ganeti_web.quota': {
+            'Meta': {'object_name': 'Quota'},
+            'cluster': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'quotas'", 'to': "orm['ganeti_web.Cluster']"}),
+            'disk': ('django.db.models.fields.IntegerField', [], {'default': '0', 'null': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'ram': ('django.db.models.fields.IntegerField', [], {'default': '0', 'null': 'True', 'blank': 'True'}),
+            'user': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'quotas'", 'to': "orm['ganeti_web.ClusterUser']"}),
+            'virtual_cpus': ('django.db.models.fields.IntegerField', [], {'default': '0', 'null': 'True', 'blank': 'True'})
+        },
+        'ganeti_web.sshkey': {
+            'Meta': {'object_name': 'SSHKey'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'key': ('django.db.models.fields.TextField', [], {}),
+            'user': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'ssh_keys'", 'to': "orm['auth.User']"})
+        },
+        'ganeti_web.virtualmachine': {
+            'Meta': {'ordering': "['hostname']", 'unique_together': "(('cluster', 'hostname'),)", 'object_name': 'VirtualMachine'},
+            'cached': ('ganeti_web.fields.PreciseDateTimeField', [], {'null': 'True', 'max_digits': '18', 'decimal_places': '6'}),
+            'cluster': ('django.db.models.fields.related.ForeignKey', [], {'default': '0', 'related_name': "'virtual_machines'", 'to': "orm['ganeti_web.Cluster']"}),
+            'cluster_hash': ('django.db.models.fields.CharField', [], {'max_length': '40'}),
+            'disk_size': ('django.db.models.fields.IntegerField', [], {'default': '-1'}),
+            'hostname': ('django.db.models.fields.CharField', [], {'max_length': '128', 'db_index': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'ignore_cache': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'last_job': ('django.db.models.fields.related.ForeignKey', [], {'blank': 'True', 'related_name': "'+'", 'null': 'True', 'to': "orm['ganeti_web.Job']"}),
+            'mtime': ('ganeti_web.fields.PreciseDateTimeField', [], {'null': 'True', 'max_digits': '18', 'decimal_places': '6'}),
+            'operating_system': ('django.db.models.fields.CharField', [], {'max_length': '128'}),
+            'owner': ('django.db.models.fields.related.ForeignKey', [], {'blank': 'True', 'related_name': "'virtual_machines'", 'null': 'True', 'on_delete': 'models.SET_NULL', 'to': "orm['ganeti_web.ClusterUser']"}),
+            'pending_delete': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'primary_node': ('django.db.models.fields.related.ForeignKey', [], {'blank': 'True', 'related_name': "'primary_vms'", 'null': 'True', 'to': "orm['ganeti_web.Node']"}),
+            'ram': ('django.db.models.fields.IntegerField', [], {'default': '-1'}),
+            'secondary_node': ('django.db.models.fields.related.ForeignKey', [], {'blank': 'True', 'related_name': "'secondary_vms'", 'null': 'True', 'to': "orm['ganeti_web.Node']"}),
+            'serialized_info': ('django.db.models.fields.TextField', [], {'default': "''"}),
+            'status': ('django.db.models.fields.CharField', [], {'max_length': '14'}),
+            'template': ('django.db.models.fields.related.ForeignKey', [], {'blank': 'True', 'related_name': "'instances'", 'null': 'True', 'to': "orm['ganeti_web.VirtualMachineTemplate']"}),
+            'virtual_cpus': ('django.db.models.fields.IntegerField', [], {'default': '-1'})
+        },
+        'ganeti_web.virtualmachine_perms': {
+            'Meta': {'object_name': 'VirtualMachine_Perms'},
+            'admin': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'group': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'VirtualMachine_gperms'", 'null': 'True', 'to': "orm['auth.Group']"}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'modify': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'obj': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'operms'", 'to': "orm['ganeti_web.VirtualMachine']"}),
+            'power': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'remove': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'tags': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'user': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'VirtualMachine_uperms'", 'null': 'True', 'to': "orm['auth.User']"})
+        },
+        'ganeti_web.virtualmachinetemplate': {
+            'Meta': {'unique_together': "(('cluster', 'template_name'),)", 'object_name': 'VirtualMachineTemplate'},
+            'boot_order': ('django.db.models.fields.CharField', [], {'default': "''", 'max_length': '255'}),
+            'cdrom2_image_path': ('django.db.models.fields.CharField', [], {'max_length': '512', 'blank': 'True'}),
+            'cdrom_image_path': ('django.db.models.fields.CharField', [], {'max_length': '512', 'blank': 'True'}),
+            'cluster': ('django.db.models.fields.related.ForeignKey', [], {'blank': 'True', 'related_name': "'templates'", 'null': 'True', 'to': "orm['ganeti_web.Cluster']"}),
+            'description': ('django.db.models.fields.CharField', [], {'default': "''", 'max_length': '255'}),
+            'disk_template': ('django.db.models.fields.CharField', [], {'max_length': '16'}),
+            'disk_type': ('django.db.models.fields.CharField', [], {'default': "''", 'max_length': '255'}),
+            'disks': ('django_fields.fields.PickleField', [], {'null': 'True', 'blank': 'True'}),
+            'iallocator': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'iallocator_hostname': ('django.db.models.fields.CharField', [], {'max_length': '255', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'kernel_path': ('django.db.models.fields.CharField', [], {'default': "''", 'max_length': '255', 'blank': 'True'}),
+            'memory': ('django.db.models.fields.IntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'name_check': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'nic_type': ('django.db.models.fields.CharField', [], {'default': "''", 'max_length': '255'}),
+            'nics': ('django_fields.fields.PickleField', [], {'null': 'True', 'blank': 'True'}),
+            'no_install': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'os': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'pnode': ('django.db.models.fields.CharField', [], {'default': "''", 'max_length': '255'}),
+            'root_path': ('django.db.models.fields.CharField', [], {'default': "'/'", 'max_length': '255', 'blank': 'True'}),
+            'serial_console': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'snode': ('django.db.models.fields.CharField', [], {'default': "''", 'max_length': '255'}),
+            'start': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'template_name': ('django.db.models.fields.CharField', [], {'default': "''", 'max_length': '255'}),
+            'vcpus': ('django.db.models.fields.IntegerField', [], {'null': 'True', 'blank': 'True'})
+        }
+    }
+
+    complete_apps = ['ganeti_web']
\ No newline at end of file
@@ -21,11 +21,13 @@
 import binascii
 import cPickle
 from datetime import datetime, timedelta
+from functools import partial
 from hashlib import sha1
 import random
 import re
 import string
 import sys
+import time
 
 from django.conf import settings
 
@@ -34,12 +36,15 @@ from django.contrib.contenttypes.generic import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.sites import models as sites_app
 from django.contrib.sites.management import create_default_site
+from django.core.cache import cache
 from django.core.validators import RegexValidator, MinValueValidator
-from django.db import models
-from django.db.models import BooleanField, Q, Sum
+from django.db import models, router, transaction
+from django.db.models import BooleanField, Count, Q, Sum
 from django.db.models.query import QuerySet
-from django.db.models.signals import post_save, post_syncdb
+from django.db.models.signals import (m2m_changed, post_delete, post_init,
+                                      post_save, post_syncdb, pre_save)
 from django.db.utils import DatabaseError
+from django.utils import simplejson as json
 from django.utils.encoding import force_unicode
 from django.utils.translation import ugettext_lazy as _
 
@@ -50,15 +55,20 @@ from ganeti_web.logs import register_log_actions
 from object_log.models import LogItem
 log_action = LogItem.objects.log_action
 
-from object_permissions.registration import register
+from object_permissions import signals as op_signals
+from object_permissions.registration import permission_map, register
 
 from muddle_users import signals as muddle_user_signals
 
 from ganeti_web import constants, management, permissions
+from ganeti_web.caps import has_cdrom2, requires_maxmem
 from ganeti_web.fields import (PatchedEncryptedCharField,
                                PreciseDateTimeField, SumIf)
 from ganeti_web.util import client
 from ganeti_web.util.client import GanetiApiError, REPLACE_DISK_AUTO
+from ganeti_web.util import serializers
+from ganeti_web.util.fanout import fan_out
+from ganeti_web.utilities import cluster_os_list
 
 from south.signals import post_migrate
 
@@ -103,6 +113,9 @@ def generate_random_password(length=12):
 
 FINISHED_JOBS = 'success', 'unknown', 'error'
 
+# Codes with which Ganeti older than 2.6 rejects the query resource.
+QUERY_UNSUPPORTED_CODES = 400, 404, 405, 501
+
 RAPI_CACHE = {}
 RAPI_CACHE_HASHES = {}
 
@@ -148,11 +161,17 @@ def get_rapi(hash, cluster):
 
     # delete any old version of the client that was cached.
     if cluster in RAPI_CACHE_HASHES:
-        del RAPI_CACHE[RAPI_CACHE_HASHES[cluster]]
+        RAPI_CACHE.pop(RAPI_CACHE_HASHES[cluster]).Close()
+
+    # Each client keeps a pool of connections alive to its cluster. The size
+    # of the pool may be set per cluster hostname.
+    pool_size = getattr(settings, 'RAPI_POOL_SIZES', {}) \
+        .get(host, getattr(settings, 'RAPI_POOL_SIZE', 10))
 
     # Set connect timeout in settings.py so that you do not learn patience.
     rapi = client.GanetiRapiClient(host, port, user, password,
-                                   timeout=settings.RAPI_CONNECT_TIMEOUT)
+                                   timeout=settings.RAPI_CONNECT_TIMEOUT,
+                                   pool_size=pool_size)
     RAPI_CACHE[hash] = rapi
     RAPI_CACHE_HASHES[cluster] = hash
     return rapi
@@ -162,10 +181,238 @@ def clear_rapi_cache():
     """
     clears the rapi cache
     """
+    for rapi in RAPI_CACHE.values():
+        rapi.Close()
     RAPI_CACHE.clear()
     RAPI_CACHE_HASHES.clear()
 
 
+def rapi_connection_stats():
+    """
+    Returns connection reuse statistics for each cached RAPI client.
+
+    @return dict of cluster id to the stats of its client
+    """
+    return dict((cluster, RAPI_CACHE[hash].GetConnectionStats())
+                for cluster, hash in RAPI_CACHE_HASHES.items()
+                if hash in RAPI_CACHE)
+
+
+def cache_refresh_on_load():
+    """
+    Whether CachedClusterObjects may refresh themselves from Ganeti when they
+    are instantiated.
+
+    Deployments running the refresh_cache command should disable
+    CACHE_REFRESH_ON_LOAD so that loading models is a pure database cost.
+    """
+    return getattr(settings, 'CACHE_REFRESH_ON_LOAD', True)
+
+
+def cache_serializer():
+    """
+    The name of the format used to store the info of CachedClusterObjects.
+
+    Rows are always readable whatever format they were written in, so this
+    can be changed at any time.
+    """
+    return getattr(settings, 'CACHE_SERIALIZER', 'json')
+
+
+def refresh_lease_timeout():
+    """
+    Seconds that a process refreshing an object on load is given before
+    another process may refresh it too.
+    """
+    return getattr(settings, 'REFRESH_LEASE_TIMEOUT', 30)
+
+
+# The cache key holding the generation of cached overview dashboards.
+DASHBOARD_GENERATION_KEY = 'ganeti_web.dashboard.generation'
+
+
+def dashboard_cache_timeout():
+    """
+    Seconds that the overview dashboard of a user is cached for, or 0 to
+    build it on every request.
+    """
+    return getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 300)
+
+
+def dashboard_generation():
+    """
+    The current generation of cached overview dashboards.
+
+    Dashboards are cached under the generation they were built in, so
+    invalidate_dashboards() drops all of them at once by starting a new one.
+    A generation that was evicted from the cache is restarted from the
+    current time, so it never goes back to a generation that is still cached.
+    """
+    generation = cache.get(DASHBOARD_GENERATION_KEY)
+    if generation is None:
+        cache.add(DASHBOARD_GENERATION_KEY, int(time.time() * 1000),
+                  60 * 60 * 24 * 7)
+        generation = cache.get(DASHBOARD_GENERATION_KEY, 0)
+    return generation
+
+
+def invalidate_dashboards(sender=None, **kwargs):
+    """
+    Drops every cached overview dashboard.
+
+    Connected to the signals of everything a dashboard shows: virtual
+    machines, their owners, clusters, quotas, groups and permissions.
+    """
+    if kwargs.get('action', 'post').startswith('pre'):
+        # m2m_changed is sent both before and after the change
+        return
+    try:
+        cache.incr(DASHBOARD_GENERATION_KEY)
+    except ValueError:
+        # The generation was evicted. The next dashboard starts a new one.
+        pass
+
+
+# The cache key holding the snapshot of a cluster for creating virtual
+# machines, by pk. See Cluster.get_snapshot().
+CLUSTER_SNAPSHOT_KEY = 'ganeti_web.cluster.%s.snapshot'
+
+
+# The cache key holding the generation of the hostname indexes that search
+# suggestions are made from.
+HOSTNAME_GENERATION_KEY = 'ganeti_web.hostnames.generation'
+
+
+def hostname_generation():
+    """
+    The current generation of hostname indexes.
+
+    Every process builds its own index of the hostnames of virtual machines,
+    nodes and clusters, and rebuilds it when the generation changes. Like
+    dashboard_generation(), an evicted generation restarts from the current
+    time.
+    """
+    generation = cache.get(HOSTNAME_GENERATION_KEY)
+    if generation is None:
+        cache.add(HOSTNAME_GENERATION_KEY, int(time.time() * 1000),
+                  60 * 60 * 24 * 7)
+        generation = cache.get(HOSTNAME_GENERATION_KEY, 0)
+    return generation
+
+
+def invalidate_hostnames(sender=None, instance=None, created=False,
+                         **kwargs):
+    """
+    Drops every hostname index when a virtual machine, node or cluster is
+    added, removed or renamed.
+
+    Connected to the save and delete signals of those models. Saves that
+    leave the hostname as it was keep the indexes.
+    """
+    if (instance is not None and not created
+        and kwargs.get('signal') is post_save
+        and not instance.has_changed('hostname')):
+        return
+    try:
+        cache.incr(HOSTNAME_GENERATION_KEY)
+    except ValueError:
+        # The generation was evicted. The next index starts a new one.
+        pass
+
+
+# The cache key holding the permission sets of a user or group, by kind
+# ("user" or "group") and pk.
+PERMISSION_SETS_KEY = 'ganeti_web.permissions.%s.%s'
+
+
+def permission_cache_timeout():
+    """
+    Seconds that the sets of clusters and virtual machines each user and
+    group may access are cached for, or 0 to look up permissions every time.
+
+    Off by default, since a change only drops the sets cached by the process
+    that made it unless the cache backend is shared.
+    """
+    return getattr(settings, 'PERMISSION_CACHE_TIMEOUT', 0)
+
+
+def invalidate_permission_sets(users=(), groups=()):
+    """
+    Drops the cached permission sets of some users and groups.
+    """
+    keys = [PERMISSION_SETS_KEY % ('user', pk) for pk in users]
+    keys += [PERMISSION_SETS_KEY % ('group', pk) for pk in groups]
+    if keys:
+        cache.delete_many(keys)
+
+
+def update_permission_sets(sender, instance, created=False, **kwargs):
+    """
+    Drops the cached permission sets of a user or group when it is created,
+    in case one with the same pk was cached before.
+    """
+    if created:
+        kind = 'user' if sender is User else 'group'
+        cache.delete(PERMISSION_SETS_KEY % (kind, instance.pk))
+
+
+def update_permission_sets_for_perms(sender, instance, **kwargs):
+    """
+    Drops the cached permission sets of a user or group when its permissions
+    on clusters or virtual machines change.
+
+    Granting and revoking save and delete the permission rows, and rows are
+    also deleted along with their object, user or group.
+    """
+    if sender in (permission_map.get(Cluster),
+                  permission_map.get(VirtualMachine)):
+        invalidate_permission_sets(filter(None, [instance.user_id]),
+                                   filter(None, [instance.group_id]))
+
+
+def update_permission_sets_for_groups(sender, instance, action, reverse,
+                                      pk_set, **kwargs):
+    """
+    Drops the cached permission sets of users joining or leaving groups.
+    """
+    if not reverse:
+        # instance is a user
+        if action.startswith('post'):
+            invalidate_permission_sets([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        invalidate_permission_sets(pk_set)
+    elif action == 'pre_clear':
+        # instance is a group, and its members are only known before
+        invalidate_permission_sets(instance.user_set.values_list('pk',
+                                                                 flat=True))
+
+
+def rapi_fan_out(clusters, call, timeout=None):
+    """
+    Makes the same RAPI call against many clusters concurrently.
+
+    Total latency is bounded by the slowest cluster, or by the timeout,
+    rather than by the sum of all clusters.
+
+    @param clusters - iterable of Cluster objects
+    @param call - function taking a RAPI client, e.g. lambda r: r.GetNodes()
+    @param timeout - seconds to wait for slow clusters, defaults to
+    RAPI_FAN_OUT_TIMEOUT
+
+    @return tuple of dicts (results, errors), keyed by cluster
+    """
+    if timeout is None:
+        timeout = getattr(settings, 'RAPI_FAN_OUT_TIMEOUT', 10)
+
+    # The clients are retrieved here, rather than in the threads, because
+    # get_rapi() may need the database.
+    calls = {}
+    for cluster in clusters:
+        calls[cluster] = partial(call, cluster.rapi)
+
+    return fan_out(calls, timeout)
+
+
 ssh_public_key_re = re.compile(
     r'^ssh-(rsa|dsa|dss) [A-Z0-9+/=]+ .+$', re.IGNORECASE)
 ssh_public_key_error = _("Enter a valid RSA or DSA SSH key.")
@@ -173,6 +420,11 @@ validate_sshkey = RegexValidator(ssh_public_key_re, ssh_public_key_error,
                                  "invalid")
 
 
+# Rows inserted per query by bulk imports. SQLite allows 999 parameters per
+# query, which is just over fifty rows of VirtualMachine.
+IMPORT_BATCH_SIZE = 50
+
+
 class CachedClusterObject(models.Model):
     """
     Parent class for objects which belong to Ganeti but have cached data in
@@ -198,6 +450,13 @@ class CachedClusterObject(models.Model):
     error = None
     ctime = None
     deleted = False
+    # Whether the cached info was expired but left as it was, because another
+    # process was already refreshing it.
+    stale = False
+
+    # The values of fields as they are stored in the database, keyed by
+    # attname, or None if unknown. Set by record_saved().
+    _saved_values = None
 
     class Meta:
         abstract = True
@@ -205,14 +464,119 @@ class CachedClusterObject(models.Model):
     def save(self, *args, **kwargs):
         """
         overridden to ensure info is serialized prior to save
+
+        With ``changed_only=True``, objects that were loaded from the database
+        only write the fields that changed since, and are not written at all
+        if nothing changed. refresh() saves this way.
         """
         if not self.serialized_info:
-            self.serialized_info = cPickle.dumps(self.__info)
-        super(CachedClusterObject, self).save(*args, **kwargs)
+            self.serialized_info = serializers.dumps(self.__info,
+                                                     cache_serializer())
+
+        changed_only = kwargs.pop('changed_only', False)
+        if not (changed_only and self._saved_values is not None
+                and self.save_changed(kwargs.get('using'))):
+            # Every field is written, so consider all of them changed.
+            self._saved_values = None
+            super(CachedClusterObject, self).save(*args, **kwargs)
+        self.record_saved()
+
+    def save_changed(self, using=None):
+        """
+        Write only the fields that changed since this object was loaded or
+        saved, sending the same signals as save(). Nothing is written, and no
+        signals are sent, if no field changed.
+
+        @returns False if the row no longer exists and must be inserted
+        """
+        changed = self.changed_fields()
+        if not changed:
+            return True
+
+        using = using or router.db_for_write(self.__class__, instance=self)
+        origin = self.__class__
+        pre_save.send(sender=origin, instance=self, raw=False, using=using)
+
+        values = [(self._meta.get_field(name), None, value)
+                  for name, value in changed.items()]
+        rows = origin._base_manager.using(using).filter(pk=self.pk) \
+            ._update(values)
+        if not rows:
+            return False
+        transaction.commit_unless_managed(using=using)
+
+        self._state.db = using
+        self._state.adding = False
+        post_save.send(sender=origin, instance=self, created=False, raw=False,
+                       using=using)
+        return True
+
+    def record_saved(self):
+        """
+        Record the values of the loaded fields as those in the database.
+        """
+        self._saved_values = dict((f.attname, self.__dict__[f.attname])
+                                  for f in self._meta.fields
+                                  if f.attname in self.__dict__)
+
+    def changed_fields(self):
+        """
+        The fields whose values differ from those in the database.
+
+        @returns dict of the new values keyed by field name, or None if the
+                 values in the database are not known
+        """
+        if self._saved_values is None:
+            return None
+
+        changed = {}
+        for f in self._meta.fields:
+            if f.primary_key or f.attname not in self.__dict__:
+                continue
+            value = f.pre_save(self, False)
+            if (f.attname not in self._saved_values
+                or self._saved_values[f.attname] != value):
+                changed[f.name] = value
+        return changed
+
+    def has_changed(self, name):
+        """
+        Whether a field may differ from the database. Fields of objects that
+        were not loaded from the database always may.
+        """
+        changed = self.changed_fields()
+        return changed is None or name in changed
 
     def __init__(self, *args, **kwargs):
         super(CachedClusterObject, self).__init__(*args, **kwargs)
-        self.load_info()
+        # Rows are loaded positionally, or by keyword for deferred models.
+        if self.pk is not None and (args or self._deferred):
+            self.record_saved()
+        if not self.cache_deferred():
+            self.load_info()
+
+    def cache_deferred(self):
+        """
+        Whether any of the cache fields were deferred when this object was
+        loaded.
+
+        Lists defer ``serialized_info`` to avoid transferring it. Loading or
+        refreshing info for such objects would fetch it again, one query per
+        row, so they are never loaded or refreshed on instantiation.
+        """
+
+        return any(f not in self.__dict__
+                   for f in ('serialized_info', 'cached', 'ignore_cache'))
+
+    def __eq__(self, other):
+        # Deferred objects are instances of a generated subclass, which
+        # Model.__eq__ would never consider equal to a fully loaded object.
+        return (isinstance(other, CachedClusterObject)
+                and self._meta.concrete_model == other._meta.concrete_model
+                and self._get_pk_val() == other._get_pk_val())
+
+    def __hash__(self):
+        return hash(self._get_pk_val())
 
     @property
     def info(self):
@@ -228,9 +592,31 @@ class CachedClusterObject(models.Model):
 
         if self.__info is None:
             if self.serialized_info:
-                self.__info = cPickle.loads(str(self.serialized_info))
+                self.__info = serializers.loads(self.serialized_info)
         return self.__info
 
+    def partial_info(self, *keys):
+        """
+        A dictionary of only the given keys of info.
+
+        If info has not been loaded yet, only these keys are decoded and info
+        itself stays unloaded. Keys missing from info are left out.
+        """
+
+        if self.__info is None and self.serialized_info:
+            return serializers.loads(self.serialized_info, keys) or {}
+        return serializers.select(self.__info, keys) or {}
+
+    def has_info(self):
+        """
+        Whether there is any cached info, without decoding it.
+        """
+
+        if self.__info is not None or not self.serialized_info:
+            return bool(self.__info)
+        # a pickled None, from before empty info was stored as ""
+        return self.serialized_info != cPickle.dumps(None)
+
     def _set_info(self, value):
         self.__info = value
         if value is not None:
@@ -246,21 +632,58 @@ class CachedClusterObject(models.Model):
         not to refresh the cached information with new information from the
         ganeti cluster.
 
-        This will ignore the cache when self.ignore_cache is True
+        This will ignore the cache when self.ignore_cache is True.  When
+        CACHE_REFRESH_ON_LOAD is disabled the cache is never refreshed here;
+        the refresh_cache command is expected to keep it warm instead.
+
+        Only one process refreshes an object at a time. Others loading it
+        meanwhile use the expired info and are marked ``stale``, rather than
+        all asking Ganeti at once.
         """
 
         epsilon = timedelta(0, 0, 0, settings.LAZY_CACHE_REFRESH)
 
         if self.id:
-            if (self.ignore_cache
-                or self.cached is None
-                or datetime.now() > self.cached + epsilon):
-                self.refresh()
-            elif self.info:
+            if (cache_refresh_on_load() and
+                (self.ignore_cache
+                 or self.cached is None
+                 or datetime.now() > self.cached + epsilon)):
+                if self.acquire_refresh_lease():
+                    try:
+                        self.refresh()
+                    finally:
+                        self.release_refresh_lease()
+                elif self.has_info():
+                    self.stale = True
+                    self.parse_transient_info()
+                else:
+                    # There is nothing to use until the refresh is done.
+                    self.refresh()
+            elif self.has_info():
                 self.parse_transient_info()
             else:
                 self.error = 'No Cached Info'
 
+    def refresh_lease_key(self):
+        return 'ganeti_web.refresh.%s.%s' % (self._meta.db_table, self.pk)
+
+    def acquire_refresh_lease(self):
+        """
+        Claim the right to refresh this object on load.
+
+        The lease expires after REFRESH_LEASE_TIMEOUT seconds, in case the
+        process holding it dies while refreshing.
+
+        @returns whether the lease was acquired
+        """
+        # Remember the key, since refreshing may delete this object and
+        # clear its pk.
+        self._refresh_lease = self.refresh_lease_key()
+        return cache.add(self._refresh_lease, True, refresh_lease_timeout())
+
+    def release_refresh_lease(self):
+        cache.delete(self._refresh_lease)
+
     def parse_info(self):
         """
         Parse all of the attached metadata, and attach it to this object.
@@ -298,9 +721,10 @@ class CachedClusterObject(models.Model):
                 mtime = self.mtime
 
             if self.id and (self.mtime is None or mtime > self.mtime):
-                # there was an update. Set info and save the object
+                # there was an update. Set info and save the fields that
+                # changed
                 self.info = info_
-                self.save()
+                self.save(changed_only=True)
             else:
                 # There was no change on the server. Only update the cache
                 # time. This bypasses the info serialization mechanism and
@@ -342,6 +766,125 @@ class CachedClusterObject(models.Model):
 
         raise NotImplementedError
 
+    @classmethod
+    def bulk_refresh(cls, queryset, infos):
+        """
+        Refresh every object in ``queryset`` from a list of info dicts, as
+        returned by the bulk variants of the RAPI listing calls.
+
+        Objects are matched to their info by hostname.  Only objects whose
+        mtime has changed are rewritten; the cache time of all other objects
+        is bumped with a single query.  Objects with pending jobs are
+        refreshed individually so that their jobs are processed.  Objects
+        missing from ``infos`` are left untouched.
+
+        As with refresh(), the errors stored for objects that were refreshed
+        are cleared.
+
+        @returns the number of objects that were rewritten
+        """
+
+        infos = dict((info['name'], info) for info in infos)
+        now = datetime.now()
+        parse = cls.bulk_parser(queryset.values('cluster'))
+
+        pending = []
+        unchanged = []
+        refreshed = []
+        changed = 0
+        format = cache_serializer()
+
+        # values_list() skips field conversion, so do it manually.
+        to_datetime = cls._meta.get_field('mtime').to_python
+        # update() takes the names of related fields, not of their columns.
+        names = dict((f.attname, f.name) for f in cls._meta.fields)
+        values = queryset.values_list('pk', 'hostname', 'mtime', 'last_job',
+                                      'ignore_cache')
+
+        with transaction.commit_on_success():
+            for pk, hostname, mtime, last_job, ignore_cache in values:
+                if last_job or ignore_cache:
+                    pending.append(pk)
+                    continue
+
+                mtime = to_datetime(mtime)
+
+                info_ = infos.get(hostname)
+                if info_ is None:
+                    continue
+                refreshed.append(pk)
+
+                data = parse(info_)
+                if mtime is None or (data['mtime'] and data['mtime'] > mtime):
+                    data = dict((names.get(k, k), v) for k, v in data.items())
+                    cls.objects.filter(pk=pk).update(
+                        serialized_info=serializers.dumps(info_, format),
+                        cached=now,
+                        **data)
+                    changed += 1
+                else:
+                    unchanged.append(pk)
+
+            if unchanged:
+                cls.objects.filter(pk__in=unchanged).update(cached=now)
+
+            if refreshed:
+                GanetiError.objects.clear_errors(
+                    obj=cls.objects.filter(pk__in=refreshed))
+
+        for obj in cls.objects.filter(pk__in=pending):
+            # Loading the object may already have refreshed it.
+            if obj.cached is None or obj.cached < now:
+                obj.refresh()
+
+        return changed
+
+    @classmethod
+    def bulk_import(cls, cluster, infos, batch_size=IMPORT_BATCH_SIZE):
+        """
+        Create objects of ``cluster`` from a list of info dicts, as returned
+        by the bulk variants of the RAPI listing calls.
+
+        Rows are built in memory with their info and persistent fields
+        already parsed, and inserted ``batch_size`` at a time, so importing
+        a cluster takes a few queries rather than a query and a RAPI call
+        per object.  save() is not called and no signals are sent.
+
+        @returns the number of objects that were created
+        """
+
+        now = datetime.now()
+        format = cache_serializer()
+        parse = cls.bulk_parser([cluster.pk])
+
+        objs = []
+        for info_ in infos:
+            data = parse(info_)
+            objs.append(cls(cluster=cluster, hostname=info_['name'],
+                            cluster_hash=cluster.hash,
+                            serialized_info=serializers.dumps(info_, format),
+                            cached=now, **data))
+
+        with transaction.commit_on_success():
+            for i in xrange(0, len(objs), batch_size):
+                cls.objects.bulk_create(objs[i:i + batch_size])
+
+        if objs:
+            invalidate_hostnames()
+        return len(objs)
+
+    @classmethod
+    def bulk_parser(cls, clusters):
+        """
+        Returns the function that bulk_refresh() and bulk_import() use to
+        parse the info of objects of ``clusters``.
+
+        Children may override this to look up anything parsing needs once
+        for all objects, rather than once per object.
+        """
+
+        return cls.parse_persistent_info
+
     def check_job_status(self):
         if not self.last_job_id:
             return {}
@@ -352,23 +895,32 @@ class CachedClusterObject(models.Model):
 
         updates = {}
         for job in jobs:
-            status = 'unknown'
-            op = None
+            if not job.ignore_cache:
+                # The final status of this job is already known; there is no
+                # need to ask ganeti again.
+                status = job.status
+                op = job.op
 
-            try:
-                data = self.rapi.GetJobStatus(job.job_id)
-                status = data['status']
-                op = data['ops'][-1]['OP_ID']
-            except GanetiApiError:
-                pass
+            else:
+                status = 'unknown'
+                op = None
+
+                try:
+                    data = self.rapi.GetJobStatus(job.job_id)
+                    status = data['status']
+                    op = data['ops'][-1]['OP_ID']
+                except GanetiApiError:
+                    pass
 
-            if status in ('success', 'error'):
-                for k, v in Job.parse_persistent_info(data).items():
-                    setattr(job, k, v)
+                if status in ('success', 'error'):
+                    for k, v in Job.parse_persistent_info(data).items():
+                        setattr(job, k, v)
+                    job.save()
 
-            if status == 'unknown':
-                job.status = "unknown"
-                job.ignore_cache = False
+                if status == 'unknown':
+                    job.status = "unknown"
+                    job.ignore_cache = False
+                    job.save()
 
             if status in ('success', 'error', 'unknown'):
                 _updates = self._complete_job(self.cluster_id,
@@ -420,11 +972,12 @@ class CachedClusterObject(models.Model):
         This method is specific to the child object.
         """
 
-        info_ = self.info
+        # Only ctime is needed; avoid decoding the rest of info.
+        ctime = self.partial_info('ctime').get('ctime')
         # XXX ganeti 2.1 ctime is always None
         # XXX this means that we could nuke the conditionals!
-        if info_['ctime'] is not None:
-            self.ctime = datetime.fromtimestamp(info_['ctime'])
+        if ctime is not None:
+            self.ctime = datetime.fromtimestamp(ctime)
 
     @classmethod
     def parse_persistent_info(cls, info):
@@ -452,6 +1005,48 @@ class JobManager(models.Manager):
         job.save(force_insert=True)
         return job
 
+    def refresh_pending(self, cluster):
+        """
+        Refresh every unfinished job of a cluster with a single query.
+
+        Jobs that ganeti no longer knows about, because they were archived,
+        are marked unknown. Clusters too old to support queries are asked
+        about each job in turn.
+
+        @returns list of jobs whose final status was stored, or None if the
+                 cluster could not be asked about its jobs
+        """
+        # Cached info is replaced wholesale, so don't fetch it. This also
+        # keeps the jobs from refreshing themselves one by one when loaded.
+        jobs = list(self.filter(cluster=cluster, ignore_cache=True)
+                    .defer('serialized_info'))
+        if not jobs:
+            return []
+
+        try:
+            statuses = cluster.rapi.GetJobStatuses([j.job_id for j in jobs])
+        except GanetiApiError, e:
+            if e.code not in QUERY_UNSUPPORTED_CODES:
+                # its possible the cluster or credentials are bad. Nothing
+                # was stored, which callers must be able to tell apart from
+                # no job having finished.
+                return None
+            # no query resource, ganeti is older than 2.6
+            statuses = None
+
+        for job in jobs:
+            if statuses is None:
+                job.refresh_status()
+            elif job.job_id in statuses:
+                job.info = statuses[job.job_id]
+                job.save()
+            else:
+                job.status = 'unknown'
+                job.ignore_cache = False
+                job.save()
+
+        return [job for job in jobs if not job.ignore_cache]
+
 
 class Job(CachedClusterObject):
     """
@@ -475,6 +1070,10 @@ class Job(CachedClusterObject):
     status = models.CharField(max_length=10)
     op = models.CharField(max_length=50)
 
+    # Django can't declare composite indexes. Migration 0019 indexes
+    # (content_type, object_id) and (cluster, status). Migration 0021
+    # indexes (status, finished, id), in the order of the errors feed.
+
     objects = JobManager()
 
     def save(self, *args, **kwargs):
@@ -504,19 +1103,27 @@ class Job(CachedClusterObject):
         Load info for class.  This will load from ganeti if ignore_cache==True,
         otherwise this will always load from the cache.
         """
+        if not cache_refresh_on_load():
+            return
         if self.id and (self.ignore_cache or self.info is None):
-            try:
-                self.refresh()
-            except GanetiApiError, e:
-                # if the Job has been archived then we don't know whether it
-                # was successful or not. Mark it as unknown.
-                if e.code == 404:
-                    self.status = 'unknown'
-                    self.save()
-                else:
-                    # its possible the cluster or crednetials are bad. fail
-                    # silently
-                    pass
+            self.refresh_status()
+
+    def refresh_status(self):
+        """
+        Refresh this job from ganeti, tolerating jobs that no longer exist.
+        """
+        try:
+            self.refresh()
+        except GanetiApiError, e:
+            # if the Job has been archived then we don't know whether it
+            # was successful or not. Mark it as unknown.
+            if e.code == 404:
+                self.status = 'unknown'
+                self.save()
+            else:
+                # its possible the cluster or crednetials are bad. fail
+                # silently
+                pass
 
     def refresh(self):
         self.info = self._refresh()
@@ -626,6 +1233,10 @@ class VirtualMachine(CachedClusterObject):
     pending_delete = models.BooleanField(default=False)
     deleted = False
 
+    # The owner tag of this virtual machine in Ganeti doesn't name its owner
+    # yet. Saving only sets this; backend.owner_tags updates Ganeti.
+    owner_tag_pending = models.BooleanField(default=False, db_index=True)
+
     # Template temporarily stores parameters used to create this virtual
     # machine. This template is used to recreate the values entered into the
     # form.
@@ -633,13 +1244,27 @@ class VirtualMachine(CachedClusterObject):
                                  related_name="instances", null=True,
                                  blank=True)
 
+    # Fields that the allocation totals of nodes are counted from.
+    ALLOCATION_FIELDS = ('primary_node_id', 'secondary_node_id', 'status',
+                         'ram', 'disk_size', 'virtual_cpus')
+    # The values of those fields that the totals currently count, or None if
+    # unknown. Set by record_allocation().
+    _saved_allocation = None
+
     class Meta:
         ordering = ["hostname"]
         unique_together = (("cluster", "hostname"),)
+        # Django can't declare composite indexes. Migration 0019 indexes
+        # (cluster, status), (owner, cluster), (primary_node, status) and
+        # (secondary_node, status).
 
     def __unicode__(self):
         return self.hostname
 
+    def _allocation(self):
+        # Read from __dict__ so that deferred fields are not loaded.
+        return tuple(self.__dict__.get(f) for f in self.ALLOCATION_FIELDS)
+
     def save(self, *args, **kwargs):
         """
         sets the cluster_hash for newly saved instances
@@ -648,32 +1273,54 @@ class VirtualMachine(CachedClusterObject):
             self.cluster_hash = self.cluster.hash
 
         info_ = self.info
-        if info_:
-            found = False
-            remove = []
-            if self.cluster.username:
-                for tag in info_['tags']:
-                    # Update owner Tag. Make sure the tag is set to the owner
-                    #  that is set in webmgr.
-                    if tag.startswith(constants.OWNER_TAG):
-                        id = int(tag[len(constants.OWNER_TAG):])
-                        # Since there is no 'update tag' delete old tag and
-                        #  replace with tag containing correct owner id.
-                        if id == self.owner_id:
-                            found = True
-                        else:
-                            remove.append(tag)
-                if remove:
-                    self.rapi.DeleteInstanceTags(self.hostname, remove)
-                    for tag in remove:
-                        info_['tags'].remove(tag)
-                if self.owner_id and not found:
-                    tag = '%s%s' % (constants.OWNER_TAG, self.owner_id)
-                    self.rapi.AddInstanceTags(self.hostname, [tag])
-                    self.info['tags'].append(tag)
+        if info_ and self.cluster.username:
+            # Only record that the owner tag must change, so that saving
+            # never waits for Ganeti.
+            remove, add = self.owner_tag_changes(info_['tags'], self.owner_id)
+            if remove or add:
+                self.owner_tag_pending = True
 
         super(VirtualMachine, self).save(*args, **kwargs)
 
+        # Recount the nodes this virtual machine was moved off of or onto,
+        # or whose totals its resources count towards.
+        allocation = self._allocation()
+        saved = self._saved_allocation or (None, None)
+        if allocation != saved:
+            nodes = set(saved[:2] + allocation[:2])
+            nodes.discard(None)
+            if nodes:
+                Node.objects.update_allocations(nodes)
+            ClusterCapacity.objects.recount([self.cluster_id])
+        self._saved_allocation = allocation
+
+    @staticmethod
+    def owner_tag_changes(tags, owner_id):
+        """
+        The owner tags to remove from and add to a virtual machine, so that
+        its tags name its owner and nobody else.
+
+        @param tags - the tags of the virtual machine in Ganeti
+        @param owner_id - the id of its owner, or None
+        @returns tuple of lists (remove, add)
+        """
+        found = False
+        remove = []
+        for tag in tags:
+            if tag.startswith(constants.OWNER_TAG):
+                id = int(tag[len(constants.OWNER_TAG):])
+                # Since there is no 'update tag' delete old tag and
+                #  replace with tag containing correct owner id.
+                if id == owner_id:
+                    found = True
+                else:
+                    remove.append(tag)
+
+        add = []
+        if owner_id and not found:
+            add.append('%s%s' % (constants.OWNER_TAG, owner_id))
+        return remove, add
+
     @models.permalink
     def get_absolute_url(self):
         """
@@ -691,11 +1338,25 @@ class VirtualMachine(CachedClusterObject):
     def is_running(self):
         return self.status == 'running'
 
+    def parse_info(self):
+        super(VirtualMachine, self).parse_info()
+
+        # Nodes are set by id, so forget nodes loaded for the previous ids.
+        for name in ('primary_node', 'secondary_node'):
+            cache = self._meta.get_field(name).get_cache_name()
+            node = self.__dict__.get(cache)
+            if node is not None and node.pk != getattr(self, name + '_id'):
+                del self.__dict__[cache]
+
     @classmethod
-    def parse_persistent_info(cls, info):
+    def parse_persistent_info(cls, info, nodes=None):
         """
         Loads all values from cached info, included persistent properties that
         are stored in the database
+
+        @param nodes - dict of the ids of Nodes, keyed by hostname, as
+                       returned by Node.objects.hostname_map(). If it is not
+                       given, both nodes are looked up with a single query.
         """
         data = super(VirtualMachine, cls).parse_persistent_info(info)
 
@@ -711,25 +1372,15 @@ class VirtualMachine(CachedClusterObject):
         data['status'] = info['status']
 
         primary = info['pnode']
-        if primary:
-            try:
-                data['primary_node'] = Node.objects.get(hostname=primary)
-            except Node.DoesNotExist:
-                # node is not created yet.  fail silently
-                data['primary_node'] = None
-        else:
-            data['primary_node'] = None
+        secondary = info['snodes'][0] if info['snodes'] else None
+        if nodes is None:
+            hostnames = filter(None, (primary, secondary))
+            nodes = Node.objects.hostname_map(hostnames=hostnames) \
+                if hostnames else {}
 
-        secondary = info['snodes']
-        if len(secondary):
-            secondary = secondary[0]
-            try:
-                data['secondary_node'] = Node.objects.get(hostname=secondary)
-            except Node.DoesNotExist:
-                # node is not created yet.  fail silently
-                data['secondary_node'] = None
-        else:
-            data['secondary_node'] = None
+        # Nodes that are not created yet are left unset.
+        data['primary_node_id'] = nodes.get(primary)
+        data['secondary_node_id'] = nodes.get(secondary)
 
         return data
 
@@ -778,6 +1429,40 @@ class VirtualMachine(CachedClusterObject):
             return None
         return self.rapi.GetInstance(self.hostname)
 
+    @classmethod
+    def bulk_import(cls, cluster, infos, **kwargs):
+        created = super(VirtualMachine, cls).bulk_import(cluster, infos,
+                                                         **kwargs)
+
+        # Rows were inserted without save(), so recount the nodes of the
+        # cluster.
+        if created:
+            Node.objects.update_allocations(cluster.nodes.all())
+            invalidate_dashboards()
+        return created
+
+    @classmethod
+    def bulk_parser(cls, clusters):
+        # Look up the nodes of the clusters once, rather than twice per VM.
+        nodes = Node.objects.hostname_map(clusters)
+        return partial(cls.parse_persistent_info, nodes=nodes)
+
+    @classmethod
+    def bulk_refresh(cls, queryset, infos):
+        # Objects pending deletion or creation are not refreshed. See
+        # _refresh().
+        queryset = queryset.filter(pending_delete=False,
+                                   template__isnull=True)
+        changed = super(VirtualMachine, cls).bulk_refresh(queryset, infos)
+
+        # Rows were updated without save(), so recount every node that may
+        # have gained or lost virtual machines.
+        if changed:
+            Node.objects.update_allocations(
+                Node.objects.filter(cluster__in=queryset.values('cluster')))
+            invalidate_dashboards()
+        return changed
+
     def shutdown(self, timeout=None):
         if timeout is None:
             id = self.rapi.ShutdownInstance(self.hostname)
@@ -884,6 +1569,72 @@ class VirtualMachine(CachedClusterObject):
         return "<VirtualMachine: '%s'>" % self.hostname
 
 
+class NodeManager(models.Manager):
+    """
+    Custom manager for Ganeti Nodes model
+    """
+
+    def hostname_map(self, clusters=None, hostnames=None):
+        """
+        The ids of nodes, keyed by hostname, read with a single query.
+
+        @param clusters - pks or queryset of the clusters to include nodes of
+        @param hostnames - the hostnames of the nodes to include
+        """
+        qs = self.all()
+        if clusters is not None:
+            qs = qs.filter(cluster__in=clusters)
+        if hostnames is not None:
+            qs = qs.filter(hostname__in=hostnames)
+        return dict(qs.values_list('hostname', 'pk'))
+
+    def update_allocations(self, nodes=None):
+        """
+        Recount the resources allocated to the virtual machines on nodes.
+
+        Ram is allocated on both nodes of running virtual machines, disk on
+        both nodes of all virtual machines, and cpus on the primary node of
+        running virtual machines.
+
+        @param nodes - pks or queryset of the nodes to recount, or None for
+                       all nodes
+        @returns list of pks of the nodes whose totals changed
+        """
+        qs = self.all() if nodes is None else self.filter(pk__in=nodes)
+        current = dict((values[0], values[1:]) for values in qs.values_list(
+            'pk', 'ram_allocated', 'disk_allocated', 'cpus_allocated'))
+        if not current:
+            return []
+        totals = dict((pk, [0, 0, 0]) for pk in current)
+
+        vms = VirtualMachine.objects.order_by()
+        running = vms.filter(status='running')
+        counts = (
+            (0, running.exclude(ram=-1), 'primary_node', 'ram'),
+            (0, running.exclude(ram=-1), 'secondary_node', 'ram'),
+            (1, vms.exclude(disk_size=-1), 'primary_node', 'disk_size'),
+            (1, vms.exclude(disk_size=-1), 'secondary_node', 'disk_size'),
+            (2, running.exclude(virtual_cpus=-1), 'primary_node',
+             'virtual_cpus'),
+        )
+        for index, queryset, node, field in counts:
+            if nodes is None:
+                queryset = queryset.filter(**{'%s__isnull' % node: False})
+            else:
+                queryset = queryset.filter(**{'%s__in' % node: current.keys()})
+            for pk, total in queryset.values_list(node).annotate(Sum(field)):
+                totals[pk][index] += total or 0
+
+        changed = []
+        for pk, (ram, disk, cpus) in totals.items():
+            if current[pk] != (ram, disk, cpus):
+                self.filter(pk=pk).update(ram_allocated=ram,
+                                          disk_allocated=disk,
+                                          cpus_allocated=cpus)
+                changed.append(pk)
+        return changed
+
+
 class Node(CachedClusterObject):
     """
     The Node model represents nodes within a Ganeti cluster.
@@ -909,6 +1660,13 @@ class Node(CachedClusterObject):
     disk_free = models.IntegerField(default=-1)
     cpus = models.IntegerField(null=True, blank=True)
 
+    # Resources allocated to the virtual machines on this node. These are
+    # totals over VirtualMachine, stored so that lists of nodes don't need to
+    # aggregate for every node. See NodeManager.update_allocations().
+    ram_allocated = models.IntegerField(default=0)
+    disk_allocated = models.IntegerField(default=0)
+    cpus_allocated = models.IntegerField(default=0)
+
     # The last job reference indicates that there is at least one pending job
     # for this virtual machine.  There may be more than one job, and that can
     # never be prevented.  This just indicates that job(s) are pending and the
@@ -916,6 +1674,12 @@ class Node(CachedClusterObject):
     last_job = models.ForeignKey('Job', related_name="+", null=True,
                                  blank=True)
 
+    objects = NodeManager()
+
+    # The fields counted by ClusterCapacityManager.recount().
+    CAPACITY_FIELDS = ('cluster', 'offline', 'ram_total', 'ram_free',
+                       'disk_total', 'disk_free')
+
     def __unicode__(self):
         return self.hostname
 
@@ -925,7 +1689,20 @@ class Node(CachedClusterObject):
         """
         if self.id is None:
             self.cluster_hash = self.cluster.hash
+
+        # Only the resources and state of nodes are counted towards the
+        # capacity of their cluster, so refreshes that change nothing else
+        # don't recount it.
+        clusters = set()
+        if any(self.has_changed(f) for f in self.CAPACITY_FIELDS):
+            clusters.add(self.cluster_id)
+            if self._saved_values is not None:
+                clusters.add(self._saved_values.get('cluster_id'))
+            clusters.discard(None)
+
         super(Node, self).save(*args, **kwargs)
+        if clusters:
+            ClusterCapacity.objects.recount(clusters)
 
     @models.permalink
     def get_absolute_url(self):
@@ -965,15 +1742,9 @@ class Node(CachedClusterObject):
     @property
     def ram(self):
         """ returns dict of free and total ram """
-        values = VirtualMachine.objects \
-            .filter(Q(primary_node=self) | Q(secondary_node=self)) \
-            .filter(status='running') \
-            .exclude(ram=-1).order_by() \
-            .aggregate(used=Sum('ram'))
-
         total = self.ram_total
         used = total - self.ram_free
-        allocated = values.get("used") or 0
+        allocated = self.ram_allocated
         free = total - allocated if allocated >= 0 and total >= 0 else -1
 
         return {
@@ -986,14 +1757,9 @@ class Node(CachedClusterObject):
     @property
     def disk(self):
         """ returns dict of free and total disk space """
-        values = VirtualMachine.objects \
-            .filter(Q(primary_node=self) | Q(secondary_node=self)) \
-            .exclude(disk_size=-1).order_by() \
-            .aggregate(used=Sum('disk_size'))
-
         total = self.disk_total
         used = total - self.disk_free
-        allocated = values.get("used") or 0
+        allocated = self.disk_allocated
         free = total - allocated if allocated >= 0 and total >= 0 else -1
 
         return {
@@ -1005,11 +1771,7 @@ class Node(CachedClusterObject):
 
     @property
     def allocated_cpus(self):
-        values = VirtualMachine.objects \
-            .filter(primary_node=self, status='running') \
-            .exclude(virtual_cpus=-1).order_by() \
-            .aggregate(cpus=Sum('virtual_cpus'))
-        return values.get("cpus") or 0
+        return self.cpus_allocated
 
     def set_role(self, role, force=False):
         """
@@ -1093,7 +1855,11 @@ class Cluster(CachedClusterObject):
 
     def save(self, *args, **kwargs):
         self.hash = self.create_hash()
+        created = self.pk is None
         super(Cluster, self).save(*args, **kwargs)
+        if created:
+            # in case a cluster with the same pk left a snapshot behind
+            cache.delete(CLUSTER_SNAPSHOT_KEY % self.pk)
 
     @models.permalink
     def get_absolute_url(self):
@@ -1235,14 +2001,18 @@ class Cluster(CachedClusterObject):
         this ganeti cluster has:
             * VMs no longer in ganeti are deleted
             * VMs missing from the database are added
+
+        All VMs are fetched with a single bulk RAPI call, and missing VMs are
+        imported with their info. Sync nodes first so that VMs can be related
+        to them.
         """
-        ganeti = self.instances()
-        db = self.virtual_machines.all().values_list('hostname', flat=True)
+        infos = self.instances(bulk=True)
+        ganeti = [info['name'] for info in infos]
+        db = set(self.virtual_machines.values_list('hostname', flat=True))
 
         # add VMs missing from the database
-        for hostname in filter(lambda x: unicode(x) not in db, ganeti):
-            vm = VirtualMachine.objects.create(cluster=self, hostname=hostname)
-            vm.refresh()
+        missing = [info for info in infos if unicode(info['name']) not in db]
+        VirtualMachine.bulk_import(self, missing)
 
         # deletes VMs that are no longer in ganeti
         if remove:
@@ -1251,20 +2021,26 @@ class Cluster(CachedClusterObject):
                 self.virtual_machines \
                     .filter(hostname__in=missing_ganeti).delete()
 
+        if missing:
+            ClusterCapacity.objects.recount([self.pk])
+
     def sync_nodes(self, remove=False):
         """
         Synchronizes the Nodes in the database with the information
         this ganeti cluster has:
             * Nodes no longer in ganeti are deleted
             * Nodes missing from the database are added
+
+        All Nodes are fetched with a single bulk RAPI call, and missing Nodes
+        are imported with their info.
         """
-        ganeti = self.rapi.GetNodes()
-        db = self.nodes.all().values_list('hostname', flat=True)
+        infos = self.rapi.GetNodes(bulk=True)
+        ganeti = [info['name'] for info in infos]
+        db = set(self.nodes.values_list('hostname', flat=True))
 
         # add Nodes missing from the database
-        for hostname in filter(lambda x: unicode(x) not in db, ganeti):
-            node = Node.objects.create(cluster=self, hostname=hostname)
-            node.refresh()
+        missing = [info for info in infos if unicode(info['name']) not in db]
+        Node.bulk_import(self, missing)
 
         # deletes Nodes that are no longer in ganeti
         if remove:
@@ -1272,13 +2048,18 @@ class Cluster(CachedClusterObject):
             if missing_ganeti:
                 self.nodes.filter(hostname__in=missing_ganeti).delete()
 
+        if missing:
+            ClusterCapacity.objects.recount([self.pk])
+
     @property
     def missing_in_ganeti(self):
         """
         Returns a list of VirtualMachines that are missing from the Ganeti
         cluster but present in the database.
         """
-        ganeti = self.instances()
+        return self._missing_in_ganeti(self.instances())
+
+    def _missing_in_ganeti(self, ganeti):
         qs = self.virtual_machines.exclude(template__isnull=False)
         db = qs.values_list('hostname', flat=True)
         return [x for x in db if str(x) not in ganeti]
@@ -1289,7 +2070,9 @@ class Cluster(CachedClusterObject):
         Returns list of VirtualMachines that are missing from the database, but
         present in ganeti
         """
-        ganeti = self.instances()
+        return self._missing_in_db(self.instances())
+
+    def _missing_in_db(self, ganeti):
         db = self.virtual_machines.all().values_list('hostname', flat=True)
         return [x for x in ganeti if unicode(x) not in db]
 
@@ -1303,6 +2086,9 @@ class Cluster(CachedClusterObject):
             ganeti = self.rapi.GetNodes()
         except GanetiApiError:
             ganeti = []
+        return self._nodes_missing_in_db(ganeti)
+
+    def _nodes_missing_in_db(self, ganeti):
         db = self.nodes.all().values_list('hostname', flat=True)
         return [x for x in ganeti if unicode(x) not in db]
 
@@ -1316,9 +2102,51 @@ class Cluster(CachedClusterObject):
             ganeti = self.rapi.GetNodes()
         except GanetiApiError:
             ganeti = []
+        return self._nodes_missing_in_ganeti(ganeti)
+
+    def _nodes_missing_in_ganeti(self, ganeti):
         db = self.nodes.all().values_list('hostname', flat=True)
         return filter(lambda x: str(x) not in ganeti, db)
 
+    @classmethod
+    def missing_vms(cls, clusters, timeout=None):
+        """
+        Compares the VirtualMachines in the database with those in ganeti for
+        many clusters at once.  Ganeti is queried concurrently, and clusters
+        that fail to answer are left out of the comparison.
+
+        @returns tuple of dicts (missing_in_db, missing_in_ganeti, errors),
+        all keyed by cluster.  The first two are lists of hostnames.
+        """
+        listings, errors = rapi_fan_out(clusters,
+                                        lambda rapi: rapi.GetInstances(),
+                                        timeout)
+        missing_in_db = {}
+        missing_in_ganeti = {}
+        for cluster, ganeti in listings.items():
+            missing_in_db[cluster] = cluster._missing_in_db(ganeti)
+            missing_in_ganeti[cluster] = cluster._missing_in_ganeti(ganeti)
+        return missing_in_db, missing_in_ganeti, errors
+
+    @classmethod
+    def missing_nodes(cls, clusters, timeout=None):
+        """
+        Compares the Nodes in the database with those in ganeti for many
+        clusters at once.  See missing_vms().
+
+        @returns tuple of dicts (missing_in_db, missing_in_ganeti, errors)
+        """
+        listings, errors = rapi_fan_out(clusters,
+                                        lambda rapi: rapi.GetNodes(),
+                                        timeout)
+        missing_in_db = {}
+        missing_in_ganeti = {}
+        for cluster, ganeti in listings.items():
+            missing_in_db[cluster] = cluster._nodes_missing_in_db(ganeti)
+            missing_in_ganeti[cluster] = \
+                cluster._nodes_missing_in_ganeti(ganeti)
+        return missing_in_db, missing_in_ganeti, errors
+
     @property
     def available_ram(self):
         """ returns dict of free and total ram """
@@ -1372,9 +2200,98 @@ class Cluster(CachedClusterObject):
             'used': used,
         }
 
+    def get_capacity(self):
+        """
+        Returns the ClusterCapacity snapshot of this cluster, counting it
+        first if it does not exist yet.
+
+        Lists of clusters should select_related('capacity') so that the
+        snapshots of all clusters are read along with them.
+        """
+        try:
+            return self.capacity
+        except ClusterCapacity.DoesNotExist:
+            ClusterCapacity.objects.recount([self.pk])
+            self.capacity = ClusterCapacity.objects.get(pk=self.pk)
+            return self.capacity
+
+    def build_snapshot(self, os_list=None):
+        """
+        Collects what creating a virtual machine on this cluster needs to
+        know: its capabilities, its defaults and its operating systems.
+
+        @param os_list - the operating systems to use instead of asking
+                         Ganeti for them
+        """
+        info = self.info
+        if os_list is None:
+            os_list = cluster_os_list(self)
+        return {
+            'mtime': self.mtime,
+            'has_cdrom2': has_cdrom2(self),
+            'requires_maxmem': requires_maxmem(self),
+            'enabled_hypervisors': info['enabled_hypervisors'],
+            'default_hypervisor': info['default_hypervisor'],
+            'beparams': info['beparams']['default'],
+            'hvparams': info['hvparams'],
+            'ipolicy': info.get('ipolicy', {}),
+            'os_list': os_list,
+        }
+
+    def update_snapshot(self, os_list=None):
+        """
+        Builds the snapshot of this cluster and stores it in the cache for
+        LAZY_CACHE_REFRESH, the same as cached info.
+        """
+        snapshot = self.build_snapshot(os_list)
+        cache.set(CLUSTER_SNAPSHOT_KEY % self.pk, snapshot,
+                  settings.LAZY_CACHE_REFRESH // 1000)
+        return snapshot
+
+    def get_snapshot(self):
+        """
+        Returns the capabilities, defaults and operating systems of this
+        cluster, from the cache.
+
+        Snapshots are rebuilt by refresh_all(). If the info of the cluster
+        changed since, the snapshot is rebuilt from it, keeping the
+        operating systems. Ganeti is only asked for them when the snapshot
+        is missing from the cache or has none, as when Ganeti couldn't be
+        reached.
+        """
+        snapshot = cache.get(CLUSTER_SNAPSHOT_KEY % self.pk)
+        if snapshot is None or not snapshot['os_list']:
+            snapshot = self.update_snapshot()
+        elif snapshot['mtime'] != self.mtime:
+            snapshot = self.update_snapshot(snapshot['os_list'])
+        return snapshot
+
     def _refresh(self):
         return self.rapi.GetInfo()
 
+    def refresh_all(self):
+        """
+        Refresh this cluster along with all of its Nodes and VirtualMachines,
+        and its snapshot.
+
+        Nodes and VirtualMachines are fetched with one bulk RAPI call each,
+        rather than one call per object.  Nodes are refreshed first so that
+        VirtualMachines can be related to them.
+        """
+
+        self.refresh()
+        if self.error:
+            # the cluster is unreachable, don't bother with its objects
+            return
+        self.update_snapshot()
+
+        Node.bulk_refresh(self.nodes.all(), self.rapi.GetNodes(bulk=True))
+        VirtualMachine.bulk_refresh(self.virtual_machines.all(),
+                                    self.rapi.GetInstances(bulk=True))
+
+        # Rows were updated without save(), so the snapshot is recounted here.
+        ClusterCapacity.objects.recount([self.pk])
+
     def instances(self, bulk=False):
         """Gets all VMs which reside under the Cluster
         Calls the rapi client for all instances.
@@ -1407,6 +2324,134 @@ class Cluster(CachedClusterObject):
         return job
 
 
+class ClusterCapacityManager(models.Manager):
+    """
+    Custom manager for ClusterCapacity
+    """
+
+    def recount(self, clusters=None):
+        """
+        Recount the capacity snapshots of clusters from their Nodes and
+        VirtualMachines.
+
+        Ram is allocated to running virtual machines and disk to all virtual
+        machines, the same as Cluster.available_ram and
+        Cluster.available_disk count them. Every count is a single grouped
+        query, so recounting all clusters costs as much as recounting one.
+
+        @param clusters - pks or queryset of the clusters to recount, or None
+                          for all clusters
+        @returns list of pks of the clusters whose snapshot changed
+        """
+        qs = Cluster.objects.order_by()
+        if clusters is not None:
+            qs = qs.filter(pk__in=clusters)
+        pks = list(qs.values_list('pk', flat=True))
+        if not pks:
+            return []
+        counts = dict((pk, dict((f, 0) for f in ClusterCapacity.COUNTS))
+                      for pk in pks)
+
+        nodes = Node.objects.filter(cluster__in=pks).order_by()
+        for pk, offline, count in nodes.values_list('cluster', 'offline') \
+                .annotate(Count('pk')):
+            counts[pk]['nodes_offline' if offline else 'nodes_online'] += count
+        for values in nodes.exclude(ram_total=-1).values('cluster') \
+                .annotate(total=Sum('ram_total'), free=Sum('ram_free')):
+            pk = values['cluster']
+            counts[pk]['ram_total'] = max(values['total'] or 0, 0)
+            counts[pk]['ram_free'] = max(values['free'] or 0, 0)
+        for values in nodes.exclude(disk_total=-1).values('cluster') \
+                .annotate(total=Sum('disk_total'), free=Sum('disk_free')):
+            pk = values['cluster']
+            counts[pk]['disk_total'] = max(values['total'] or 0, 0)
+            counts[pk]['disk_free'] = max(values['free'] or 0, 0)
+
+        vms = VirtualMachine.objects.filter(cluster__in=pks).order_by()
+        for pk, status, count in vms.values_list('cluster', 'status') \
+                .annotate(Count('pk')):
+            counts[pk]['vms_total'] += count
+            if status == 'running':
+                counts[pk]['vms_running'] += count
+        for pk, allocated in vms.filter(status='running').exclude(ram=-1) \
+                .values_list('cluster').annotate(Sum('ram')):
+            counts[pk]['ram_allocated'] = allocated or 0
+        for pk, allocated in vms.exclude(disk_size=-1) \
+                .values_list('cluster').annotate(Sum('disk_size')):
+            counts[pk]['disk_allocated'] = allocated or 0
+
+        current = self.in_bulk(pks)
+        changed = []
+        for pk, values in counts.items():
+            capacity = current.get(pk)
+            if capacity is None:
+                self.create(cluster_id=pk, **values)
+            elif all(getattr(capacity, f) == v for f, v in values.items()):
+                continue
+            else:
+                self.filter(pk=pk).update(**values)
+            changed.append(pk)
+        return changed
+
+
+class ClusterCapacity(models.Model):
+    """
+    A snapshot of the resources and objects of a Cluster.
+
+    Pages that list clusters show these totals for every cluster. They are
+    counted when the cluster is refreshed and as its Nodes and
+    VirtualMachines change, rather than on every page load, so that a list
+    reads them for all clusters with a single join.
+    """
+
+    # The fields holding counts, as set by ClusterCapacityManager.recount().
+    COUNTS = ('ram_total', 'ram_free', 'ram_allocated', 'disk_total',
+              'disk_free', 'disk_allocated', 'nodes_online', 'nodes_offline',
+              'vms_running', 'vms_total')
+
+    cluster = models.OneToOneField(Cluster, primary_key=True,
+                                   related_name='capacity')
+    ram_total = models.IntegerField(default=0)
+    ram_free = models.IntegerField(default=0)
+    ram_allocated = models.IntegerField(default=0)
+    disk_total = models.IntegerField(default=0)
+    disk_free = models.IntegerField(default=0)
+    disk_allocated = models.IntegerField(default=0)
+    nodes_online = models.IntegerField(default=0)
+    nodes_offline = models.IntegerField(default=0)
+    vms_running = models.IntegerField(default=0)
+    vms_total = models.IntegerField(default=0)
+
+    objects = ClusterCapacityManager()
+
+    def __unicode__(self):
+        return unicode(self.cluster_id)
+
+    @property
+    def nodes_total(self):
+        return self.nodes_online + self.nodes_offline
+
+    @property
+    def ram(self):
+        """ returns dict of free and total ram, as Cluster.available_ram """
+        return {
+            'total': self.ram_total,
+            'free': max(self.ram_total - self.ram_allocated, 0),
+            'allocated': self.ram_allocated,
+            'used': self.ram_total - self.ram_free,
+        }
+
+    @property
+    def disk(self):
+        """ returns dict of free and total disk, as Cluster.available_disk """
+        return {
+            'total': self.disk_total,
+            'free': max(self.disk_total - self.disk_allocated, 0),
+            'allocated': self.disk_allocated,
+            'used': self.disk_total - self.disk_free,
+        }
+
+
 class VirtualMachineTemplate(models.Model):
     """
     Virtual Machine Template holds all the values for the create virtual
@@ -1488,7 +2533,7 @@ class GanetiError(models.Model):
     code = models.PositiveIntegerField(blank=True, null=True)
 
     # XXX could be fixed with django-model-util's TimeStampedModel
-    timestamp = models.DateTimeField()
+    timestamp = models.DateTimeField(db_index=True)
 
     # determines if the errors still appears or not
     cleared = models.BooleanField(default=False)
@@ -1502,6 +2547,10 @@ class GanetiError(models.Model):
 
     class Meta:
         ordering = ("-timestamp", "code", "msg")
+        # Django can't declare composite indexes. Migration 0019 indexes
+        # (obj_type, obj_id, cleared) and (cluster, cleared). Migration 0021
+        # indexes (cleared, timestamp, id) and (cluster, timestamp, id), in
+        # the order of the errors feed.
 
     def __unicode__(self):
         base = u"[%s] %s" % (self.timestamp, self.msg)
@@ -1619,7 +2668,7 @@ class ClusterUser(models.Model):
     Base class for objects that may interact with a Cluster or VirtualMachine.
     """
 
-    name = models.CharField(max_length=128)
+    name = models.CharField(max_length=128, db_index=True)
     real_type = models.ForeignKey(ContentType, related_name="+",
                                   editable=False, null=True, blank=True)
 
@@ -1779,6 +2828,129 @@ class SSHKey(models.Model):
     user = models.ForeignKey(User, related_name='ssh_keys')
 
 
+class SSHKeyIndexManager(models.Manager):
+    """
+    Custom manager for SSHKeyIndex
+    """
+
+    def invalidate(self):
+        """
+        Mark every index as out of date. Each is rebuilt when next requested.
+        """
+        self.update(generation=models.F('generation') + 1)
+
+    def get_index(self, cluster=None, virtual_machine=None):
+        """
+        Returns the up to date index of the keys with access to a virtual
+        machine, to a cluster and its virtual machines, or to any cluster or
+        virtual machine if neither is given.
+        """
+        if virtual_machine is not None:
+            scope = 'vm:%d' % virtual_machine.pk
+        elif cluster is not None:
+            scope = 'cluster:%d' % cluster.pk
+        else:
+            scope = ''
+
+        index, new = self.get_or_create(scope=scope)
+        if index.built != index.generation:
+            index.build(self.list_keys(cluster, virtual_machine))
+        return index
+
+    def list_keys(self, cluster=None, virtual_machine=None):
+        """
+        Lists the (key, username) pairs of the users with access, with a
+        single query however many objects there are.
+
+        Virtual machines are accessed by their admins. Clusters and all
+        objects are accessed by users with any permission on them, or on any
+        of their virtual machines. Superusers access everything. Permissions
+        granted to groups apply to their members.
+        """
+        ClusterPerms = permission_map[Cluster]
+        VirtualMachinePerms = permission_map[VirtualMachine]
+
+        if virtual_machine is not None:
+            perms = [VirtualMachinePerms.objects.filter(obj=virtual_machine,
+                                                        admin=True)]
+        elif cluster is not None:
+            perms = [ClusterPerms.objects.filter(obj=cluster),
+                     VirtualMachinePerms.objects.filter(obj__cluster=cluster)]
+        else:
+            perms = [ClusterPerms.objects.all(),
+                     VirtualMachinePerms.objects.all()]
+
+        q = Q(user__is_superuser=True)
+        for qs in perms:
+            q |= Q(user__in=qs.filter(user__isnull=False).values('user'))
+            q |= Q(user__groups__in=qs.filter(group__isnull=False)
+                   .values('group'))
+
+        keys = SSHKey.objects.filter(q).distinct() \
+            .values_list('key', 'user__username') \
+            .order_by('user__username', 'key')
+        return [list(key) for key in keys]
+
+
+class SSHKeyIndex(models.Model):
+    """
+    The SSH keys served to one virtual machine, one cluster, or all of them.
+
+    Nodes fetch keys every few minutes, while keys and permissions rarely
+    change. Each list is stored with an ETag, so a node that already has the
+    list is answered without any access checks. Changes to keys, users,
+    groups or permissions only mark the lists out of date by bumping their
+    generation. A list is rebuilt when it is next requested, keeping the
+    previous list so nodes may fetch only the difference.
+    """
+
+    # "" for all keys, or "cluster:<pk>" or "vm:<pk>"
+    scope = models.CharField(max_length=64, unique=True)
+    generation = models.IntegerField(default=0)
+    # the generation the keys were built in, or None if never built
+    built = models.IntegerField(null=True)
+    etag = models.CharField(max_length=40, blank=True)
+    keys = models.TextField(default='[]')
+    previous_etag = models.CharField(max_length=40, blank=True)
+    previous_keys = models.TextField(default='[]')
+
+    objects = SSHKeyIndexManager()
+
+    def __unicode__(self):
+        return self.scope
+
+    def build(self, keys):
+        """
+        Store a freshly listed set of keys.
+
+        The generation is read before the keys were listed, so the index
+        stays out of date if it was invalidated in the meantime.
+        """
+        data = json.dumps(keys)
+        etag = sha1(data).hexdigest()
+        if etag != self.etag:
+            self.previous_etag = self.etag
+            self.previous_keys = self.keys
+            self.etag = etag
+            self.keys = data
+        self.built = self.generation
+        SSHKeyIndex.objects.filter(pk=self.pk).update(
+            built=self.built, etag=self.etag, keys=self.keys,
+            previous_etag=self.previous_etag,
+            previous_keys=self.previous_keys)
+
+    def delta(self):
+        """
+        The keys added and removed since the previous list.
+        """
+        previous = set(map(tuple, json.loads(self.previous_keys)))
+        current = set(map(tuple, json.loads(self.keys)))
+        return {
+            'added': sorted(map(list, current - previous)),
+            'removed': sorted(map(list, previous - current)),
+        }
+
+
 def create_profile(sender, instance, **kwargs):
     """
     Create a profile object whenever a new user is created, also keeps the
@@ -1796,10 +2968,14 @@ def create_profile(sender, instance, **kwargs):
         pass
 
 
-def update_cluster_hash(sender, instance, **kwargs):
+def update_cluster_hash(sender, instance, created=False, **kwargs):
     """
     Updates the Cluster hash for all of it's VirtualMachines, Nodes, and Jobs
+
+    Nothing is updated unless the hash, and so the credentials, changed.
     """
+    if created or not instance.has_changed('hash'):
+        return
     instance.virtual_machines.all().update(cluster_hash=instance.hash)
     instance.jobs.all().update(cluster_hash=instance.hash)
     instance.nodes.all().update(cluster_hash=instance.hash)
@@ -1813,9 +2989,116 @@ def update_organization(sender, instance, **kwargs):
     org.name = instance.name
     org.save()
 
+def record_allocation(sender, instance, **kwargs):
+    """
+    Records what the node totals count of a VirtualMachine as it is loaded.
+
+    post_init is sent before CachedClusterObject loads info, which may
+    already save the VirtualMachine with new values.
+    """
+    if instance.pk is None:
+        instance._saved_allocation = None
+    else:
+        instance._saved_allocation = instance._allocation()
+
+
+def update_node_allocations(sender, instance, **kwargs):
+    """
+    Recounts the allocation totals of the nodes of a deleted VirtualMachine
+    """
+    saved = instance._saved_allocation or (None, None)
+    nodes = set(saved[:2] + instance._allocation()[:2])
+    nodes.discard(None)
+    if nodes:
+        Node.objects.update_allocations(nodes)
+
+
+def update_cluster_capacity(sender, instance, **kwargs):
+    """
+    Recounts the capacity snapshot of the cluster of a deleted Node or
+    VirtualMachine.
+
+    Only an existing snapshot is recounted. When the cluster itself is being
+    deleted its snapshot may already be gone, and must not be recreated.
+    """
+    ClusterCapacity.objects.recount(
+        ClusterCapacity.objects.filter(pk=instance.cluster_id).values('pk'))
+
+def update_ssh_key_indexes(sender, **kwargs):
+    """
+    Marks the SSH key indexes out of date when keys, users or group
+    memberships change.
+    """
+    if kwargs.get('action', 'post').startswith('pre'):
+        # m2m_changed is sent both before and after the change
+        return
+    try:
+        SSHKeyIndex.objects.invalidate()
+    except DatabaseError:
+        # XXX - since we're using south to track migrations the SSHKeyIndex
+        # table won't be available the first time syncdb is run.
+        pass
+
+
+def update_ssh_key_indexes_for_perms(sender, **kwargs):
+    """
+    Marks the SSH key indexes out of date when permissions on clusters or
+    virtual machines change.
+
+    Permissions are stored in models created by object_permissions when they
+    are registered, so every model is checked here. Rows are also deleted
+    along with their object, user or group, without the revoked signal.
+    """
+    if sender in (permission_map.get(Cluster),
+                  permission_map.get(VirtualMachine)):
+        update_ssh_key_indexes(sender, **kwargs)
+
 post_save.connect(create_profile, sender=User)
 post_save.connect(update_cluster_hash, sender=Cluster)
 post_save.connect(update_organization, sender=Group)
+post_init.connect(record_allocation, sender=VirtualMachine)
+post_delete.connect(update_node_allocations, sender=VirtualMachine)
+post_delete.connect(update_cluster_capacity, sender=VirtualMachine)
+post_delete.connect(update_cluster_capacity, sender=Node)
+
+# Overview dashboards show virtual machines and what users may see of them.
+post_save.connect(invalidate_dashboards, sender=VirtualMachine)
+post_delete.connect(invalidate_dashboards, sender=VirtualMachine)
+post_save.connect(invalidate_dashboards, sender=Cluster)
+post_delete.connect(invalidate_dashboards, sender=Cluster)
+post_save.connect(invalidate_dashboards, sender=Quota)
+post_delete.connect(invalidate_dashboards, sender=Quota)
+post_delete.connect(invalidate_dashboards, sender=User)
+post_save.connect(invalidate_dashboards, sender=Group)
+post_delete.connect(invalidate_dashboards, sender=Group)
+m2m_changed.connect(invalidate_dashboards, sender=User.groups.through)
+op_signals.granted.connect(invalidate_dashboards)
+op_signals.revoked.connect(invalidate_dashboards)
+
+# Search suggestions are made from the hostnames of these.
+post_save.connect(invalidate_hostnames, sender=VirtualMachine)
+post_delete.connect(invalidate_hostnames, sender=VirtualMachine)
+post_save.connect(invalidate_hostnames, sender=Node)
+post_delete.connect(invalidate_hostnames, sender=Node)
+post_save.connect(invalidate_hostnames, sender=Cluster)
+post_delete.connect(invalidate_hostnames, sender=Cluster)
+
+# Users and groups cache what they may access.
+post_save.connect(update_permission_sets, sender=User)
+post_save.connect(update_permission_sets, sender=Group)
+post_save.connect(update_permission_sets_for_perms)
+post_delete.connect(update_permission_sets_for_perms)
+m2m_changed.connect(update_permission_sets_for_groups,
+                    sender=User.groups.through)
+
+# Nodes fetch SSH keys of users with access to clusters and virtual machines.
+post_save.connect(update_ssh_key_indexes, sender=SSHKey)
+post_delete.connect(update_ssh_key_indexes, sender=SSHKey)
+post_save.connect(update_ssh_key_indexes, sender=User)
+post_delete.connect(update_ssh_key_indexes, sender=User)
+m2m_changed.connect(update_ssh_key_indexes, sender=User.groups.through)
+post_save.connect(update_ssh_key_indexes_for_perms)
+post_delete.connect(update_ssh_key_indexes_for_perms)
 
 # Disconnect create_default_site from django.contrib.sites so that
 #  the useless table for sites is not created. This will be
@@ -1875,6 +3158,10 @@ def refresh_objects(sender, **kwargs):
 
     Force a refresh of all Cluster, Nodes, and VirtualMachines, and
     import any new Nodes.
+
+    Each cluster is synchronized and refreshed with bulk RAPI calls, rather
+    than one call per object. Virtual machines are not imported here; that
+    happens when a cluster is added or refreshed from its page.
     """
 
     if kwargs.get('app', False) and kwargs['app'] == 'ganeti_web':
@@ -1892,25 +3179,12 @@ def refresh_objects(sender, **kwargs):
             flush()
 
         wf('- Refresh Cached Cluster Objects')
-        wf(' > Synchronizing Cluster Nodes ', True)
+        wf(' > Synchronizing and Refreshing Clusters ', True)
         flush()
         for cluster in Cluster.objects.all().iterator():
             try:
                 cluster.sync_nodes()
-                wf('.')
-            except GanetiApiError:
-                wf('E')
-
-        wf(' > Refreshing Node Caches ', True)
-        for node in Node.objects.all().iterator():
-            try:
-                wf('.')
-            except GanetiApiError:
-                wf('E')
-
-        wf(' > Refreshing Instance Caches ', True)
-        for instance in VirtualMachine.objects.all().iterator():
-            try:
+                cluster.refresh_all()
                 wf('.')
             except GanetiApiError:
                 wf('E')
@@ -36,6 +36,7 @@ function JobPoller() {
     this.SLOW = 60000;
     var get_xhr = undefined;
     var poller;
+    var source = undefined;
 
 
     this.init = function (url, new_cluster, new_callback, new_errback) {
@@ -49,6 +50,10 @@ function JobPoller() {
     // poll for active jobs.  This maintains the list of jobs that are being
     // actively queried for updates.  This will pull in new jobs started elsewhere
     this.poll = function (interval) {
+        if (source != undefined) {
+            // jobs are pushed by the stream
+            return;
+        }
         interval = interval==undefined ? poller.SLOW : interval;
         if (get_interval_speed != interval) {
             if (get_interval != undefined) {
@@ -60,6 +65,41 @@ function JobPoller() {
     };
 
 
+    // receive the list of active jobs from a stream of server-sent events
+    // instead of polling.  fallback is called to start polling if either the
+    // browser or the server can't stream.  state_callback, if given, is
+    // called when the state of the object changes after the first event.
+    this.stream = function (url, fallback, state_callback) {
+        if (window.EventSource == undefined) {
+            fallback();
+            return;
+        }
+
+        source = new EventSource(url);
+        source.addEventListener('jobs', function(event) {
+            process_get_jobs($.parseJSON(event.data));
+        }, false);
+
+        if (state_callback != undefined) {
+            var state = undefined;
+            source.addEventListener('state', function(event) {
+                if (state != undefined && state != event.data) {
+                    state_callback($.parseJSON(event.data));
+                }
+                state = event.data;
+            }, false);
+        }
+
+        source.onerror = function() {
+            // the browser reconnects by itself unless the stream was refused
+            if (source.readyState == EventSource.CLOSED) {
+                source = undefined;
+                fallback();
+            }
+        };
+    };
+
+
     // get list of active jobs
     this.get_jobs = function () {
         /* Run the AJAX call. if a call is pending, just skip this one */
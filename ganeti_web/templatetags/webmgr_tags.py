@@ -21,7 +21,6 @@
 from datetime import datetime
 import re
 
-from django.db.models import Count
 from django.template import Library, Node, TemplateSyntaxError
 from django.template.defaultfilters import stringfilter, filesizeformat
 from django.utils.safestring import mark_safe
@@ -343,7 +342,7 @@ def cluster_memory(cluster, allocated=True,tag=False):
     """
     Pretty-print a memory quantity of the whole cluster in a dynamic unit based on filesizeformat
     """
-    d = cluster.available_ram
+    d = cluster.get_capacity().ram
     size_tag = (filesizeformat(d["total"]*1024**2)).split(" ")[1]
     if tag == True:
 	return "[%s]" % size_tag
@@ -357,7 +356,7 @@ def cluster_disk(cluster, allocated=True,tag=False):
     """
     Pretty-print a memory quantity of the whole cluster in a dyanmic unit based on filesizeformat
     """
-    d = cluster.available_disk
+    d = cluster.get_capacity().disk
     size_tag = (filesizeformat(d["total"]*1024**2)).split(" ")[1]
     if tag == True:
 	return "[%s]" % (size_tag)
@@ -371,8 +370,8 @@ def format_running_vms(cluster):
     """
     Return number of VMs that are available and number of all VMs
     """
-    return "%d/%d" % (cluster.virtual_machines.filter(status="running").count(),
-                      cluster.virtual_machines.all().count())
+    capacity = cluster.get_capacity()
+    return "%d/%d" % (capacity.vms_running, capacity.vms_total)
 
 
 @register.simple_tag
@@ -380,14 +379,8 @@ def format_online_nodes(cluster):
     """
     Return number of nodes that are online and number of all nodes
     """
-    annotation = cluster.nodes.values('offline').annotate(count=Count('pk'))
-    offline = online = 0
-    for values in annotation:
-        if values['offline']:
-            offline = values['count']
-        else:
-            online = values['count']
-    return "%d/%d" % (online, offline+online)
+    capacity = cluster.get_capacity()
+    return "%d/%d" % (capacity.nodes_online, capacity.nodes_total)
 
 
 @register.tag
@@ -28,6 +28,8 @@ from ganeti_web.tests.importing_nodes import *
 from ganeti_web.tests.job import *
 from ganeti_web.tests.forms import *
 from ganeti_web.tests.models import *
+from ganeti_web.tests.refresh_cache import *
+from ganeti_web.tests.serializers import *
 from ganeti_web.tests.ssh_keys import *
 from ganeti_web.tests.tags import *
 from ganeti_web.tests.utilities import *
@@ -1,13 +1,19 @@
-from django.contrib.auth.models import AnonymousUser
+from datetime import datetime
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, Group, User
 from django.test import TestCase
 
+from ganeti_web.backend.autocomplete import visible_to
 from ganeti_web.backend.queries import (cluster_qs_for_user,
-                                        owner_qs_for_cluster)
-from ganeti_web.models import Cluster
+                                        owner_qs_for_cluster,
+                                        vm_qs_for_admins, vm_qs_for_users)
+from ganeti_web.models import Cluster, VirtualMachine
 
 __all__ = (
     "TestClusterQSForUser",
     "TestOwnerQSForCluster",
+    "TestPermissionSets",
 )
 
 class TestClusterQSForUser(TestCase):
@@ -33,3 +39,98 @@ class TestOwnerQSForCluster(TestCase):
     def test_owner_qs_for_cluster_none(self):
         qs = owner_qs_for_cluster(None)
         self.assertFalse(qs)
+
+
+class TestPermissionSets(TestCase):
+
+    def setUp(self):
+        settings.CACHE_REFRESH_ON_LOAD = False
+        self.addCleanup(setattr, settings, 'CACHE_REFRESH_ON_LOAD', True)
+        settings.PERMISSION_CACHE_TIMEOUT = 300
+        self.addCleanup(setattr, settings, 'PERMISSION_CACHE_TIMEOUT', 0)
+
+        self.cluster = Cluster.objects.create(hostname="example.org",
+                                              slug="example")
+        self.vm1 = VirtualMachine.objects.create(hostname="vm1.example.org",
+                                                 cluster=self.cluster)
+        self.vm2 = VirtualMachine.objects.create(hostname="vm2.example.org",
+                                                 cluster=self.cluster)
+        self.user = User.objects.create(username="tester")
+        self.group = Group.objects.create(name="testers")
+
+    def test_cached(self):
+        """
+        Permissions are looked up once, then served from the cache.
+        """
+        self.user.grant("admin", self.vm1)
+        self.assertEqual([self.vm1], list(vm_qs_for_users(self.user)))
+
+        # only the virtual machines are queried
+        with self.assertNumQueries(2):
+            self.assertEqual([self.vm1.pk], list(vm_qs_for_users(self.user)
+                                                 .values_list("pk", flat=True)))
+            self.assertFalse(vm_qs_for_admins(self.user)
+                             .exclude(pk=self.vm1.pk).exists())
+
+    def test_invalidation(self):
+        """
+        Grants, revocations and group memberships apply right away.
+        """
+        user, group = self.user, self.group
+        self.assertEqual([], list(vm_qs_for_users(user)))
+
+        user.grant("power", self.vm1)
+        self.assertEqual([self.vm1], list(vm_qs_for_users(user)))
+        self.assertEqual([], list(vm_qs_for_admins(user)))
+
+        # through groups
+        group.grant("admin", self.vm2)
+        group.user_set.add(user)
+        self.assertEqual(set([self.vm1, self.vm2]),
+                         set(vm_qs_for_users(user)))
+        self.assertEqual([self.vm2], list(vm_qs_for_admins(user)))
+
+        group.revoke("admin", self.vm2)
+        self.assertEqual([self.vm1], list(vm_qs_for_users(user)))
+        group.grant("admin", self.vm2)
+        user.groups.remove(group)
+        self.assertEqual([self.vm1], list(vm_qs_for_users(user)))
+        user.groups.add(group)
+        group.user_set.clear()
+        self.assertEqual([self.vm1], list(vm_qs_for_users(user)))
+
+        # rows deleted along with their objects
+        self.vm1.delete()
+        self.assertEqual([], list(vm_qs_for_users(user)))
+
+        # clusters are looked up directly, and only count the user's own
+        # permissions
+        self.cluster.username = "admin"
+        self.cluster.mtime = datetime.now()
+        self.cluster.save()
+        group.user_set.add(user)
+        group.grant("create_vm", self.cluster)
+        self.assertEqual([], list(cluster_qs_for_user(user)))
+        user.grant("create_vm", self.cluster)
+        self.assertEqual([self.cluster], list(cluster_qs_for_user(user)))
+
+    def test_visible_to(self):
+        """
+        Search suggestions are filtered by the cached permissions, without
+        querying the database.
+        """
+        user = self.user
+        user.grant("power", self.vm1)
+        self.group.grant("admin", self.cluster)
+        self.group.user_set.add(user)
+        visible_to(user)
+
+        vm1 = ("vm", self.vm1.pk, self.cluster.pk, self.vm1.hostname)
+        cluster = ("cluster", self.cluster.pk, self.cluster.pk,
+                   self.cluster.hostname)
+        other = ("vm", 0, 0, "other.example.org")
+        with self.assertNumQueries(0):
+            visible = visible_to(user)
+            self.assertTrue(visible(vm1))
+            self.assertTrue(visible(cluster))
+            self.assertFalse(visible(other))
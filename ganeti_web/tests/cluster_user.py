@@ -20,6 +20,7 @@ from django.contrib.auth.models import User, Group
 from django.test import TestCase
 
 from ganeti_web.util.proxy import RapiProxy
+from ganeti_web.views.user_search import search_cluster_users
 from ganeti_web import models
 VirtualMachine = models.VirtualMachine
 Cluster = models.Cluster
@@ -181,3 +182,32 @@ class TestClusterUser(TestCase):
         self.assertEqual(result["disk"], 12)
         self.assertEqual(result["ram"], 1)
         self.assertEqual(result["virtual_cpus"], 3)
+
+    def test_search(self):
+        """
+        Users and groups are searched together by name, ranked, and labelled
+        without loading each one.
+        """
+        for name in ('bobby', 'bob2', 'alice'):
+            User(username=name).save()
+        for name in ('Bob', 'bob-admins'):
+            Group(name=name).save()
+        bob = Organization.objects.get(name='Bob')
+
+        # exact matches first, then in order of name
+        results = search_cluster_users('bob')['results']
+        self.assertEqual([('Bob', 'group', bob.pk)], results[:1])
+        self.assertEqual([('bob-admins', 'group'), ('bob2', 'user'),
+                          ('bobby', 'user')],
+                         [r[:2] for r in results[1:]])
+
+        # the same two queries however many accounts match
+        with self.assertNumQueries(2):
+            results = search_cluster_users('bo', limit=3)['results']
+        self.assertEqual(['Bob', 'bob-admins', 'bob2'],
+                         [r[0] for r in results])
+        self.assertEqual(5, len(search_cluster_users()['results']))
+
+        # by primary key
+        self.assertEqual({'query': 'Bob', 'results': [('Bob', 'group', bob.pk)]},
+                         search_cluster_users(pk=str(bob.pk)))
@@ -37,6 +37,7 @@ class MockCluster(object):
                 "vcpus": 1,
             },
         },
+        "hvparams": {},
         "software_version": "2.6.0",
         "ipolicy": {
             "max": {
@@ -50,8 +51,11 @@ class MockCluster(object):
         },
     }
 
+    mtime = None
     rapi = MockRapi()
 
+    def get_snapshot(self):
+        return Cluster.build_snapshot.im_func(self)
 
 
 class TestVMWizardBasicsForm(TestCase):
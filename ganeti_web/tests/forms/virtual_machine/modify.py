@@ -12,7 +12,7 @@ from ganeti_web.forms.virtual_machine import (HvmModifyVirtualMachineForm,
     ModifyVirtualMachineForm)
 from ganeti_web.util.client import GanetiRapiClient
 from ganeti_web.util.proxy.constants import (INFO, INSTANCE, NODE, NODES,
-                                             XEN_INFO, XEN_HVM_INSTANCE,
+                                             NODES_BULK, XEN_INFO, XEN_HVM_INSTANCE,
                                              XEN_PVM_INSTANCE,
                                              OPERATING_SYSTEMS,
                                              XEN_OPERATING_SYSTEMS)
@@ -146,7 +146,8 @@ class TestKvmModifyVirtualMachineForm(TestModifyVirtualMachineForm):
 
     def setUp(self):
         self.patches = (
-            (self.rapi, 'GetNodes', lambda x:NODES),
+            (self.rapi, 'GetNodes',
+                lambda x, bulk=False: NODES_BULK if bulk else NODES),
             (self.rapi, 'GetInfo', lambda x:INFO),
             (self.rapi, 'GetNode', lambda y,x:NODE),
             (self.rapi, 'GetOperatingSystems', lambda x:OPERATING_SYSTEMS),
@@ -226,7 +227,8 @@ class TestHvmModifyVirtualMachineForm(TestModifyVirtualMachineForm):
 
     def setUp(self):
         self.patches = (
-            (self.rapi, 'GetNodes', lambda x:NODES),
+            (self.rapi, 'GetNodes',
+                lambda x, bulk=False: NODES_BULK if bulk else NODES),
             (self.rapi, 'GetNode', lambda y,x:NODE),
             (self.rapi, 'GetInfo', lambda x:XEN_INFO),
             (self.rapi, 'GetOperatingSystems', lambda x:XEN_OPERATING_SYSTEMS),
@@ -306,7 +308,8 @@ class TestPvmModifyVirtualMachineForm(TestModifyVirtualMachineForm):
 
     def setUp(self):
         self.patches = (
-            (self.rapi, 'GetNodes', lambda x:NODES),
+            (self.rapi, 'GetNodes',
+                lambda x, bulk=False: NODES_BULK if bulk else NODES),
             (self.rapi, 'GetNode', lambda x,y:NODE),
             (self.rapi, 'GetInfo', lambda x:XEN_INFO),
             (self.rapi, 'GetOperatingSystems', lambda x:XEN_OPERATING_SYSTEMS),
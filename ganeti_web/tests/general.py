@@ -17,6 +17,7 @@
 
 from django.conf import settings
 from django.contrib.auth.models import User, Group
+from django.db import connection
 from django.test import TestCase
 from django.test.client import Client
 # Per #6579, do not change this import without discussion.
@@ -160,6 +161,124 @@ class TestGeneralViews(TestCase, ViewTestMixin):
         self.assertEqual(2, response.context["missing"])
         self.assertEqual(4, response.context["import_ready"])
 
+    def test_view_overview_cache(self):
+        """
+        Tests that the dashboard of the overview page is cached per user
+
+        Verifies:
+            * running and total VMs are counted per cluster
+            * a cached dashboard doesn't list VMs from Ganeti again
+            * changing a VM or permissions drops the cached dashboard
+        """
+        vm.status = 'running'
+        vm.save()
+        VirtualMachine.objects.create(hostname='vm2.example.bak',
+                                      cluster=cluster)
+        self.assertTrue(c.login(username=user1.username, password='secret'))
+
+        # objects refreshing themselves from Ganeti drop the cache too
+        settings.CACHE_REFRESH_ON_LOAD = False
+        self.addCleanup(setattr, settings, 'CACHE_REFRESH_ON_LOAD', True)
+
+        response = c.get('/')
+        self.assertEqual(200, response.status_code)
+        summary = response.context['vm_summary'][cluster.hostname]
+        self.assertEqual((1, 1), (summary['running'], summary['total']))
+        GetInstances = cluster.rapi.GetInstances
+        self.assertTrue(GetInstances.calls)
+
+        # cached
+        GetInstances.reset()
+        response = c.get('/')
+        self.assertEqual(200, response.status_code)
+        GetInstances.assertNotCalled(self)
+        self.assertEqual(2, response.context['orphaned'])
+
+        # changing a VM drops the cache
+        vm.owner = user1.get_profile()
+        vm.save()
+        response = c.get('/')
+        GetInstances.assertCalled(self)
+        self.assertEqual(1, response.context['orphaned'])
+        resources = response.context['resources']
+        self.assertEqual(1, resources[cluster]['total'])
+        self.assertEqual(1, resources[cluster]['running'])
+
+        # revoking permissions drops the cache
+        user1.revoke_all(cluster)
+        response = c.get('/')
+        self.assertEqual(0, len(response.context['cluster_list']))
+        self.assertFalse(response.context['admin'])
+
+    def test_view_errors(self):
+        """
+        The errors page pages through errors and failed jobs together,
+        newest first, and filters them by cluster and cleared state.
+        """
+        settings.CACHE_REFRESH_ON_LOAD = False
+        self.addCleanup(setattr, settings, 'CACHE_REFRESH_ON_LOAD', True)
+
+        cluster1 = Cluster(hostname='cluster1', slug='cluster1')
+        cluster1.save()
+        vm1 = VirtualMachine(hostname='vm2.example.bak', cluster=cluster1)
+        vm1.save()
+
+        error = models.GanetiError.objects.create
+        e0 = error(cluster=cluster, obj=vm, msg='e0', cleared=True,
+                   timestamp='2011-01-01 10:00')
+        e1 = error(cluster=cluster1, obj=cluster1, msg='e1',
+                   timestamp='2011-01-03 10:00')
+        e2 = error(cluster=cluster, obj=cluster, msg='e2',
+                   timestamp='2011-01-05 10:00')
+        j0 = Job.objects.create(job_id=1, obj=vm, cluster=cluster,
+                                finished='2011-01-02 10:00', status='error')
+        j1 = Job.objects.create(job_id=2, obj=vm1, cluster=cluster1,
+                                finished='2011-01-05 10:00', status='error')
+        Job.objects.create(job_id=3, obj=vm, cluster=cluster,
+                           finished='2011-01-06 10:00', status='success')
+        feed = [(False, j1), (True, e2), (True, e1), (False, j0), (True, e0)]
+
+        url = '/clusters/errors'
+        self.assertTrue(c.login(username=user2.username, password='secret'))
+
+        errors = []
+        pages = 0
+        next_url = url + '?count=2'
+        while next_url:
+            response = c.get(next_url)
+            self.assertEqual(200, response.status_code)
+            self.assertTemplateUsed(response, 'ganeti/errors.html')
+            errors.extend(response.context['errors'])
+            next_url = response.context['next_url']
+            pages += 1
+        self.assertEqual(feed, errors)
+        self.assertEqual(3, pages)
+
+        response = c.get(url, {'count': 2, 'cursor': 'forged'})
+        self.assertEqual(404, response.status_code)
+
+        # page sizes are kept between one and ten pages
+        response = c.get(url, {'count': 0})
+        self.assertEqual(feed[:1], response.context['errors'])
+        response = c.get(url, {'count': -2})
+        self.assertEqual(feed[:1], response.context['errors'])
+        response = c.get(url, {'count': 10 ** 9})
+        self.assertEqual(feed, response.context['errors'])
+
+        # filters
+        response = c.get(url, {'cluster': 'cluster1'})
+        self.assertEqual([(False, j1), (True, e1)], response.context['errors'])
+        response = c.get(url, {'cleared': '1'})
+        self.assertEqual([(True, e0)], response.context['errors'])
+        response = c.get(url, {'cleared': '0'})
+        self.assertEqual(feed[:-1], response.context['errors'])
+
+        # users only see errors of what they administer
+        self.assertTrue(c.login(username=user1.username, password='secret'))
+        response = c.get(url)
+        self.assertEqual([(True, e2), (False, j0), (True, e0)],
+                         response.context['errors'])
+
     def test_used_resources(self):
         """ tests the used_resources view """
 
@@ -266,3 +385,108 @@ class TestGeneralViews(TestCase, ViewTestMixin):
         self.assertContains(response, "test@test", count=1)
         self.assertContains(response, "asd@asd", count=1)
         self.assertContains(response, "foo@bar", count=1)
+
+    def test_view_ssh_keys_etag(self):
+        """
+        Tests conditional and delta requests for sshkeys
+
+        Verifies:
+            * lists carry an ETag, and a matching If-None-Match gets a 304
+            * a 304 doesn't check any permissions
+            * a delta has only the keys added and removed since
+            * a delta from an unknown list gets the whole list
+        """
+        SSHKey.objects.create(key="ssh-rsa test test@test", user=user)
+        user.grant("admin", vm)
+        key = settings.WEB_MGR_API_KEY
+        url = '/keys/%s/' % key
+
+        response = c.get(url)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([["ssh-rsa test test@test", user.username]],
+                         json.loads(response.content))
+        etag = response["ETag"]
+
+        connection.use_debug_cursor = True
+        try:
+            response = c.get(url, HTTP_IF_NONE_MATCH=etag)
+        finally:
+            connection.use_debug_cursor = False
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(etag, response["ETag"])
+        # looking up the index is the only query
+        self.assertEqual(1, len(connection.queries))
+
+        # adding a key and revoking a user's permissions
+        SSHKey.objects.create(key="ssh-dsa test foo@bar", user=user1)
+        user.revoke_all(vm)
+        response = c.get(url, {'delta': 1}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual({
+            "added": [["ssh-dsa test foo@bar", user1.username]],
+            "removed": [["ssh-rsa test test@test", user.username]],
+        }, json.loads(response.content))
+        self.assertNotEqual(etag, response["ETag"])
+
+        response = c.get(url, {'delta': 1}, HTTP_IF_NONE_MATCH='"unknown"')
+        self.assertEqual([["ssh-dsa test foo@bar", user1.username]],
+                         json.loads(response.content))
+
+        # cluster and virtual machine lists are separate
+        response = c.get('/cluster/%s/keys/%s/' % (cluster.slug, key),
+                         HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+        user1.revoke_all(vm)
+        response = c.get('/cluster/%s/%s/keys/%s/'
+                         % (cluster.slug, vm.hostname, key))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([], json.loads(response.content))
+
+    def test_view_search_suggestions(self):
+        """
+        Search suggestions are the objects the user may see whose hostnames
+        start with the search term.
+        """
+        url = '/search/suggestions.json'
+
+        def suggestions(term):
+            response = c.get(url, {'term': term})
+            self.assertEqual(200, response.status_code)
+            return json.loads(response.content)
+
+        # users with no perms see nothing
+        self.assertTrue(c.login(username=user.username, password='secret'))
+        self.assertEqual([], suggestions('vm1'))
+        self.assertEqual([], suggestions('test'))
+
+        # users with perms, in any case
+        self.assertTrue(c.login(username=user1.username, password='secret'))
+        self.assertEqual([{'value': 'vm1.example.bak', 'type': 'vm'}],
+                         suggestions('VM1.ex'))
+        self.assertEqual([{'value': 'test.example.test', 'type': 'cluster'}],
+                         suggestions('test'))
+        self.assertEqual([], suggestions('example'))
+
+        # new and renamed objects are suggested right away
+        vm2 = VirtualMachine.objects.create(hostname='vm2.example.bak',
+                                            cluster=cluster)
+        vm.hostname = 'renamed.example.bak'
+        vm.save()
+        self.assertEqual([{'value': 'vm2.example.bak', 'type': 'vm'}],
+                         suggestions('vm'))
+        self.assertEqual([{'value': 'renamed.example.bak', 'type': 'vm'}],
+                         suggestions('ren'))
+
+        # superusers see everything, up to the limit
+        self.assertTrue(c.login(username=user2.username, password='secret'))
+        vm2.delete()
+        self.assertEqual(['renamed.example.bak', 'test.example.test'],
+                         [s['value'] for s in suggestions('')])
+        self.addCleanup(setattr, settings, 'AUTOCOMPLETE_LIMIT',
+                        getattr(settings, 'AUTOCOMPLETE_LIMIT', 10))
+        settings.AUTOCOMPLETE_LIMIT = 1
+        self.assertEqual(['renamed.example.bak'],
+                         [s['value'] for s in suggestions('')])
+
+        # no term, no suggestions
+        self.assertEqual([], json.loads(c.get(url).content))
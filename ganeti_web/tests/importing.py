@@ -20,6 +20,7 @@ from django.contrib.auth.models import User, Group
 from django.test import TestCase
 from django.test.client import Client
 
+from ganeti_web.util.client import GanetiApiError
 from ganeti_web.util.proxy import RapiProxy, CallProxy
 from ganeti_web import models
 Cluster = models.Cluster
@@ -141,6 +142,10 @@ class ImportViews(TestCase):
         self.assertTemplateUsed(response, 'ganeti/importing/orphans.html')
         self.assertFalse(response.context['form'].errors)
         self.assertEqual([], response.context['vms'])
+        vm0 = VirtualMachine.objects.get(pk=self.vm0.pk)
+        self.assertEqual(self.owner.pk, vm0.owner_id)
+        # the cluster has no credentials to tag vms with
+        self.assertFalse(vm0.owner_tag_pending)
 
     def test_missing_ganeti(self):
         """
@@ -206,6 +211,30 @@ class ImportViews(TestCase):
         self.assertFalse(response.context['form'].errors)
         self.assertEqual([], response.context['vms'])
 
+    def test_missing_db_unreachable(self):
+        """
+        Clusters that can't be contacted are reported, and don't stop the
+        other clusters from being listed
+        """
+        url = '/import/missing_db/'
+        self.cluster0.rapi.GetInstances.response = ['vm0','vm2']
+        self.cluster1.rapi.GetInstances.error = GanetiApiError('down')
+
+        self.user.is_superuser = True
+        self.user.save()
+        self.assertTrue(self.c.login(username=self.user.username,
+                                     password='secret'))
+        try:
+            response = self.c.get(url)
+        finally:
+            # rapi clients are cached and shared with the other tests
+            self.cluster1.rapi.GetInstances.error = False
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([('1:vm2','test0','vm2')], response.context['vms'])
+        unreachable = response.context['unreachable']
+        self.assertEqual([self.cluster1], [c for c, e in unreachable])
+        self.assertContains(response, 'Could not contact test1')
+
     def test_missing_db(self):
         """
         Tests view for Virtual Machines missing from database
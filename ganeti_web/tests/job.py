@@ -15,14 +15,22 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
 # USA.
 
+from threading import Event
+import time
+
+from django.conf import settings
 from django.test import TestCase
 from django.test.client import Client
 
 from django_test_tools.views import ViewTestMixin
 from django_test_tools.users import UserTestMixin
 
+from ganeti_web.backend.events import job_feed, stream, vm_state_feed
+from ganeti_web.backend.jobs import JobWatcher
+from ganeti_web.util.client import GanetiApiError, JOB_STATUS_FIELDS
 from ganeti_web.util.proxy import RapiProxy, CallProxy
-from ganeti_web.util.proxy.constants import JOB, JOB_RUNNING, JOB_ERROR
+from ganeti_web.util.proxy.constants import (JOB, JOB_RUNNING, JOB_ERROR,
+                                             job_query)
 from ganeti_web import models
 from ganeti_web.tests.views.virtual_machine.base import VirtualMachineTestCaseMixin
 
@@ -179,6 +187,306 @@ class TestJobModel(TestJobMixin, TestCase):
         job._refresh.assertNotCalled(self)
 
 
+class TestJobWatcher(TestJobMixin, TestCase):
+
+    def setUp(self):
+        super(TestJobWatcher, self).setUp()
+        settings.CACHE_REFRESH_ON_LOAD = False
+
+        self.job = Job.objects.create(job_id=1, obj=self.vm,
+                                      cluster=self.cluster)
+        self.vm.last_job = self.job
+        self.vm.ignore_cache = True
+        self.vm.save()
+        self.rapi = self.cluster.rapi
+
+    def tearDown(self):
+        super(TestJobWatcher, self).tearDown()
+        settings.CACHE_REFRESH_ON_LOAD = True
+        # the rapi proxy is shared by every test using this cluster
+        models.clear_rapi_cache()
+
+    def test_running(self):
+        """
+        Jobs that are still running are left alone, and their last status is
+        passed back to ganeti on the next wait.
+        """
+        self.rapi.WaitForJobChange.response = {
+            'job_info': ['running'],
+            'log_entries': [[4, [0, 0], 'message', 'copying disks']],
+        }
+
+        watcher = JobWatcher()
+        self.assertEqual([], watcher.poll())
+        self.rapi.WaitForJobChange.assertCalled(self, 1, ['status'], None,
+                                                None, timeout=15)
+        self.rapi.GetJobStatus.assertNotCalled(self)
+
+        # the progress of the job was stored
+        self.assertEqual(1, len(self.rapi.Query.calls))
+        self.assertEqual('running', Job.objects.get(pk=self.job.pk).status)
+
+        self.rapi.Query.reset()
+        self.rapi.WaitForJobChange.response = None
+        self.assertEqual([], watcher.poll())
+        self.rapi.WaitForJobChange.assertCalled(self, 1, ['status'],
+                                                ['running'], 4, timeout=15)
+        self.rapi.Query.assertNotCalled(self)
+        self.assertTrue(Job.objects.get(pk=self.job.pk).ignore_cache)
+
+    def test_finished(self):
+        """
+        Finished jobs are recorded, and the object they ran on is updated
+        without asking ganeti about the job a second time.
+        """
+        self.rapi.WaitForJobChange.response = {
+            'job_info': ['success'],
+            'log_entries': [],
+        }
+        self.rapi.Query.response = job_query(JOB)
+
+        self.assertEqual([self.job.pk], JobWatcher().poll())
+        self.assertEqual(1, len(self.rapi.Query.calls))
+        self.rapi.GetJobStatus.assertNotCalled(self)
+
+        job = Job.objects.get(pk=self.job.pk)
+        self.assertEqual('success', job.status)
+        self.assertFalse(job.ignore_cache)
+        vm = VirtualMachine.objects.get(pk=self.vm.pk)
+        self.assertEqual(None, vm.last_job_id)
+        self.assertFalse(vm.ignore_cache)
+
+        # nothing is left to watch
+        self.rapi.WaitForJobChange.reset()
+        self.assertEqual([], JobWatcher().poll())
+        self.rapi.WaitForJobChange.assertNotCalled(self)
+
+    def test_archived(self):
+        """
+        Jobs that disappeared from ganeti are marked unknown and no longer
+        watched.
+        """
+        self.rapi.WaitForJobChange.error = GanetiApiError('404', code=404)
+        self.rapi.Query.response = job_query()
+
+        self.assertEqual([self.job.pk], JobWatcher().poll())
+        job = Job.objects.get(pk=self.job.pk)
+        self.assertEqual('unknown', job.status)
+        self.assertFalse(job.ignore_cache)
+        self.assertEqual(None,
+                         VirtualMachine.objects.get(pk=self.vm.pk).last_job_id)
+
+    def test_finished_not_stored(self):
+        """
+        A finished job whose final status could not be stored stays watched,
+        and is completed once storing it succeeds.
+        """
+        self.rapi.WaitForJobChange.response = {
+            'job_info': ['success'],
+            'log_entries': [],
+        }
+        self.rapi.Query.error = GanetiApiError('500', code=500)
+
+        watcher = JobWatcher()
+        watcher.retry_delay = 0
+        self.assertEqual([], watcher.poll())
+        job = Job.objects.get(pk=self.job.pk)
+        self.assertEqual('', job.status)
+        self.assertTrue(job.ignore_cache)
+        self.assertEqual(self.job.pk,
+                         VirtualMachine.objects.get(pk=self.vm.pk).last_job_id)
+        self.assertEqual(set([self.job.pk]), watcher.finishing)
+        self.assertTrue(self.job.pk in watcher.seen)
+
+        # storing is retried without waiting on the job again
+        self.rapi.WaitForJobChange.reset()
+        self.rapi.Query.error = None
+        self.rapi.Query.response = job_query(JOB)
+        self.assertEqual([self.job.pk], watcher.poll())
+        self.rapi.WaitForJobChange.assertNotCalled(self)
+
+        job = Job.objects.get(pk=self.job.pk)
+        self.assertEqual('success', job.status)
+        self.assertFalse(job.ignore_cache)
+        self.assertEqual(None,
+                         VirtualMachine.objects.get(pk=self.vm.pk).last_job_id)
+        self.assertEqual(set(), watcher.finishing)
+
+    def test_finished_while_others_pending(self):
+        """
+        A job that finishes is completed right away, without waiting for
+        the polls of jobs that are still running.
+        """
+        other = Job.objects.create(job_id=2, obj=self.vm,
+                                   cluster=self.cluster)
+        release = Event()
+        self.addCleanup(release.set)
+        calls = []
+
+        def wait_for_job_change(job_id, fields, previous, log_serial,
+                                timeout=None):
+            calls.append(job_id)
+            if job_id == 2:
+                # still running, until Ganeti gives up waiting
+                release.wait(10)
+                return None
+            return {'job_info': ['success'], 'log_entries': []}
+
+        self.rapi.WaitForJobChange = wait_for_job_change
+        self.rapi.Query.response = job_query(JOB, dict(JOB_RUNNING, id='2'))
+
+        watcher = JobWatcher()
+        started = time.time()
+        self.assertEqual([self.job.pk], watcher.poll())
+        self.assertTrue(time.time() - started < 5)
+        self.assertFalse(Job.objects.get(pk=self.job.pk).ignore_cache)
+        self.assertTrue(Job.objects.get(pk=other.pk).ignore_cache)
+        self.assertEqual([other.pk], watcher.watching.keys())
+
+        # the other job is watched again once its poll returns
+        release.set()
+        self.assertEqual([], watcher.poll())
+        self.assertEqual(1, calls.count(2))
+        self.assertEqual({}, watcher.watching)
+        self.assertEqual([], watcher.poll())
+        self.assertEqual(2, calls.count(2))
+
+
+class TestRefreshPending(TestJobMixin, TestCase):
+
+    def setUp(self):
+        super(TestRefreshPending, self).setUp()
+        settings.CACHE_REFRESH_ON_LOAD = False
+
+        self.rapi = self.cluster.rapi
+        self.jobs = [Job.objects.create(job_id=i, obj=self.vm,
+                                        cluster=self.cluster)
+                     for i in (1, 2, 3)]
+
+    def tearDown(self):
+        super(TestRefreshPending, self).tearDown()
+        settings.CACHE_REFRESH_ON_LOAD = True
+        # the rapi proxy is shared by every test using this cluster
+        models.clear_rapi_cache()
+
+    def test_get_job_statuses(self):
+        """
+        Jobs are fetched with a single query filtered by job id. Jobs with
+        missing fields are left out.
+        """
+        missing = job_query(dict(JOB_ERROR, id='3'))
+        missing['data'][0][1] = [2, None]
+        query = job_query(JOB, dict(JOB_RUNNING, id='2'))
+        query['data'] += missing['data']
+        self.rapi.Query.response = query
+
+        statuses = self.rapi.GetJobStatuses([1, 2, 3])
+        self.rapi.Query.assertCalled(self, 'job', JOB_STATUS_FIELDS,
+                                     ['|', ['=', 'id', 1], ['=', 'id', 2],
+                                      ['=', 'id', 3]])
+        self.assertEqual([1, 2], sorted(statuses))
+        self.assertEqual(JOB, statuses[1])
+        self.assertEqual('running', statuses[2]['status'])
+
+    def test_get_job_statuses_empty(self):
+        """
+        Ganeti is not asked about an empty list of jobs.
+        """
+        self.assertEqual({}, self.rapi.GetJobStatuses([]))
+        self.rapi.Query.assertNotCalled(self)
+
+    def test_refresh_pending(self):
+        """
+        All pending jobs of a cluster are refreshed with a single query. Jobs
+        ganeti no longer knows about are marked unknown.
+        """
+        self.rapi.Query.response = job_query(JOB, dict(JOB_RUNNING, id='2'))
+
+        finished = Job.objects.refresh_pending(self.cluster)
+        self.assertEqual(sorted([self.jobs[0].pk, self.jobs[2].pk]),
+                         sorted(job.pk for job in finished))
+        self.assertEqual(1, len(self.rapi.Query.calls))
+        self.rapi.GetJobStatus.assertNotCalled(self)
+
+        statuses = dict(Job.objects.values_list('job_id', 'status'))
+        self.assertEqual({1: 'success', 2: 'running', 3: 'unknown'}, statuses)
+        self.assertEqual([2], list(Job.objects.filter(ignore_cache=True)
+                                   .values_list('job_id', flat=True)))
+
+        # finished jobs are not queried again
+        self.rapi.Query.reset()
+        Job.objects.refresh_pending(self.cluster)
+        self.rapi.Query.assertCalled(self, 'job', JOB_STATUS_FIELDS,
+                                     ['|', ['=', 'id', 2]])
+
+    def test_refresh_pending_without_query(self):
+        """
+        Clusters which can't query jobs are asked about each job in turn.
+        """
+        self.rapi.Query.error = GanetiApiError('404', code=404)
+        self.rapi.GetJobStatus.response = JOB
+
+        finished = Job.objects.refresh_pending(self.cluster)
+        self.assertEqual(3, len(finished))
+        self.assertEqual(3, len(self.rapi.GetJobStatus.calls))
+        self.assertFalse(Job.objects.filter(ignore_cache=True).exists())
+
+        # any rejection of the query resource falls back the same way
+        Job.objects.update(ignore_cache=True)
+        self.rapi.Query.error = GanetiApiError('501', code=501)
+        self.assertEqual(3, len(Job.objects.refresh_pending(self.cluster)))
+
+    def test_refresh_pending_failed(self):
+        """
+        A cluster that fails to answer is told apart from one whose jobs are
+        all still running, and nothing is stored.
+        """
+        self.rapi.Query.error = GanetiApiError('500', code=500)
+
+        self.assertEqual(None, Job.objects.refresh_pending(self.cluster))
+        self.rapi.GetJobStatus.assertNotCalled(self)
+        self.assertEqual(3, Job.objects.filter(ignore_cache=True).count())
+
+
+class TestEventStream(TestJobMixin, TestCase):
+
+    def setUp(self):
+        super(TestEventStream, self).setUp()
+
+        self.job = Job.objects.create(job_id=1, obj=self.vm,
+                                      cluster=self.cluster)
+        self.job.info = JOB_RUNNING
+        self.job.save()
+        self.feeds = {'jobs': job_feed(VirtualMachine, self.vm.pk),
+                      'state': vm_state_feed(self.vm.pk)}
+
+    def test_initial_events(self):
+        """
+        Every feed is sent when the stream starts.
+        """
+        events = list(stream(self.feeds, interval=0, duration=0))
+        self.assertEqual(3, len(events))
+        self.assertTrue(events[0].startswith('retry: '))
+        self.assertTrue('event: jobs\ndata: [{' in ''.join(events))
+        self.assertTrue('"status": "running"' in ''.join(events))
+        self.assertTrue('event: state\ndata: {' in ''.join(events))
+
+    def test_changes(self):
+        """
+        Events are only sent for feeds that changed.
+        """
+        events = stream(self.feeds, interval=0)
+        for i in range(3):
+            events.next()
+
+        self.job.info = JOB
+        self.job.save()
+        self.assertEqual('event: jobs\ndata: []\n\n', events.next())
+
+        VirtualMachine.objects.filter(pk=self.vm.pk).delete()
+        self.assertEqual('event: state\ndata: null\n\n', events.next())
+
+
 class TestJobViews(TestJobMixin, TestCase, UserTestMixin, ViewTestMixin):
 
     def setUp(self):
@@ -352,3 +660,25 @@ class TestJobViews(TestJobMixin, TestCase, UserTestMixin, ViewTestMixin):
         self.assert_standard_fails(url, args, authorized=False)
         self.assert_200(url, args, users=[self.superuser, self.cluster_admin],
                         template='ganeti/job/detail.html')
+
+    def test_job_stream(self):
+        """
+        Job streams are refused unless enabled, which makes pages poll.
+        """
+        url = '/vm/%s/jobs/stream/' % self.vm.pk
+        self.assertTrue(self.c.login(username=self.user.username,
+                                     password='secret'))
+
+        response = self.c.get(url)
+        self.assertEqual(204, response.status_code)
+
+        settings.EVENT_STREAMS = True
+        settings.EVENT_STREAM_DURATION = 0
+        try:
+            response = self.c.get(url)
+        finally:
+            settings.EVENT_STREAMS = False
+            del settings.EVENT_STREAM_DURATION
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('text/event-stream', response['content-type'])
+        self.assertTrue('event: jobs\ndata: []' in response.content)
@@ -18,7 +18,9 @@
 
 from datetime import datetime
 
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.db import connection
 from django.test import TestCase
 
 from ganeti_web.util.proxy import RapiProxy
@@ -82,6 +84,50 @@ class TestClusterModel(TestCase):
 
         cluster.delete()
 
+    def test_refresh_changed_fields(self):
+        """
+        Test that refreshing a cluster only writes the fields that changed
+
+        Verifies:
+            * only changed columns are updated
+            * the hash of objects isn't updated unless credentials change
+            * unchanged objects are not written at all
+        """
+        cluster = Cluster.objects.create(hostname='foo.fake.hostname')
+        vm = VirtualMachine.objects.create(cluster=cluster,
+                                           hostname='vm1.example.bak')
+        VirtualMachine.objects.filter(pk=vm.pk).update(cluster_hash='stale')
+        Cluster.objects.filter(pk=cluster.pk).update(mtime=None)
+
+        # refresh explicitly, rather than when loading
+        settings.CACHE_REFRESH_ON_LOAD = False
+        self.addCleanup(setattr, settings, 'CACHE_REFRESH_ON_LOAD', True)
+        cluster = Cluster.objects.get(pk=cluster.pk)
+        self.assertEqual({}, cluster.changed_fields())
+        connection.use_debug_cursor = True
+        try:
+            cluster.refresh()
+        finally:
+            connection.use_debug_cursor = False
+        self.assertTrue(Cluster.objects.get(pk=cluster.pk).mtime)
+        updates = [q['sql'] for q in connection.queries
+                   if q['sql'].startswith('UPDATE "ganeti_web_cluster"')]
+        self.assertEqual(1, len(updates))
+        self.assertTrue('"mtime"' in updates[0])
+        self.assertFalse('"hostname"' in updates[0])
+        self.assertEqual('stale', VirtualMachine.objects.get(pk=vm.pk)
+                                  .cluster_hash)
+
+        with self.assertNumQueries(0):
+            cluster.save(changed_only=True)
+
+        cluster.username = 'tester'
+        cluster.save(changed_only=True)
+        self.assertEqual(cluster.hash, VirtualMachine.objects.get(pk=vm.pk)
+                                       .cluster_hash)
+
+        cluster.delete()
+
     def test_get_quota(self):
         """
         Tests cluster.get_quota() method
@@ -168,8 +214,8 @@ class TestClusterModel(TestCase):
         """
         cluster = Cluster(hostname='ganeti.example.test')
         cluster.save()
-        vm_missing = 'gimager.example.bak'
-        vm_current = VirtualMachine(cluster=cluster, hostname='gimager2.example.bak')
+        vm_missing = 'vm1.example.bak'
+        vm_current = VirtualMachine(cluster=cluster, hostname='vm2.example.bak')
         vm_removed = VirtualMachine(cluster=cluster, hostname='does.not.exist.org')
         vm_current.save()
         vm_removed.save()
@@ -220,6 +266,151 @@ class TestClusterModel(TestCase):
         node_removed.delete()
         cluster.delete()
 
+    def test_sync_imports_in_bulk(self):
+        """
+        Tests that synchronizing imports missing objects with bulk calls
+
+        Verifies:
+            * nodes and vms are listed with a single bulk call each
+            * they are imported with their info, without per-object calls
+            * vms are related to their nodes
+            * node allocations and the capacity snapshot are counted
+        """
+        cluster = Cluster.objects.create(hostname='ganeti.example.test')
+        cluster.rapi.GetNode.reset()
+        cluster.rapi.GetInstance.reset()
+
+        cluster.sync_nodes()
+        cluster.sync_virtual_machines()
+
+        cluster.rapi.GetNodes.assertCalled(self, bulk=True)
+        cluster.rapi.GetInstances.assertCalled(self, bulk=True)
+        cluster.rapi.GetNode.assertNotCalled(self)
+        cluster.rapi.GetInstance.assertNotCalled(self)
+
+        node = Node.objects.get(cluster=cluster, hostname='gtest3.example.bak')
+        self.assertTrue(node.offline)
+        self.assertEqual('O', node.role)
+        self.assertTrue(node.cached)
+        self.assertEqual(cluster.hash, node.cluster_hash)
+
+        vm = VirtualMachine.objects.get(cluster=cluster,
+                                        hostname='vm1.example.bak')
+        self.assertEqual(512, vm.ram)
+        self.assertEqual(5120, vm.disk_size)
+        self.assertEqual('running', vm.status)
+        self.assertEqual(cluster.hash, vm.cluster_hash)
+        self.assertEqual('gtest1.example.bak', vm.primary_node.hostname)
+        self.assertEqual('vm1.example.bak', vm.info['name'])
+
+        primary = vm.primary_node
+        self.assertEqual(1024, primary.ram_allocated)
+        self.assertEqual(2, cluster.get_capacity().vms_running)
+        self.assertEqual(3, cluster.get_capacity().nodes_total)
+
+        # importing again does nothing
+        cluster.sync_nodes()
+        cluster.sync_virtual_machines()
+        self.assertEqual(3, cluster.nodes.count())
+        self.assertEqual(2, cluster.virtual_machines.count())
+
+
+    def test_refresh_all(self):
+        """
+        Tests refreshing a cluster and all of its objects with bulk calls
+
+        Verifies:
+            * nodes and vms are refreshed without per-object calls
+            * vms are related to their nodes
+            * objects that have not changed only have their cache time updated
+        """
+        cluster = Cluster.objects.create(hostname='ganeti.example.test')
+        cluster.sync_nodes()
+        vm1 = VirtualMachine.objects.create(cluster=cluster,
+                                            hostname='vm1.example.bak')
+        vm2 = VirtualMachine.objects.create(cluster=cluster,
+                                            hostname='vm2.example.bak')
+        # vm2 has a newer mtime than ganeti reports
+        VirtualMachine.objects.filter(pk=vm2.pk) \
+            .update(mtime=datetime.now(), cached=None)
+        Node.objects.update(mtime=None)
+        cluster.rapi.GetInstance.reset()
+
+        cluster.refresh_all()
+
+        cluster.rapi.GetNodes.assertCalled(self, bulk=True)
+        cluster.rapi.GetInstances.assertCalled(self, bulk=True)
+        cluster.rapi.GetInstance.assertNotCalled(self)
+
+        node = Node.objects.get(hostname='gtest1.example.bak')
+        self.assertEqual(1997, node.ram_total)
+
+        vm1 = VirtualMachine.objects.get(pk=vm1.pk)
+        self.assertEqual(512, vm1.ram)
+        self.assertEqual('running', vm1.status)
+        self.assertEqual('gtest1.example.bak', vm1.primary_node.hostname)
+        self.assertEqual('vm1.example.bak', vm1.info['name'])
+
+        vm2 = VirtualMachine.objects.get(pk=vm2.pk)
+        self.assertEqual(-1, vm2.ram)
+        self.assertTrue(vm2.cached)
+
+        cluster.delete()
+
+    def test_snapshot(self):
+        """
+        Tests the snapshot of a cluster for creating virtual machines
+
+        Verifies:
+            * refresh_all() builds the snapshot
+            * snapshots are served from the cache without calling ganeti
+            * snapshots follow changes of the cluster info
+        """
+        cluster = Cluster.objects.create(hostname='ganeti.example.test')
+        cluster.refresh_all()
+        cluster.rapi.GetOperatingSystems.assertCalled(self)
+        cluster.rapi.GetOperatingSystems.reset()
+        cluster.rapi.GetInfo.reset()
+
+        snapshot = cluster.get_snapshot()
+        self.assertEqual(['kvm'], snapshot['enabled_hypervisors'])
+        self.assertTrue(snapshot['os_list'])
+        cluster.rapi.GetOperatingSystems.assertNotCalled(self)
+        cluster.rapi.GetInfo.assertNotCalled(self)
+
+        # changed info is used, keeping the operating systems
+        cluster.info = dict(cluster.info, default_hypervisor='xen-pvm')
+        cluster.mtime = datetime.now()
+        snapshot = cluster.get_snapshot()
+        self.assertEqual('xen-pvm', snapshot['default_hypervisor'])
+        self.assertTrue(snapshot['os_list'])
+        cluster.rapi.GetOperatingSystems.assertNotCalled(self)
+
+        cluster.delete()
+
+    def test_rapi_pool_size(self):
+        """
+        Tests that the connection pool size can be set per cluster
+        """
+        cluster = Cluster.objects.create(hostname='ganeti.example.test')
+        other = Cluster.objects.create(hostname='other.example.test',
+                                       slug='other')
+        models.clear_rapi_cache()
+
+        settings.RAPI_POOL_SIZES = {'other.example.test': 42}
+        try:
+            self.assertNotEqual(42, cluster.rapi.pool_size)
+            self.assertEqual(42, other.rapi.pool_size)
+        finally:
+            settings.RAPI_POOL_SIZES = {}
+            models.clear_rapi_cache()
+
+        stats = models.rapi_connection_stats()
+        self.assertEqual({}, stats)
+        cluster.rapi
+        stats = models.rapi_connection_stats()
+        self.assertEqual(0, stats[cluster.id]['requests'])
+        self.assertEqual(0, stats[cluster.id]['connections'])
 
     def test_missing_in_database(self):
         """
@@ -373,6 +564,60 @@ class TestClusterModel(TestCase):
         c.delete()
         c2.delete()
 
+    def test_capacity(self):
+        """
+        Tests that the capacity snapshot follows nodes and virtual machines
+
+        Verifies:
+            * snapshot is counted when first read
+            * snapshot matches available_ram and available_disk
+            * saving and deleting nodes and virtual machines recounts it
+            * recount only reports clusters that changed
+        """
+        c = Cluster.objects.create(hostname='ganeti.example.test')
+        node = Node.objects.create(cluster=c, hostname='node.example.test')
+        foo = VirtualMachine.objects.create(cluster=c, primary_node=node,
+                                            hostname='foo', ram=123,
+                                            disk_size=456, status='running')
+        VirtualMachine.objects.create(cluster=c, primary_node=node,
+                                      hostname='bar', ram=789, disk_size=234,
+                                      status='stopped')
+
+        capacity = Cluster.objects.get(pk=c.pk).get_capacity()
+        self.assertEqual(c.available_ram, capacity.ram)
+        self.assertEqual(c.available_disk, capacity.disk)
+        self.assertEqual((1, 0, 1), (capacity.nodes_online,
+                                     capacity.nodes_offline,
+                                     capacity.nodes_total))
+        self.assertEqual((1, 2), (capacity.vms_running, capacity.vms_total))
+
+        # refreshing the node saves its totals
+        node.refresh()
+        foo.status = 'stopped'
+        foo.save()
+        capacity = Cluster.objects.get(pk=c.pk).get_capacity()
+        self.assertEqual(c.available_ram, capacity.ram)
+        self.assertEqual(c.available_disk, capacity.disk)
+        self.assertEqual(9999, capacity.ram_total)
+        self.assertEqual(0, capacity.ram_allocated)
+        self.assertEqual((0, 2), (capacity.vms_running, capacity.vms_total))
+
+        foo.delete()
+        capacity = Cluster.objects.get(pk=c.pk).get_capacity()
+        self.assertEqual(234, capacity.disk_allocated)
+        self.assertEqual(1, capacity.vms_total)
+
+        # rows changed without save() are only seen by a recount
+        VirtualMachine.objects.filter(hostname='bar').update(status='running')
+        self.assertEqual([c.pk], models.ClusterCapacity.objects.recount())
+        self.assertEqual([], models.ClusterCapacity.objects.recount([c.pk]))
+        capacity = Cluster.objects.get(pk=c.pk).get_capacity()
+        self.assertEqual(789, capacity.ram_allocated)
+
+        c.delete()
+        self.assertFalse(models.ClusterCapacity.objects.filter(pk=c.pk)
+                         .exists())
+
     def test_redistribute_config(self):
         """
         Test Cluster.redistribute_config()
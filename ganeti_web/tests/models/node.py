@@ -17,6 +17,8 @@
 
 from datetime import datetime
 
+from django.conf import settings
+from django.core.management import call_command
 from django.test import TestCase
 
 from ganeti_web.util.proxy import RapiProxy
@@ -166,6 +168,7 @@ class TestNodeModel(TestCase, NodeTestCaseMixin):
                                             hostname='yoo', ram=999,
                                             status='admin_down')
 
+        node = Node.objects.get(pk=node.pk)
         ram = node.ram
         self.assertEqual(9999, ram['total'])
         self.assertEqual(9420, ram['free'])
@@ -214,6 +217,7 @@ class TestNodeModel(TestCase, NodeTestCaseMixin):
                                             hostname='yoo', disk_size=999,
                                             status='admin_down')
 
+        node = Node.objects.get(pk=node.pk)
         disk = node.disk
         self.assertEqual(6666, disk['total'])
         self.assertEqual(5064, disk['free'])
@@ -265,6 +269,7 @@ class TestNodeModel(TestCase, NodeTestCaseMixin):
                                             hostname='yoo', virtual_cpus=999,
                                             status='admin_down')
 
+        node = Node.objects.get(pk=node.pk)
         self.assertEqual(130, node.allocated_cpus)
 
         foo.delete()
@@ -279,3 +284,112 @@ class TestNodeModel(TestCase, NodeTestCaseMixin):
         node.delete()
         node2.delete()
         c.delete()
+
+    def test_allocations_follow_vm(self):
+        """
+        Allocation totals are kept current as virtual machines change, move
+        between nodes and are deleted.
+        """
+        node, c = self.create_node()
+        node2, c = self.create_node(cluster=c, hostname='two')
+
+        def allocated(node):
+            return Node.objects.filter(pk=node.pk).values_list(
+                'ram_allocated', 'disk_allocated', 'cpus_allocated')[0]
+
+        vm = VirtualMachine.objects.create(cluster=c, primary_node=node,
+                                           secondary_node=node2,
+                                           hostname='foo', ram=128,
+                                           disk_size=1024, virtual_cpus=2,
+                                           status='running')
+        self.assertEqual((128, 1024, 2), allocated(node))
+        self.assertEqual((128, 1024, 0), allocated(node2))
+
+        vm.status = 'ADMIN_down'
+        vm.save()
+        self.assertEqual((0, 1024, 0), allocated(node))
+        self.assertEqual((0, 1024, 0), allocated(node2))
+
+        vm.status = 'running'
+        vm.primary_node = node2
+        vm.secondary_node = None
+        vm.save()
+        self.assertEqual((0, 0, 0), allocated(node))
+        self.assertEqual((128, 1024, 2), allocated(node2))
+
+        vm.delete()
+        self.assertEqual((0, 0, 0), allocated(node2))
+
+        node.delete()
+        node2.delete()
+        c.delete()
+
+    def test_update_allocations(self):
+        """
+        Totals that drifted are recounted, and only those are reported.
+        """
+        node, c = self.create_node()
+        node2, c = self.create_node(cluster=c, hostname='two')
+        vm = VirtualMachine.objects.create(cluster=c, primary_node=node,
+                                           hostname='foo', ram=128,
+                                           status='running')
+
+        # an update that bypasses VirtualMachine.save()
+        VirtualMachine.objects.filter(pk=vm.pk).update(ram=256)
+        Node.objects.filter(pk=node2.pk).update(cpus_allocated=4)
+
+        self.assertEqual(set([node.pk, node2.pk]),
+                         set(Node.objects.update_allocations()))
+        self.assertEqual(256, Node.objects.get(pk=node.pk).ram_allocated)
+        self.assertEqual(0, Node.objects.get(pk=node2.pk).cpus_allocated)
+        self.assertEqual([], Node.objects.update_allocations([node.pk]))
+
+        vm.delete()
+        node.delete()
+        node2.delete()
+        c.delete()
+
+    def test_save_recounts_capacity(self):
+        """
+        Saving a node recounts its cluster's capacity only when a field that
+        is counted changed.
+        """
+        settings.CACHE_REFRESH_ON_LOAD = False
+        self.addCleanup(setattr, settings, 'CACHE_REFRESH_ON_LOAD', True)
+
+        node, c = self.create_node()
+        capacity = models.ClusterCapacity.objects.filter(pk=c.pk)
+        self.assertEqual(1, capacity.get().nodes_online)
+
+        # a drift that only a recount would correct
+        capacity.update(nodes_online=5)
+        node = Node.objects.get(pk=node.pk)
+        node.role = 'M'
+        node.save(changed_only=True)
+        self.assertEqual(5, capacity.get().nodes_online)
+
+        node.offline = True
+        node.save(changed_only=True)
+        self.assertEqual(0, capacity.get().nodes_online)
+        self.assertEqual(1, capacity.get().nodes_offline)
+
+        node.delete()
+        c.delete()
+
+    def test_reconcile_allocations(self):
+        """
+        The reconcile_allocations command recounts totals of all nodes and
+        the capacity of all clusters.
+        """
+        node, c = self.create_node()
+        Node.objects.filter(pk=node.pk).update(ram_allocated=1024)
+
+        models.ClusterCapacity.objects.filter(pk=c.pk).update(nodes_online=5)
+
+        call_command('reconcile_allocations', verbosity=0)
+        self.assertEqual(0, Node.objects.get(pk=node.pk).ram_allocated)
+        self.assertEqual(1, models.ClusterCapacity.objects.get(pk=c.pk)
+                         .nodes_online)
+
+        node.delete()
+        c.delete()
@@ -20,6 +20,9 @@ from datetime import datetime
 
 from django.test import TestCase
 
+from ganeti_web.backend.owner_tags import sync_owner_tags
+from ganeti_web.util import serializers
+from ganeti_web.util.client import GanetiApiError
 from ganeti_web.util.proxy import RapiProxy
 from ganeti_web.util.proxy.constants import (INSTANCE, JOB, JOB_RUNNING,
     JOB_DELETE_SUCCESS)
@@ -117,41 +120,145 @@ class TestVirtualMachineModel(TestCase, VirtualMachineTestCaseMixin):
         vm.delete()
         cluster.delete()
 
+    def test_parse_nodes(self):
+        """
+        Test relating a VirtualMachine to its nodes when parsing info
+
+        Verifies:
+            * nodes are looked up with a single query
+            * nodes are looked up in a given map without queries
+            * nodes not in the database are left unset
+            * a node loaded for a previous id is not kept
+        """
+        vm, cluster = self.create_virtual_machine()
+        gtest1 = Node.objects.get(hostname='gtest1.example.bak')
+        gtest2 = Node.objects.get(hostname='gtest2.example.bak')
+        info = dict(INSTANCE, snodes=['gtest2.example.bak'])
+
+        with self.assertNumQueries(1):
+            data = VirtualMachine.parse_persistent_info(info)
+        self.assertEqual(gtest1.pk, data['primary_node_id'])
+        self.assertEqual(gtest2.pk, data['secondary_node_id'])
+
+        nodes = Node.objects.hostname_map([cluster.pk])
+        self.assertEqual(3, len(nodes))
+        with self.assertNumQueries(0):
+            data = VirtualMachine.parse_persistent_info(info, nodes=nodes)
+        self.assertEqual(gtest1.pk, data['primary_node_id'])
+        self.assertEqual(gtest2.pk, data['secondary_node_id'])
+
+        info = dict(INSTANCE, pnode='missing.example.bak')
+        data = VirtualMachine.parse_persistent_info(info, nodes=nodes)
+        self.assertEqual(None, data['primary_node_id'])
+        self.assertEqual(None, data['secondary_node_id'])
+
+        vm.primary_node = gtest2
+        vm.info = INSTANCE
+        self.assertEqual(gtest1, vm.primary_node)
+
+        vm.delete()
+        cluster.delete()
+
     def test_update_owner_tag(self):
         """
         Test changing owner
+
+        Verifies:
+            * saving only flags the vm, without contacting ganeti
+            * flagged vms are tagged with their latest owner
+            * vms that could not be tagged stay flagged
         """
         vm, cluster = self.create_virtual_machine()
+        rapi = cluster.rapi
 
         owner0 = ClusterUser(id=74, name='owner0')
         owner1 = ClusterUser(id=21, name='owner1')
         owner0.save()
         owner1.save()
 
+        def sync():
+            self.assertEqual([], sync_owner_tags(cluster))
+            return VirtualMachine.objects.get(pk=vm.pk)
+
         # no owner
         vm.refresh()
         self.assertEqual([], vm.info['tags'])
+        self.assertFalse(vm.owner_tag_pending)
 
-        # setting owner
+        # setting owner, then changing it before ganeti is told
+        rapi.AddInstanceTags.reset()
         vm.owner = owner0
         vm.save()
-        self.assertEqual(['%s%s' % (constants.OWNER_TAG, owner0.id)], vm.info['tags'])
-
-        # changing owner
+        self.assertTrue(vm.owner_tag_pending)
         vm.owner = owner1
         vm.save()
-        self.assertEqual(['%s%s' % (constants.OWNER_TAG, owner1.id)], vm.info['tags'])
+        rapi.AddInstanceTags.assertNotCalled(self)
+
+        vm = sync()
+        tag = '%s%s' % (constants.OWNER_TAG, owner1.id)
+        rapi.AddInstanceTags.assertCalled(self)
+        self.assertEqual(1, len(rapi.AddInstanceTags.calls))
+        self.assertEqual(((vm.hostname, [tag]), {}),
+                         rapi.AddInstanceTags.calls[0])
+        self.assertEqual([tag], vm.info['tags'])
+        self.assertFalse(vm.owner_tag_pending)
 
         # setting owner to none
         vm.owner = None
         vm.save()
+        vm = sync()
+        rapi.DeleteInstanceTags.assertCalled(self)
         self.assertEqual([], vm.info['tags'])
+        self.assertFalse(vm.owner_tag_pending)
+
+        # failures are tried again
+        vm.owner = owner0
+        vm.save()
+        rapi.AddInstanceTags.error = GanetiApiError('down', 500)
+        self.assertEqual([vm.hostname], sync_owner_tags(cluster))
+        self.assertTrue(VirtualMachine.objects.get(pk=vm.pk)
+                        .owner_tag_pending)
+        rapi.AddInstanceTags.error = None
+        vm = sync()
+        self.assertFalse(vm.owner_tag_pending)
 
         owner0.delete()
         owner1.delete()
         vm.delete()
         cluster.delete()
 
+    def test_update_owner_tag_during_refresh(self):
+        """
+        Info stored by a refresh while tags are being changed is not
+        overwritten with the info read before.
+        """
+        vm, cluster = self.create_virtual_machine()
+        self.addCleanup(models.clear_rapi_cache)
+        owner = ClusterUser.objects.create(name='owner')
+        vm.refresh()
+        vm.owner = owner
+        vm.save()
+        self.assertTrue(vm.owner_tag_pending)
+
+        refreshed = dict(INSTANCE, status='ADMIN_down')
+        mtime = datetime(2030, 1, 1)
+
+        def add_instance_tags(hostname, tags):
+            VirtualMachine.objects.filter(pk=vm.pk).update(
+                mtime=mtime, serialized_info=serializers.dumps(
+                    refreshed, models.cache_serializer()))
+        cluster.rapi.AddInstanceTags = add_instance_tags
+
+        self.assertEqual([], sync_owner_tags(cluster))
+        vm = VirtualMachine.objects.get(pk=vm.pk)
+        self.assertFalse(vm.owner_tag_pending)
+        self.assertEqual(mtime, vm.mtime)
+        self.assertEqual('ADMIN_down', vm.info['status'])
+
+        vm.delete()
+        owner.delete()
+        cluster.delete()
+
     def test_start(self):
         """
         Test VirtualMachine.start()
@@ -299,3 +406,26 @@ class TestVirtualMachineModel(TestCase, VirtualMachineTestCaseMixin):
 
         job.delete()
         cluster.delete()
+
+    def test_load_deferred(self):
+        """
+        Loading a VirtualMachine with its info deferred never touches the
+        cache or ganeti, even when ignore_cache is set.
+        """
+        vm, cluster = self.create_virtual_machine()
+        VirtualMachine.objects.update(cached=None, ignore_cache=True)
+        vm.rapi.GetInstance.reset()
+
+        deferred = VirtualMachine.objects.defer('serialized_info').get()
+        self.assertTrue(deferred.cache_deferred())
+        self.assertEqual(vm, deferred)
+        self.assertEqual(deferred, vm)
+        vm.rapi.GetInstance.assertNotCalled(self)
+        self.assertFalse('serialized_info' in deferred.__dict__)
+
+        vm = VirtualMachine.objects.get()
+        self.assertFalse(vm.cache_deferred())
+        vm.rapi.GetInstance.assertCalled(self)
+
+        vm.delete()
+        cluster.delete()
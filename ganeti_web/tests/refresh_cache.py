@@ -0,0 +1,150 @@
+# Copyright (C) 2012 Oregon State University
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+from django.conf import settings
+from django.core.management import call_command
+from django.test import TestCase
+
+from ganeti_web.util.proxy import RapiProxy
+from ganeti_web import models
+
+Cluster = models.Cluster
+Node = models.Node
+VirtualMachine = models.VirtualMachine
+
+
+__all__ = ['TestRefreshCache']
+
+
+class TestRefreshCache(TestCase):
+
+    def setUp(self):
+        models.client.GanetiRapiClient = RapiProxy
+
+        self.cluster = Cluster.objects.create(hostname='test.example.bak',
+                                              slug='OSL_TEST')
+        self.cluster.sync_nodes()
+        self.vm = VirtualMachine.objects.create(cluster=self.cluster,
+                                                hostname='vm1.example.bak')
+
+        # expire everything and start with fresh rapi clients
+        for model in (Cluster, Node, VirtualMachine):
+            model.objects.update(cached=None)
+        models.clear_rapi_cache()
+
+    def tearDown(self):
+        settings.CACHE_REFRESH_ON_LOAD = True
+        models.clear_rapi_cache()
+
+    def test_load_without_refresh(self):
+        """
+        Loading an expired object does not contact ganeti when
+        CACHE_REFRESH_ON_LOAD is disabled.
+        """
+        settings.CACHE_REFRESH_ON_LOAD = False
+
+        vm = VirtualMachine.objects.get(pk=self.vm.pk)
+        self.assertEqual(None, vm.cached)
+        vm.rapi.GetInstance.assertNotCalled(self)
+
+        cluster = Cluster.objects.get(pk=self.cluster.pk)
+        self.assertEqual(None, cluster.cached)
+        cluster.rapi.GetInfo.assertNotCalled(self)
+
+    def test_load_with_refresh(self):
+        """
+        Loading an expired object refreshes it by default.
+        """
+        vm = VirtualMachine.objects.get(pk=self.vm.pk)
+        self.assertNotEqual(None, vm.cached)
+        vm.rapi.GetInstance.assertCalled(self)
+
+    def test_load_during_refresh(self):
+        """
+        Loading an expired object that another process is refreshing uses
+        the expired info instead.
+        """
+        vm = VirtualMachine.objects.get(pk=self.vm.pk)
+        self.assertFalse(vm.stale)
+        VirtualMachine.objects.filter(pk=vm.pk).update(cached=None)
+        models.clear_rapi_cache()
+
+        self.assertTrue(vm.acquire_refresh_lease())
+        try:
+            stale = VirtualMachine.objects.get(pk=vm.pk)
+        finally:
+            vm.release_refresh_lease()
+        self.assertTrue(stale.stale)
+        self.assertEqual(None, stale.cached)
+        self.assertEqual(vm.info, stale.info)
+        stale.rapi.GetInstance.assertNotCalled(self)
+
+        # once the lease is released the next load refreshes
+        vm = VirtualMachine.objects.get(pk=vm.pk)
+        self.assertFalse(vm.stale)
+        self.assertNotEqual(None, vm.cached)
+        vm.rapi.GetInstance.assertCalled(self)
+
+    def test_refresh_all(self):
+        """
+        Running the command refreshes every cluster, node and vm.
+        """
+        call_command('refresh_cache', verbosity=0)
+
+        for model in (Cluster, Node, VirtualMachine):
+            self.assertFalse(model.objects.filter(cached=None).exists())
+
+        rapi = self.cluster.rapi
+        rapi.GetInfo.assertCalled(self)
+        rapi.GetNodes.assertCalled(self, bulk=True)
+        rapi.GetInstances.assertCalled(self, bulk=True)
+        rapi.GetNode.assertNotCalled(self)
+        rapi.GetInstance.assertNotCalled(self)
+
+    def test_refresh_clears_errors(self):
+        """
+        Objects that are refreshed in bulk have their errors cleared, as
+        refresh() does.
+        """
+        # a cluster without errors of its own, whose refresh() leaves the
+        # errors of its objects alone
+        self.cluster.refresh()
+        Cluster.objects.update(cached=None)
+        models.clear_rapi_cache()
+
+        vm = self.vm
+        models.GanetiError.store_error('broken', obj=vm, code=500)
+
+        call_command('refresh_cache', verbosity=0)
+
+        self.assertFalse(models.GanetiError.objects.get_errors(vm)
+                         .filter(cleared=False).exists())
+
+    def test_refresh_cluster(self):
+        """
+        Clusters may be selected by slug.
+        """
+        other = Cluster.objects.create(hostname='other.example.bak',
+                                       slug='other')
+        Cluster.objects.update(cached=None)
+
+        call_command('refresh_cache', clusters=['other'], verbosity=0)
+
+        self.assertTrue(Cluster.objects.filter(pk=self.cluster.pk,
+                                               cached=None).exists())
+        self.assertFalse(Cluster.objects.filter(pk=other.pk,
+                                                cached=None).exists())
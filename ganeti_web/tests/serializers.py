@@ -0,0 +1,137 @@
+# Copyright (C) 2012 Oregon State University
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+import cPickle
+
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase
+
+from ganeti_web.util import serializers
+from ganeti_web.util.proxy import RapiProxy
+from ganeti_web.util.proxy.constants import INSTANCE
+from ganeti_web import models
+
+Cluster = models.Cluster
+VirtualMachine = models.VirtualMachine
+
+__all__ = (
+    "TestSerializers",
+    "TestCachedInfoStorage",
+)
+
+
+class TestSerializers(SimpleTestCase):
+
+    formats = ("pickle", "json", "zjson")
+
+    def test_round_trip(self):
+        for format in self.formats:
+            data = serializers.dumps(INSTANCE, format)
+            self.assertEqual(INSTANCE, serializers.loads(data))
+            # databases may hand text back as unicode
+            self.assertEqual(INSTANCE, serializers.loads(unicode(data)))
+
+    def test_partial(self):
+        """
+        Only the requested keys are returned, and missing keys are skipped.
+        """
+        expected = {"ctime": INSTANCE["ctime"],
+                    "hvparams": INSTANCE["hvparams"]}
+        for format in self.formats:
+            data = serializers.dumps(INSTANCE, format)
+            info = serializers.loads(data, ("ctime", "hvparams", "missing"))
+            self.assertEqual(expected, info)
+
+    def test_awkward_keys(self):
+        """
+        Keys that look like parts of the index don't confuse lookups.
+        """
+        info = {'a': 1, '"a"': 2, 'b;"a":': 3, u'\xe9': 4}
+        for format in ("json", "zjson"):
+            data = serializers.dumps(info, format)
+            for key, value in info.items():
+                self.assertEqual({key: value},
+                                 serializers.loads(data, (key,)))
+
+    def test_none(self):
+        for format in self.formats:
+            self.assertEqual("", serializers.dumps(None, format))
+        self.assertEqual(None, serializers.loads(""))
+
+    def test_legacy_pickle(self):
+        """
+        Data pickled before formats were tagged is still readable.
+        """
+        data = cPickle.dumps(INSTANCE)
+        self.assertEqual(INSTANCE, serializers.loads(data))
+        self.assertEqual({"ctime": INSTANCE["ctime"]},
+                         serializers.loads(data, ("ctime",)))
+
+
+class TestCachedInfoStorage(TestCase):
+
+    def setUp(self):
+        models.client.GanetiRapiClient = RapiProxy
+        self.cluster = Cluster.objects.create(hostname="test.example.bak",
+                                              slug="OSL_TEST")
+        self.vm = VirtualMachine.objects.create(cluster=self.cluster,
+                                                hostname="vm1.example.bak")
+        self.vm.info = INSTANCE
+        self.vm.save()
+        settings.CACHE_REFRESH_ON_LOAD = False
+
+    def tearDown(self):
+        settings.CACHE_REFRESH_ON_LOAD = True
+        models.clear_rapi_cache()
+
+    def test_configured_format(self):
+        self.assertTrue(self.vm.serialized_info.startswith("json:"))
+
+        settings.CACHE_SERIALIZER = "pickle"
+        try:
+            self.vm.info = INSTANCE
+            self.vm.save()
+        finally:
+            settings.CACHE_SERIALIZER = "json"
+        vm = VirtualMachine.objects.get(pk=self.vm.pk)
+        self.assertEqual(cPickle.dumps(INSTANCE), vm.serialized_info)
+        self.assertEqual(INSTANCE, vm.info)
+
+    def test_partial_info(self):
+        """
+        Loading an object only decodes the keys it needs.
+        """
+        vm = VirtualMachine.objects.get(pk=self.vm.pk)
+        self.assertEqual(None, vm._CachedClusterObject__info)
+        self.assertEqual({"hvparams": INSTANCE["hvparams"]},
+                         vm.partial_info("hvparams"))
+        self.assertEqual(None, vm._CachedClusterObject__info)
+
+        # once info is loaded it is used directly
+        self.assertEqual(INSTANCE, vm.info)
+        self.assertEqual({"ctime": INSTANCE["ctime"]},
+                         vm.partial_info("ctime", "missing"))
+
+    def test_has_info(self):
+        vm = VirtualMachine.objects.get(pk=self.vm.pk)
+        self.assertTrue(vm.has_info())
+
+        VirtualMachine.objects.filter(pk=self.vm.pk) \
+            .update(serialized_info=cPickle.dumps(None))
+        vm = VirtualMachine.objects.get(pk=self.vm.pk)
+        self.assertFalse(vm.has_info())
+        self.assertEqual('No Cached Info', vm.error)
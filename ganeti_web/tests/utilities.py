@@ -15,15 +15,19 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
 # USA.
 
+from threading import Event
+
 from django.test import SimpleTestCase
 
 from ganeti_web.utilities import (compare, get_hypervisor, hv_prettify,
                                   os_prettify)
+from ganeti_web.util.fanout import fan_out, FanOutTimeout
 from ganeti_web.util.proxy.constants import (INSTANCE, XEN_PVM_INSTANCE,
                                              XEN_HVM_INSTANCE)
 
 __all__ = (
     "TestCompare",
+    "TestFanOut",
     "TestGetHypervisor",
     "TestHvPrettify",
     "TestOSPrettify",
@@ -165,3 +169,33 @@ class TestOSPrettify(SimpleTestCase):
                     ("noop", "noop"),
                 ]),
             ])
+
+
+class TestFanOut(SimpleTestCase):
+    """
+    fan_out() runs calls concurrently and collects results and errors.
+    """
+
+    def test_results(self):
+        results, errors = fan_out({"a": lambda: 1, "b": lambda: 2})
+        self.assertEqual({"a": 1, "b": 2}, results)
+        self.assertEqual({}, errors)
+
+    def test_errors(self):
+        def fail():
+            raise ValueError("broken")
+
+        results, errors = fan_out({"a": lambda: 1, "b": fail})
+        self.assertEqual({"a": 1}, results)
+        self.assertEqual(["b"], errors.keys())
+        self.assertTrue(isinstance(errors["b"], ValueError))
+
+    def test_timeout(self):
+        stuck = Event()
+        try:
+            results, errors = fan_out({"a": lambda: 1, "b": stuck.wait},
+                                      timeout=0.1)
+        finally:
+            stuck.set()
+        self.assertEqual({"a": 1}, results)
+        self.assertTrue(isinstance(errors["b"], FanOutTimeout))
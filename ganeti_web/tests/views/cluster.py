@@ -16,7 +16,9 @@
 # USA.
 
 
+from django.conf import settings
 from django.contrib.auth.models import User, Group
+from django.db import connection
 from django.test import TestCase
 from django.test.client import Client
 # Per #6579, do not change this import without discussion.
@@ -421,6 +423,80 @@ class TestClusterViews(TestCase, ViewTestMixin, UserTestMixin):
         self.validate_get(url, args, 'ganeti/node/table.html')
         self.cluster.rapi.GetNodes.response = NODES
 
+    def test_view_nodes_queries(self):
+        """
+        The number of queries for the list of nodes doesn't depend on how
+        many nodes there are.
+        """
+        url = "/cluster/%s/nodes/" % self.cluster.slug
+        self.assertTrue(self.c.login(username=self.superuser.username,
+                                     password="secret"))
+        settings.CACHE_REFRESH_ON_LOAD = False
+
+        def count_queries():
+            # connection.queries is reset when each request starts.
+            connection.use_debug_cursor = True
+            try:
+                self.assertEqual(200, self.c.get(url).status_code)
+            finally:
+                connection.use_debug_cursor = False
+            return len(connection.queries)
+
+        try:
+            node = Node.objects.create(cluster=self.cluster, hostname='n0')
+            VirtualMachine.objects.create(cluster=self.cluster, hostname='v0',
+                                          primary_node=node, ram=512,
+                                          status='running')
+            queries = count_queries()
+
+            for i in range(1, 6):
+                node = Node.objects.create(cluster=self.cluster,
+                                           hostname='n%d' % i)
+                VirtualMachine.objects.create(cluster=self.cluster,
+                                              hostname='v%d' % i,
+                                              primary_node=node, ram=512,
+                                              status='running')
+            self.assertEqual(queries, count_queries())
+        finally:
+            settings.CACHE_REFRESH_ON_LOAD = True
+
+    def test_view_list_queries(self):
+        """
+        The number of queries for the list of clusters doesn't depend on how
+        many clusters there are.
+        """
+        url = "/clusters/"
+        self.assertTrue(self.c.login(username=self.superuser.username,
+                                     password="secret"))
+        settings.CACHE_REFRESH_ON_LOAD = False
+
+        def count_queries():
+            # connection.queries is reset when each request starts.
+            connection.use_debug_cursor = True
+            try:
+                response = self.c.get(url)
+            finally:
+                connection.use_debug_cursor = False
+            self.assertEqual(200, response.status_code)
+            return len(connection.queries)
+
+        try:
+            count_queries()
+            queries = count_queries()
+
+            for i in range(5):
+                cluster = Cluster.objects.create(hostname='cluster%d' % i,
+                                                 slug='cluster%d' % i)
+                node = Node.objects.create(cluster=cluster,
+                                           hostname='node%d' % i)
+                VirtualMachine.objects.create(cluster=cluster,
+                                              hostname='vm%d' % i,
+                                              primary_node=node, ram=512,
+                                              status='running')
+            self.assertEqual(queries, count_queries())
+        finally:
+            settings.CACHE_REFRESH_ON_LOAD = True
+
     def test_view_add_permissions(self):
         """
         Test adding permissions to a new User or Group
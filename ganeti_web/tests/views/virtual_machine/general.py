@@ -3,7 +3,7 @@ from django.core.urlresolvers import reverse
 # #6579.
 from django.utils import simplejson as json
 
-from ganeti_web.models import SSHKey
+from ganeti_web.models import SSHKey, VirtualMachine
 from ganeti_web.tests.views.virtual_machine.base import TestVirtualMachineViewsBase
 
 __all__ = ['TestVirtualMachineViewList',
@@ -93,6 +93,105 @@ class TestVirtualMachineViewList(TestVirtualMachineViewsBase):
         self.assertEqual(set(vms), set([self.vm, vm1, vm2, vm3]))
 
 
+    def test_deferred_info(self):
+        """
+        The VM list doesn't load cached info, so listing VMs never waits on
+        ganeti.
+        """
+
+        url = '/vms/'
+
+        VirtualMachine.objects.update(cached=None)
+        self.vm.rapi.GetInstance.reset()
+
+        self.assertTrue(self.c.login(username=self.superuser.username,
+                                     password='secret'))
+        response = self.c.get(url)
+        self.assertEqual(200, response.status_code)
+        vms = response.context["object_list"]
+        self.assertEqual([self.vm], list(vms))
+        self.assertTrue(all(vm.cache_deferred() for vm in vms))
+        self.vm.rapi.GetInstance.assertNotCalled(self)
+
+    def test_cursor_pagination(self):
+        """
+        The VM list is paged by cursor, forwards and backwards, in any of
+        its orderings.
+        """
+
+        url = '/vms/'
+
+        vms = [self.vm]
+        for hostname in ('test1', 'test2', 'test3', 'test4'):
+            vms.append(self.create_virtual_machine(self.cluster, hostname)[0])
+        vms.sort(key=lambda vm: vm.hostname)
+
+        self.assertTrue(self.c.login(username=self.superuser.username,
+                                     password='secret'))
+
+        response = self.c.get(url, {'count': 2})
+        self.assertEqual(200, response.status_code)
+        page = response.context['page_obj']
+        self.assertEqual(vms[:2], list(response.context['object_list']))
+        self.assertTrue(response.context['is_paginated'])
+        self.assertFalse(page.has_previous())
+        self.assertEqual(5, page.count)
+
+        response = self.c.get(url, {'count': 2, 'cursor': page.next_cursor})
+        page = response.context['page_obj']
+        self.assertEqual(vms[2:4], list(response.context['object_list']))
+
+        response = self.c.get(url, {'count': 2, 'cursor': page.next_cursor})
+        page = response.context['page_obj']
+        self.assertEqual(vms[4:], list(response.context['object_list']))
+        self.assertFalse(page.has_next())
+
+        response = self.c.get(url, {'count': 2,
+                                    'cursor': page.previous_cursor})
+        page = response.context['page_obj']
+        self.assertEqual(vms[2:4], list(response.context['object_list']))
+        self.assertTrue(page.has_next())
+        self.assertTrue(page.has_previous())
+
+        # reversed ordering
+        response = self.c.get(url, {'count': 2, 'order_by': '-hostname'})
+        page = response.context['page_obj']
+        self.assertEqual(vms[:-3:-1], list(response.context['object_list']))
+
+        # cursors belong to their ordering
+        response = self.c.get(url, {'count': 2, 'cursor': page.next_cursor})
+        self.assertEqual(404, response.status_code)
+        response = self.c.get(url, {'count': 2, 'cursor': 'forged'})
+        self.assertEqual(404, response.status_code)
+
+        # and to their list
+        response = self.c.get(url, {'count': 2})
+        cursor = response.context['page_obj'].next_cursor
+        cluster_url = '/cluster/%s/virtual_machines/' % self.cluster.slug
+        self.assertEqual(200, self.c.get(cluster_url).status_code)
+        response = self.c.get(cluster_url, {'count': 2, 'cursor': cursor})
+        self.assertEqual(404, response.status_code)
+
+        # lists paged by number ignore cursors
+        response = self.c.get('/clusters/', {'count': 2, 'cursor': cursor})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(None, response.context['page_obj'].previous_url)
+
+        # page sizes are bounded
+        response = self.c.get(url, {'count': -5})
+        self.assertEqual(vms[:1], list(response.context['object_list']))
+        response = self.c.get(url, {'count': 'all'})
+        self.assertEqual(vms, list(response.context['object_list']))
+
+        # unknown orderings are ignored
+        response = self.c.get(url, {'count': 2, 'order_by': 'serialized_info'})
+        self.assertEqual(vms[:2], list(response.context['object_list']))
+
+        # pages by number still work
+        response = self.c.get(url, {'count': 2, 'page': 3})
+        self.assertEqual(vms[4:], list(response.context['object_list']))
+
+
 class TestVirtualMachineDetailView(TestVirtualMachineViewsBase):
 
     def test_view_detail(self):
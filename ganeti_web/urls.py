@@ -114,6 +114,7 @@ urlpatterns += patterns('ganeti_web.views.cluster',
     url(r'^%s/permissions/group/(?P<group_id>\d+)/?$' % cluster, 'permissions', name="cluster-permissions-group"),
 
     url(r'^(?P<id>\d+)/jobs/status/?$', "job_status", name="cluster-job-status"),
+    url(r'^(?P<id>\d+)/jobs/stream/?$', "job_stream", name="cluster-job-stream"),
 
     #ssh_keys
     url(r'^%s/keys/(?P<api_key>\w+)/?$' % cluster, "ssh_keys", name="cluster-keys"),
@@ -130,6 +131,7 @@ urlpatterns += patterns('ganeti_web.views.node',
     url(r'^%s/?$' % node_prefix, NodeDetailView.as_view(),
         name="node-detail"),
     url(r'^node/(?P<id>\d+)/jobs/status/?$', "job_status", name="node-job-status"),
+    url(r'^node/(?P<id>\d+)/jobs/stream/?$', "job_stream", name="node-job-stream"),
     
     # Primary and secondary Virtual machines
     url(r'^%s/primary/?$' % node_prefix, NodePrimaryListView.as_view(),
@@ -172,6 +174,7 @@ urlpatterns += patterns('ganeti_web.views.virtual_machine',
     #  Detail
     url(r'^%s/?$' % vm_prefix, 'detail', name="instance-detail"),
     url(r'^vm/(?P<id>\d+)/jobs/status/?$', 'job_status', name="instance-job-status"),
+    url(r'^vm/(?P<id>\d+)/jobs/stream/?$', 'job_stream', name="instance-job-stream"),
     url(r'^%s/users/?$' % vm_prefix, 'users', name="vm-users"),
     url(r'^%s/permissions/?$' % vm_prefix, 'permissions', name="vm-permissions"),
     url(r'^%s/permissions/user/(?P<user_id>\d+)/?$' % vm_prefix, 'permissions', name="vm-permissions-user"),
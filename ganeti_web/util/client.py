@@ -30,6 +30,12 @@ import socket
 
 import requests
 
+# requests < 1.0 configures its connection pools through the session config
+# rather than through transport adapters.
+HAS_ADAPTERS = hasattr(requests.Session, "mount")
+if HAS_ADAPTERS:
+    from requests.adapters import HTTPAdapter
+
 
 GANETI_RAPI_PORT = 5080
 GANETI_RAPI_VERSION = 2
@@ -71,6 +77,24 @@ JOB_STATUS_ALL = frozenset([
 # Legacy name
 JOB_STATUS_WAITLOCK = JOB_STATUS_WAITING
 
+# Fields of a job, as returned by GetJobStatus
+JOB_STATUS_FIELDS = [
+    "id",
+    "ops",
+    "opresult",
+    "opstatus",
+    "oplog",
+    "received_ts",
+    "start_ts",
+    "end_ts",
+    "status",
+    "summary",
+]
+
+# Status of a field in the result of a query; other statuses mean the value
+# is unknown or unavailable
+QUERY_RS_NORMAL = 0
+
 # Internal constants
 _REQ_DATA_VERSION_FIELD = "__version__"
 _INST_NIC_PARAMS = frozenset(["mac", "ip", "mode", "link"])
@@ -159,7 +183,7 @@ class GanetiRapiClient(object): # pylint: disable-msg=R0904
     _json_encoder = json.JSONEncoder(sort_keys=True)
 
     def __init__(self, host, port=GANETI_RAPI_PORT, username=None,
-                 password=None, timeout=60, logger=logging):
+                 password=None, timeout=60, logger=logging, pool_size=10):
         """
         Initializes this class.
 
@@ -172,6 +196,8 @@ class GanetiRapiClient(object): # pylint: disable-msg=R0904
         :type password: string
         :param password: the password to connect with
         :param logger: Logging object
+        :type pool_size: int
+        :param pool_size: the number of connections to keep alive
         """
 
         if username is not None and password is None:
@@ -194,7 +220,65 @@ class GanetiRapiClient(object): # pylint: disable-msg=R0904
 
         self._base_url = "https://%s" % address
 
-    def _SendRequest(self, method, path, query=None, content=None):
+        self.pool_size = pool_size
+        self._session = self._CreateSession()
+        self._requests = 0
+
+    def _CreateSession(self):
+        """
+        Creates the HTTP session used for all requests to the cluster.
+
+        Connections are kept alive and pooled so that consecutive requests
+        don't repeat the TCP and TLS handshakes.
+        """
+
+        # All requests go to a single host, so only one pool is needed.
+        if not HAS_ADAPTERS:
+            return requests.session(config={
+                "keep_alive": True,
+                "pool_connections": 1,
+                "pool_maxsize": self.pool_size,
+            })
+
+        session = requests.Session()
+        session.mount("https://", HTTPAdapter(pool_connections=1,
+                                              pool_maxsize=self.pool_size))
+        return session
+
+    def _GetPoolManager(self):
+        if not HAS_ADAPTERS:
+            return self._session.poolmanager
+        return self._session.get_adapter(self._base_url).poolmanager
+
+    def Close(self):
+        """
+        Closes all pooled connections to the cluster.
+        """
+
+        self._session.close()
+
+    def GetConnectionStats(self):
+        """
+        Gets statistics about connection reuse.
+
+        This does not contact the cluster.
+
+        :rtype: dict
+        :return: the pool size, the number of requests sent and the number
+                 of connections opened to send them
+        """
+
+        pools = self._GetPoolManager().pools
+        connections = sum(pools[key].num_connections for key in pools.keys())
+
+        return {
+            "pool_size": self.pool_size,
+            "requests": self._requests,
+            "connections": connections,
+        }
+
+    def _SendRequest(self, method, path, query=None, content=None,
+                     timeout=None):
         """
         Sends an HTTP request.
 
@@ -209,6 +293,9 @@ class GanetiRapiClient(object): # pylint: disable-msg=R0904
         :param query: query arguments to pass to urllib.urlencode
         :type content: str or None
         :param content: HTTP body content
+        :type timeout: int or None
+        :param timeout: seconds to wait for a response, overriding the
+                        client's timeout
 
         :rtype: object
         :return: JSON-Decoded response
@@ -222,7 +309,7 @@ class GanetiRapiClient(object): # pylint: disable-msg=R0904
 
         kwargs = {
             "headers": headers,
-            "timeout": self.timeout,
+            "timeout": timeout or self.timeout,
             "verify": False,
         }
 
@@ -242,13 +329,15 @@ class GanetiRapiClient(object): # pylint: disable-msg=R0904
         # print "Sending request to %s %s" % (url, kwargs)
 
         try:
-            r = requests.request(method, url, **kwargs)
+            r = self._session.request(method, url, **kwargs)
         except requests.ConnectionError:
             raise GanetiApiError("Couldn't connect to %s" % self._base_url)
         except requests.Timeout:
             raise GanetiApiError("Timed out connecting to %s" %
                                  self._base_url)
 
+        self._requests += 1
+
         if r.status_code != requests.codes.ok:
             raise GanetiApiError(str(r.status_code), code=r.status_code)
 
@@ -993,12 +1082,59 @@ class GanetiRapiClient(object): # pylint: disable-msg=R0904
         return self._SendRequest("get", "/%s/jobs/%s" % (GANETI_RAPI_VERSION,
                                                          job_id))
 
-    def WaitForJobChange(self, job_id, fields, prev_job_info, prev_log_serial):
+    def GetJobStatuses(self, job_ids, fields=None):
+        """
+        Gets the status of several jobs with a single query.
+
+        Jobs which do not exist, for instance because they were archived, are
+        left out of the result.
+
+        :type job_ids: list of int
+        :param job_ids: ids of the jobs to query
+        :type fields: list of str
+        :param fields: fields to return, defaulting to those of GetJobStatus
+
+        :rtype: dict
+        :return: job status, keyed by job id
+        """
+
+        if not job_ids:
+            return {}
+
+        if fields is None:
+            fields = JOB_STATUS_FIELDS
+        if "id" not in fields:
+            fields = ["id"] + list(fields)
+
+        qfilter = ["|"] + [["=", "id", int(job_id)] for job_id in job_ids]
+        result = self.Query("job", fields, qfilter)
+
+        names = [field["name"] for field in result["fields"]]
+        jobs = {}
+        for row in result["data"]:
+            job = {}
+            for name, (status, value) in zip(names, row):
+                if status != QUERY_RS_NORMAL:
+                    break
+                job[name] = value
+            else:
+                jobs[int(job["id"])] = job
+
+        return jobs
+
+    def WaitForJobChange(self, job_id, fields, prev_job_info, prev_log_serial,
+                         timeout=None):
         """
         Waits for job changes.
 
+        Ganeti answers as soon as the job changes, or with None once its own
+        wait times out, which takes about ten seconds.
+
         :type job_id: int
         :param job_id: Job ID for which to wait
+        :type timeout: int or None
+        :param timeout: seconds to wait for Ganeti to answer, which should be
+                        longer than Ganeti's own wait
         """
 
         body = {
@@ -1008,7 +1144,8 @@ class GanetiRapiClient(object): # pylint: disable-msg=R0904
         }
 
         return self._SendRequest("get", "/%s/jobs/%s/wait" %
-                                 (GANETI_RAPI_VERSION, job_id), content=body)
+                                 (GANETI_RAPI_VERSION, job_id), content=body,
+                                 timeout=timeout)
 
     def CancelJob(self, job_id, dry_run=False):
         """
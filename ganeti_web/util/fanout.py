@@ -0,0 +1,114 @@
+# Copyright (C) 2012 Oregon State University
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+"""
+Concurrent calls to several Ganeti clusters.
+
+Like the RAPI client, this module is standalone. Callers are responsible for
+keeping database access out of the functions they fan out, since each one
+runs in its own thread.
+"""
+
+from threading import Thread
+import time
+
+
+class FanOutTimeout(Exception):
+    """
+    Raised in place of the result of a call that did not finish in time.
+    """
+
+
+class _Call(Thread):
+    """
+    A thread which records the result, or the error, of a single call.
+    """
+
+    def __init__(self, func, key=None, queue=None):
+        Thread.__init__(self)
+        # Don't keep the process alive for calls that were given up on.
+        self.daemon = True
+        self.func = func
+        self.key = key
+        self.queue = queue
+        self.result = None
+        self.error = None
+
+    def run(self):
+        try:
+            self.result = self.func()
+        except Exception, e:
+            self.error = e
+        if self.queue is not None:
+            self.queue.put((self.key, self.result, self.error))
+
+
+def fan_out(calls, timeout=None):
+    """
+    Run several calls concurrently and collect their results.
+
+    A slow or failing call never prevents the results of the others from
+    being returned. Calls still running when the deadline passes are
+    abandoned and reported as a FanOutTimeout.
+
+    :type calls: dict
+    :param calls: functions taking no arguments, keyed by any hashable
+    :type timeout: float or None
+    :param timeout: seconds to wait for all calls, or None to wait forever
+
+    :rtype: tuple of (dict, dict)
+    :return: the results of the calls that succeeded and the errors of the
+             calls that failed, both keyed like ``calls``
+    """
+
+    threads = {}
+    for key, func in calls.items():
+        threads[key] = _Call(func)
+        threads[key].start()
+
+    if timeout is not None:
+        deadline = time.time() + timeout
+
+    results = {}
+    errors = {}
+    for key, thread in threads.items():
+        if timeout is None:
+            thread.join()
+        else:
+            thread.join(max(deadline - time.time(), 0))
+
+        if thread.isAlive():
+            errors[key] = FanOutTimeout("Timed out after %s seconds"
+                                        % timeout)
+        elif thread.error is not None:
+            errors[key] = thread.error
+        else:
+            results[key] = thread.result
+
+    return results, errors
+
+
+def start_call(key, func, queue):
+    """
+    Run a call in its own thread, without waiting for it.
+
+    When the call returns, ``(key, result, error)`` is put into ``queue``,
+    where ``error`` is the exception it raised, or None. Several calls may
+    share a queue, so that each result can be handled as soon as it arrives.
+    """
+
+    _Call(func, key, queue).start()
@@ -20,7 +20,7 @@ __all__ = ['INSTANCE', 'INSTANCES', 'XEN_PVM_INSTANCE', 'XEN_HVM_INSTANCE',
     'XEN_INSTANCES', 'NODE', 'NODES', 'NODES_BULK', 'INFO', 'XEN_INFO',
     'OPERATING_SYSTEMS', 'XEN_OPERATING_SYSTEMS', 'JOB', 'JOB_RUNNING',
     'JOB_ERROR', 'JOB_DELETE_SUCCESS', 'JOB_LOG', 'INSTANCES_BULK',
-    'NODES_MAP']
+    'NODES_MAP', 'INSTANCES_MAP', 'JOB_FIELDS', 'job_query', 'JOBS_QUERY']
 
 from response_map import ResponseMap
 
@@ -482,6 +482,22 @@ JOB_ERROR = {'end_ts': [1291836084, 802444],
  'start_ts': [1291836084, 673097],
  'status': 'error',
  'summary': ['INSTANCE_REBOOT(gimager.example.bak)']}
+
+JOB_FIELDS = ['id', 'ops', 'opresult', 'opstatus', 'oplog', 'received_ts',
+              'start_ts', 'end_ts', 'status', 'summary']
+
+
+def job_query(*jobs):
+    """
+    Build the response of Query('job', JOB_FIELDS, ...) for the given jobs
+    """
+    return {'fields': [{'name': name, 'title': name.title(), 'kind': 'other',
+                        'doc': name} for name in JOB_FIELDS],
+            'data': [[[0, job[name]] for name in JOB_FIELDS]
+                     for job in jobs]}
+
+JOBS_QUERY = job_query(JOB_RUNNING)
+
 JOB_DELETE_SUCCESS = {'status': 'success',
     'ops': [{'dry_run': False,
     'instance_name': 'test.gwm.example.org',
@@ -670,3 +686,12 @@ NODES_MAP = ResponseMap([
     (((True,),{}),NODES_BULK),
     (((),{'bulk':True}),NODES_BULK),
 ])
+
+# map instances response for bulk argument
+INSTANCES_MAP = ResponseMap([
+    (((),{}),INSTANCES),
+    (((False,),{}),INSTANCES),
+    (((),{'bulk':False}),INSTANCES),
+    (((True,),{}),INSTANCES_BULK),
+    (((),{'bulk':True}),INSTANCES_BULK),
+])
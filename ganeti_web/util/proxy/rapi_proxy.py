@@ -34,7 +34,7 @@ class RapiProxy(client.GanetiRapiClient):
         """
         instance = object.__new__(cls)
         instance.__init__(*args, **kwargs)
-        CallProxy.patch(instance, 'GetInstances', False, INSTANCES)
+        CallProxy.patch(instance, 'GetInstances', False, INSTANCES_MAP)
         CallProxy.patch(instance, 'GetInstance', False, INSTANCE)
         CallProxy.patch(instance, 'GetNodes', False, NODES_MAP)
         CallProxy.patch(instance, 'GetNode', False, NODE)
@@ -42,6 +42,8 @@ class RapiProxy(client.GanetiRapiClient):
         CallProxy.patch(instance, 'GetOperatingSystems', False,
             OPERATING_SYSTEMS)
         CallProxy.patch(instance, 'GetJobStatus', False, JOB_RUNNING)
+        CallProxy.patch(instance, 'WaitForJobChange', False)
+        CallProxy.patch(instance, 'Query', False, JOBS_QUERY)
         CallProxy.patch(instance, 'StartupInstance', False, 1)
         CallProxy.patch(instance, 'ShutdownInstance', False, 1)
         CallProxy.patch(instance, 'RebootInstance', False, 1)
@@ -75,7 +77,7 @@ class RapiProxy(client.GanetiRapiClient):
                    'GetInfo', 'StartupInstance', 'ShutdownInstance', \
                    'RebootInstance', 'AddInstanceTags', 'DeleteInstanceTags', \
                    'GetOperatingSystems', 'GetJobStatus', 'CreateInstance', \
-                   'ReinstallInstance'] \
+                   'ReinstallInstance', 'Query'] \
                     and self.error:
             return self.fail
         return super(RapiProxy, self).__getattribute__(key)
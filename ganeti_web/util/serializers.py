@@ -0,0 +1,203 @@
+# Copyright (C) 2012 Oregon State University
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+"""
+Serialization formats for the info cached by CachedClusterObject.
+
+Serialized data starts with the name of its format, so rows written in
+different formats can be read side by side. Data without a known prefix is
+treated as a pickle, which is how info was stored before formats were
+pluggable.
+
+The json and zjson formats index where each top-level key is stored, so
+callers who only need a few keys can decode just those.
+"""
+
+import base64
+import cPickle
+import zlib
+
+from django.utils import simplejson as json
+
+
+SERIALIZERS = {}
+
+# The longest format name that will be looked for in front of the data.
+MAX_NAME_LENGTH = 16
+
+
+def register(serializer):
+    """
+    Make a serializer available by its name.
+    """
+    SERIALIZERS[serializer.name] = serializer
+
+
+def dumps(info, format):
+    """
+    Serialize info with the named format.
+
+    :type info: dict or None
+    :type format: str
+    :param format: name of a registered serializer
+
+    :rtype: str
+    :return: the serialized info, or an empty string if info is None
+    """
+    if info is None:
+        return ""
+    return SERIALIZERS[format].dumps(info)
+
+
+def loads(data, keys=None):
+    """
+    Deserialize data written by any registered serializer.
+
+    :type data: str
+    :type keys: iterable or None
+    :param keys: the top-level keys to decode, or None to decode all of them.
+                 Keys that are not present are left out of the result.
+
+    :rtype: dict or None
+    """
+    if not data:
+        return None
+
+    colon = data.find(":", 0, MAX_NAME_LENGTH)
+    if colon != -1:
+        serializer = SERIALIZERS.get(data[:colon])
+        if serializer is not None and serializer.tagged:
+            return serializer.decode(data[colon + 1:], keys)
+
+    return SERIALIZERS["pickle"].decode(data, keys)
+
+
+def select(info, keys):
+    """
+    Helper for picking keys out of an already decoded dict.
+    """
+    if info is None or keys is None:
+        return info
+    return dict((k, info[k]) for k in keys if k in info)
+
+
+class Serializer(object):
+    """
+    Base class for serializers. Subclasses implement encode() and decode().
+    """
+
+    name = None
+    tagged = True
+
+    def dumps(self, info):
+        if self.tagged:
+            return "%s:%s" % (self.name, self.encode(info))
+        return self.encode(info)
+
+    def encode(self, info):
+        raise NotImplementedError
+
+    def decode(self, data, keys=None):
+        raise NotImplementedError
+
+
+class PickleSerializer(Serializer):
+    """
+    The original format. It cannot be partially decoded.
+    """
+
+    name = "pickle"
+    tagged = False
+
+    def encode(self, info):
+        return cPickle.dumps(info)
+
+    def decode(self, data, keys=None):
+        return select(cPickle.loads(str(data)), keys)
+
+
+class JSONSerializer(Serializer):
+    """
+    A JSON object, preceded by an index of where the value of each top-level
+    key starts and ends within it.
+
+    The index is a line of ``;"key":start,end`` entries. Looking a key up is
+    a string search, so decoding a few keys costs little more than decoding
+    those values, and decoding everything is a single json.loads().
+    """
+
+    name = "json"
+
+    def encode(self, info):
+        index = []
+        items = []
+        offset = 1
+        for key, value in info.iteritems():
+            key = json.dumps(key)
+            value = json.dumps(value, separators=(",", ":"))
+            start = offset + len(key) + 1
+            end = start + len(value)
+            index.append(';%s:%d,%d' % (key, start, end))
+            items.append('%s:%s' % (key, value))
+            # Account for the comma that joins this item to the next.
+            offset = end + 1
+
+        # The default ensure_ascii keeps offsets valid whether the database
+        # hands the data back as str or unicode.
+        return "%s\n{%s}" % ("".join(index), ",".join(items))
+
+    def decode(self, data, keys=None):
+        newline = data.index("\n")
+        if keys is None:
+            return json.loads(data[newline + 1:])
+
+        body = newline + 1
+        info = {}
+        for key in keys:
+            entry = ';%s:' % json.dumps(key)
+            position = data.find(entry, 0, newline)
+            if position == -1:
+                continue
+            position += len(entry)
+            stop = data.find(";", position, newline)
+            if stop == -1:
+                stop = newline
+            start, end = data[position:stop].split(",")
+            info[key] = json.loads(data[body + int(start):body + int(end)])
+        return info
+
+
+class CompressedJSONSerializer(JSONSerializer):
+    """
+    The json format, compressed with zlib and base64 encoded for storage in
+    a text column.
+    """
+
+    name = "zjson"
+
+    def encode(self, info):
+        data = super(CompressedJSONSerializer, self).encode(info)
+        return base64.b64encode(zlib.compress(data))
+
+    def decode(self, data, keys=None):
+        data = zlib.decompress(base64.b64decode(data))
+        return super(CompressedJSONSerializer, self).decode(data, keys)
+
+
+register(PickleSerializer())
+register(JSONSerializer())
+register(CompressedJSONSerializer())
@@ -2,7 +2,7 @@
 # coding: utf-8
 
 from optparse import OptionParser
-from urllib2 import urlopen
+from urllib2 import HTTPError, Request, urlopen
 from urlparse import urlparse, urlunparse
 import sys
 
@@ -11,6 +11,8 @@ from django.utils import simplejson as json
 parser = OptionParser()
 parser.add_option("-c", "--cluster", help="cluster to retrieve keys from")
 parser.add_option("-i", "--instance", help="instance to retrieve keys from")
+parser.add_option("--cache", help="file to keep the last keys in, so that "
+                  "only changes are retrieved")
 
 def main():
     options, arguments = parser.parse_args()
@@ -20,7 +22,8 @@ def main():
         parser.error("instances cannot be specified without a cluster")
 
     app = Application(arguments[0], arguments[1],
-                      cluster_slug=options.cluster, vm_name=options.instance)
+                      cluster_slug=options.cluster, vm_name=options.instance,
+                      cache=options.cache)
     app.run()
 
 class ArgumentException(Exception):
@@ -34,7 +37,8 @@ class BadMimetype(Exception):
     """
 
 class Application(object):
-    def __init__(self, api_key, hostname, cluster_slug=None, vm_name=None):
+    def __init__(self, api_key, hostname, cluster_slug=None, vm_name=None,
+                 cache=None):
         if cluster_slug is not None:
             if vm_name is not None:
                 path = "/cluster/%s/%s/keys/%s/" % (cluster_slug, vm_name,
@@ -47,22 +51,74 @@ class Application(object):
         split = urlparse(hostname)
         self.url = urlunparse(split._replace(path=path))
 
+        self.cache = cache
+        self.etag = None
+        self.keys = None
+        if cache is not None:
+            self.load()
+
+    def load(self):
+        """
+        Loads the keys and their ETag from the cache file, if there is one
+        """
+
+        try:
+            with open(self.cache) as f:
+                cached = json.load(f)
+            self.etag = cached["etag"]
+            self.keys = cached["keys"]
+        except (IOError, ValueError, KeyError, TypeError):
+            self.etag = self.keys = None
+
+    def save(self):
+        """
+        Stores the keys and their ETag in the cache file
+        """
+
+        with open(self.cache, "w") as f:
+            json.dump({"etag": self.etag, "keys": self.keys}, f)
+
     def get(self):
         """
         Gets the page specified in __init__
+
+        With a cache, only the keys added and removed since the cached keys
+        are asked for. Returns None if the cached keys are still current.
         """
 
-        content = urlopen(self.url)
+        url = self.url
+        request = Request(url)
+        if self.etag is not None:
+            request = Request(url + "?delta=1")
+            request.add_header("If-None-Match", self.etag)
+
+        try:
+            content = urlopen(request)
+        except HTTPError, e:
+            if e.code == 304:
+                return None
+            raise
         if content.info()["Content-Type"] != "application/json":
             raise BadMimetype("It's not JSON")
+        self.etag = content.info().get("ETag")
         return content.read()
 
     def parse(self, content):
         """
         Parses returned results from JSON into Python list
+
+        A delta is applied to the cached keys.
         """
 
-        return json.loads(content)
+        if content is None:
+            return self.keys
+
+        data = json.loads(content)
+        if isinstance(data, dict):
+            removed = data["removed"]
+            keys = [k for k in self.keys if k not in removed]
+            data = sorted(keys + data["added"], key=lambda k: (k[1], k[0]))
+        return data
 
     def printout(self, data):
         """
@@ -78,7 +134,10 @@ class Application(object):
         Combines get, parse and printout methods.
         """
         try:
-            s = self.printout(self.parse(self.get()))
+            self.keys = self.parse(self.get())
+            s = self.printout(self.keys)
+            if self.cache is not None:
+                self.save()
         except Exception, e:
             sys.stderr.write("Errors occured, could not retrieve informations.\n")
             sys.stderr.write(str(e)+"\n")
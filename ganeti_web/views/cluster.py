@@ -22,7 +22,6 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
 from django.core.urlresolvers import reverse
-from django.db.models import Q, Sum
 from django.http import (HttpResponse, HttpResponseRedirect,
                          HttpResponseForbidden)
 from django.shortcuts import get_object_or_404, render_to_response, redirect
@@ -32,7 +31,6 @@ from django.utils.translation import ugettext as _
 from django.views.decorators.http import require_POST
 from django.views.generic.detail import DetailView
 
-from object_permissions import get_users_any
 from object_permissions import signals as op_signals
 from object_permissions.views.permissions import view_users, view_permissions
 
@@ -41,14 +39,17 @@ from object_log.views import list_for_object
 
 log_action = LogItem.objects.log_action
 
+from ganeti_web.backend.events import job_feed
+from ganeti_web.backend.queries import VM_SORT_KEYS, vm_qs_for_table
 from ganeti_web.util.client import GanetiApiError
 from ganeti_web.middleware import Http403
-from ganeti_web.models import (Cluster, ClusterUser, Profile, SSHKey,
+from ganeti_web.models import (Cluster, ClusterUser, Profile, SSHKeyIndex,
                                VirtualMachine, Job)
 from ganeti_web.views import render_404
 from ganeti_web.forms.cluster import EditClusterForm, QuotaForm
 from ganeti_web.views.generic import (NO_PRIVS, LoginRequiredMixin,
-                                      PagedListView)
+                                      PagedListView, event_stream,
+                                      ssh_keys_response)
 
 class ClusterDetailView(LoginRequiredMixin, DetailView):
 
@@ -71,6 +72,10 @@ class ClusterDetailView(LoginRequiredMixin, DetailView):
 class ClusterListView(LoginRequiredMixin, PagedListView):
 
     template_name = "ganeti/cluster/list.html"
+    sort_keys = {
+        "hostname": ("hostname",),
+        "description": ("description", "hostname"),
+    }
 
     def get_queryset(self):
             if self.request.user.is_superuser:
@@ -81,7 +86,7 @@ class ClusterListView(LoginRequiredMixin, PagedListView):
 
             self.queryset = qs
             super(ClusterListView, self).get_queryset()
-            return qs.select_related() 
+            return qs.select_related('capacity')
 
     def get_context_data(self, **kwargs):
             user = self.request.user
@@ -93,6 +98,9 @@ class ClusterListView(LoginRequiredMixin, PagedListView):
 class ClusterVMListView(LoginRequiredMixin, PagedListView):
 
     template_name = "ganeti/virtual_machine/table.html"
+    sort_keys = VM_SORT_KEYS
+    default_sort = "hostname"
+    cursor_pagination = True
 
     def get_queryset(self):
         self.cluster = get_object_or_404(Cluster,
@@ -102,11 +110,12 @@ class ClusterVMListView(LoginRequiredMixin, PagedListView):
         if not admin:
             raise Http403(NO_PRIVS)
 
-        return self.cluster.virtual_machines.select_related("cluster").all()
+        return vm_qs_for_table(self.cluster.virtual_machines.all())
 
     def get_context_data(self, **kwargs):
-        kwargs["cluster"] = self.cluster
-        return kwargs
+        context = super(ClusterVMListView, self).get_context_data(**kwargs)
+        context["cluster"] = self.cluster
+        return context
 
 @login_required
 def nodes(request, cluster_slug):
@@ -118,29 +127,13 @@ def nodes(request, cluster_slug):
     if not (user.is_superuser or user.has_perm('admin', cluster)):
         raise Http403(NO_PRIVS)
 
-    # query allocated CPUS for all nodes in this list.  Must be done here to
-    # avoid querying Node.allocated_cpus for each node in the list.  Repackage
-    # list so it is easier to retrieve the values in the template
-    values = VirtualMachine.objects \
-            .filter(cluster=cluster, status='running') \
-            .exclude(virtual_cpus=-1) \
-            .order_by() \
-            .values('primary_node') \
-            .annotate(cpus=Sum('virtual_cpus'))
-    cpus = {}
+    # Allocated resources are stored on each node, so the whole list is a
+    # single query.
     nodes = cluster.nodes.all()
-    for d in values:
-        cpus[d['primary_node']] = d['cpus']
-
-    # Include nodes that do not have any virtual machines on them.
-    for node in nodes:
-        if node.pk not in cpus:
-            cpus[node.pk] = 0
 
     return render_to_response("ganeti/node/table.html",
         {'cluster': cluster,
          'nodes':nodes,
-         'cpus':cpus,
         },
         context_instance=RequestContext(request),
     )
@@ -206,6 +199,11 @@ def refresh(request, cluster_slug):
     cluster = get_object_or_404(Cluster, slug=cluster_slug)
     cluster.sync_nodes(remove=True)
     cluster.sync_virtual_machines(remove=True)
+    try:
+        cluster.refresh_all()
+    except GanetiApiError:
+        # the cached info is simply left as it was
+        pass
 
     url = reverse('cluster-detail', args=[cluster.slug])
     return redirect(url)
@@ -272,19 +270,12 @@ def ssh_keys(request, cluster_slug, api_key):
     if settings.WEB_MGR_API_KEY != api_key:
         return HttpResponseForbidden(_("You're not allowed to view keys."))
 
-    cluster = get_object_or_404(Cluster, slug=cluster_slug)
-
-    users = set(get_users_any(cluster).values_list("id", flat=True))
-    for vm in cluster.virtual_machines.all():
-        users = users.union(set(get_users_any(vm).values_list('id', flat=True)))
-
-    keys = SSHKey.objects \
-        .filter(Q(user__in=users) | Q(user__is_superuser=True)) \
-        .values_list('key','user__username') \
-        .order_by('user__username')
+    # The cached info isn't needed, so don't load or refresh it.
+    cluster = get_object_or_404(Cluster.objects.defer('serialized_info'),
+                                slug=cluster_slug)
 
-    keys_list = list(keys)
-    return HttpResponse(json.dumps(keys_list), mimetype="application/json")
+    index = SSHKeyIndex.objects.get_index(cluster=cluster)
+    return ssh_keys_response(request, index)
 
 
 @login_required
@@ -358,6 +349,14 @@ def job_status(request, id, rest=False):
         return HttpResponse(json.dumps(jobs), mimetype='application/json')
 
 
+@login_required
+def job_stream(request, id):
+    """
+    Stream the same list of jobs as job_status whenever it changes.
+    """
+    return event_stream({'jobs': job_feed(Cluster, id)})
+
+
 @login_required
 def object_log(request, cluster_slug):
     """ displays object log for this cluster """
@@ -15,26 +15,25 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
 # USA.
 
-from itertools import chain, izip, repeat
-
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
 from django.db.models import Q, Count
 from django.http import HttpResponse, HttpResponseForbidden
 from django.shortcuts import render_to_response, get_object_or_404
 from django.template import RequestContext
-from django.utils import simplejson as json
 from django.views.generic.base import TemplateView
 
-from object_permissions import get_users_any
-
+from ganeti_web.backend.pagination import InvalidCursor, paginate_merged
 from ganeti_web.backend.queries import vm_qs_for_admins
+from ganeti_web.fields import CountIf
 from ganeti_web.middleware import Http403
 from ganeti_web.models import Cluster, VirtualMachine, Job, GanetiError, \
-    ClusterUser, Profile, Organization, SSHKey
+    ClusterUser, Profile, Organization, SSHKeyIndex, \
+    dashboard_cache_timeout, dashboard_generation
 from ganeti_web.views import render_404
-from ganeti_web.views.generic import NO_PRIVS
+from ganeti_web.views.generic import NO_PRIVS, ssh_keys_response
 from django.utils.translation import ugettext as _
 from ganeti_web.constants import VERSION
 
@@ -46,32 +45,85 @@ class AboutView(TemplateView):
         context["version"] = VERSION
         return super(AboutView, self).render_to_response(context, **kwargs)
 
-def merge_errors(errors, jobs):
+def error_sources(user, clusters, admin, cleared=None):
     """
-    Merge iterables of errors and jobs together.
+    Get the errors and failed jobs that a user may see, as sources for
+    ``paginate_merged()``. Errors are the first source, jobs the second.
 
-    The resulting list contains tuples of (bool, object) where the first
-    member indicates whether the object is a ``GanetiError`` or ``Job``.
+    :param clusters: the clusters the user administers
+    :param cleared: only errors that were cleared if True, or that were not
+                    if False. Jobs can't be cleared, so they are only included
+                    when this is not True.
     """
 
-    def keyfunc(x):
-        """
-        Either the "finished" or "timestamp" attribute.
-        """
+    # Get all of the PKs from VMs that this user may administer.
+    vms = vm_qs_for_admins(user).values("pk")
+
+    # Build the list of ganeti errors. Include errors from any VMs for which
+    # the user has access.
+    qs = GanetiError.objects.all()
+    if cleared is not None:
+        qs = qs.filter(cleared=cleared)
+    ganeti_errors = qs.get_errors(obj=vms)
+    # If the user is an admin on any cluster, then include administrated
+    # clusters and related objects.
+    if admin:
+        ganeti_errors |= qs.get_errors(obj=clusters)
+
+    # build list of job errors. Include jobs from any vm the user has access
+    # to
+    # If the user has admin on any cluster then those clusters and it's objects
+    # must be included too.
+    #
+    # XXX all jobs have the cluster listed, filtering by cluster includes jobs
+    # for both the cluster itself and any of its VMs or Nodes
+    error_clause = Q(status='error')
+    vm_type = ContentType.objects.get_for_model(VirtualMachine)
+    select_clause = Q(content_type=vm_type, object_id__in=vms)
+    if admin:
+        select_clause |= Q(cluster__in=clusters)
+    # Ganeti records when every failed job finished; jobs that haven't been
+    # refreshed since failing can't be placed in the feed yet.
+    job_errors = Job.objects.filter(error_clause & select_clause) \
+        .exclude(finished=None)
+    if cleared:
+        job_errors = job_errors.none()
+
+    return [(ganeti_errors, "timestamp"), (job_errors, "finished")]
+
 
-        return getattr(x[1], "finished", getattr(x[1], "timestamp", 0))
+def error_page(sources, page_size, cursor=None):
+    """
+    Get a page of errors and failed jobs, newest first.
+
+    The page's ``object_list`` holds (bool, object) tuples, where the bool
+    tells whether the object is a ``GanetiError`` or a ``Job``.
+    """
 
-    i = chain(izip(repeat(True), errors), izip(repeat(False), jobs))
-    return list(sorted(i, key=keyfunc))
+    page = paginate_merged(sources, page_size, cursor)
+    page.object_list = [(index == 0, obj) for index, obj in page.object_list]
+    return page
 
 
 USED_NOTHING = dict(disk=0, ram=0, virtual_cpus=0)
+NO_VMS = dict(running=0, total=0)
+
+# Condition for counting only running virtual machines with CountIf.
+RUNNING = "ganeti_web_virtualmachine.status='running'"
+
+# The fields of clusters that resource summaries use. Other fields, notably
+# the cached info and the password, are not loaded and not cached.
+RESOURCE_CLUSTER_FIELDS = ('hostname', 'slug', 'ram', 'disk', 'virtual_cpus')
 
 
 @login_required
 def get_errors(request):
-    """ Returns all errors that have ever been generated for clusters/vms
-    and then sends them to the errors page.
+    """ Returns a page of the errors that have ever been generated for
+    clusters/vms and then sends them to the errors page.
+
+    Errors may be filtered by the slug of a ``cluster`` and by whether they
+    were ``cleared`` ("1") or not ("0"). Older pages are requested with the
+    ``cursor`` of the page before.
     """
     user = request.user
 
@@ -81,40 +133,43 @@ def get_errors(request):
         clusters = user.get_objects_all_perms(Cluster, ['admin',])
     admin = user.is_superuser or clusters
 
-    # Get all of the PKs from VMs that this user may administer.
-    vms = vm_qs_for_admins(user).values("pk")
-
-    # build list of job errors. Include jobs from any vm the user has access
-    # to
-    # If the user has admin on any cluster then those clusters and it's objects
-    # must be included too.
-    #
-    # XXX all jobs have the cluster listed, filtering by cluster includes jobs
-    # for both the cluster itself and any of its VMs or Nodes
-    error_clause = Q(status='error')
-    vm_type = ContentType.objects.get_for_model(VirtualMachine)
-    select_clause = Q(content_type=vm_type, object_id__in=vms)
-    if admin:
-        select_clause |= Q(cluster__in=clusters)
-    job_errors = Job.objects.filter(error_clause & select_clause)
+    cleared = {"0": False, "1": True}.get(request.GET.get("cleared"))
+    sources = error_sources(user, clusters, admin, cleared)
 
-    # Build the list of job errors. Include jobs from any VMs for which the
-    # user has access.
-    qs = GanetiError.objects
-    ganeti_errors = qs.get_errors(obj=vms)
-    # If the user is an admin on any cluster, then include administrated
-    # clusters and related objects.
-    if admin:
-        ganeti_errors |= qs.get_errors(obj=clusters)
+    cluster = None
+    if request.GET.get("cluster"):
+        cluster = get_object_or_404(Cluster, slug=request.GET["cluster"])
+        sources = [(qs.filter(cluster=cluster), field)
+                   for qs, field in sources]
 
-    # merge error lists
-    errors = merge_errors(ganeti_errors, job_errors)
+    try:
+        page_size = int(request.GET.get("count", settings.ITEMS_PER_PAGE))
+    except ValueError:
+        page_size = settings.ITEMS_PER_PAGE
+    # Pages read a page of rows from each source, so keep them bounded.
+    page_size = min(max(page_size, 1), settings.ITEMS_PER_PAGE * 10)
+    try:
+        page = error_page(sources, page_size, request.GET.get("cursor"))
+    except InvalidCursor:
+        return render_404(request, _("Invalid cursor."))
+
+    query = request.GET.copy()
+    query.pop("cursor", None)
+    first_url = "%s?%s" % (request.path, query.urlencode())
+    next_url = None
+    if page.has_next():
+        query["cursor"] = page.next_cursor
+        next_url = "%s?%s" % (request.path, query.urlencode())
 
     return render_to_response("ganeti/errors.html", {
         'admin':admin,
         'cluster_list': clusters,
+        'cluster': cluster,
+        'cleared': request.GET.get("cleared", ""),
         'user': request.user,
-        'errors':errors,
+        'errors': page.object_list,
+        'first_url': first_url if "cursor" in request.GET else None,
+        'next_url': next_url,
             },
             context_instance=RequestContext(request),
         )
@@ -123,29 +178,31 @@ def get_errors(request):
 def get_used_resources(cluster_user):
     """ help function for querying resources used for a given cluster_user """
     resources = {}
-    owned_vms = cluster_user.virtual_machines.all()
     used = cluster_user.used_resources()
-    clusters = cluster_user.permissable.get_objects_any_perms(Cluster)
+    clusters = cluster_user.permissable.get_objects_any_perms(Cluster) \
+        .only(*RESOURCE_CLUSTER_FIELDS)
     quotas = Cluster.get_quotas(clusters, cluster_user)
 
+    # count running and total VMs of every cluster with a single query
+    counts = cluster_user.virtual_machines.order_by().values('cluster') \
+        .annotate(total=Count('pk'), running=CountIf('pk', condition=RUNNING))
+    counts = dict((count.pop('cluster'), count) for count in counts)
+
     for cluster, quota in quotas.items():
         resources[cluster] = {
             "used": used.pop(cluster.id) if cluster.id in used else USED_NOTHING,
             "set": quota
         }
-        resources[cluster]["total"] = owned_vms.filter(cluster=cluster).count()
-        resources[cluster]["running"] = owned_vms.filter(cluster=cluster, \
-                                                    status="running").count()
+        resources[cluster].update(counts.get(cluster.id, NO_VMS))
 
     # add any clusters that have used resources but no perms (and thus no quota)
     # since we know they don't have a custom quota just add the default quota
     if used:
-        for cluster in Cluster.objects.filter(pk__in=used):
+        for cluster in Cluster.objects.filter(pk__in=used) \
+                .only(*RESOURCE_CLUSTER_FIELDS):
             resources[cluster] = {"used":used[cluster.id],
                                   "set":cluster.get_default_quota()}
-            resources[cluster]["total"] = owned_vms.filter(cluster=cluster).count()
-            resources[cluster]["running"] = owned_vms.filter(cluster=cluster, \
-                                                    status="running").count()
+            resources[cluster].update(counts.get(cluster.id, NO_VMS))
 
     return resources
 
@@ -172,14 +229,18 @@ def get_vm_counts(clusters):
         for i in annotated:
             result[format_key % i["cluster__pk"]] = {"orphaned": i["orphaned"]}
             orphaned += i["orphaned"]
+        # query all clusters at once; unreachable clusters count as zero
+        missing_in_db, missing_in_ganeti, errors = \
+            Cluster.missing_vms(cluster_list)
+
         for cluster in cluster_list:
             key = format_key % cluster.pk
 
             if key not in result:
                 result[key] = {"orphaned": 0}
 
-            result[key]["import_ready"] = len(cluster.missing_in_db)
-            result[key]["missing"] = len(cluster.missing_in_ganeti)
+            result[key]["import_ready"] = len(missing_in_db.get(cluster, ()))
+            result[key]["missing"] = len(missing_in_ganeti.get(cluster, ()))
 
             import_ready += result[key]["import_ready"]
             missing += result[key]["missing"]
@@ -187,18 +248,28 @@ def get_vm_counts(clusters):
     return orphaned, import_ready, missing
 
 
-@login_required
-def overview(request, rest=False):
+def get_dashboard(user):
     """
-    Status page
+    The parts of the overview page that are specific to a user.
+
+    Building them lists the virtual machines of every cluster the user
+    administers from Ganeti, so they are cached for DASHBOARD_CACHE_TIMEOUT
+    seconds. The cache is dropped whenever virtual machines, clusters,
+    quotas, groups or permissions change.
     """
-    user = request.user
+    timeout = dashboard_cache_timeout()
+    if timeout:
+        key = "ganeti_web.dashboard.%d.%d" % (dashboard_generation(), user.pk)
+        dashboard = cache.get(key)
+        if dashboard is not None:
+            return dashboard
 
     if user.is_superuser:
         clusters = Cluster.objects.all()
     else:
         clusters = user.get_objects_any_perms(Cluster, ['admin', 'create_vm',])
-    admin = user.is_superuser or clusters
+    cluster_ids = list(clusters.values_list('pk', flat=True))
+    admin = user.is_superuser or bool(cluster_ids)
 
     #orphaned, ready to import, missing
     if admin:
@@ -207,82 +278,74 @@ def overview(request, rest=False):
     else:
         orphaned = import_ready = missing = 0
 
-    # Get all of the PKs from VMs that this user may administer.
-    vms = vm_qs_for_admins(user).values("pk")
-
-    # build list of job errors.  Include jobs from any vm the user has access to
-    # If the user has admin on any cluster then those clusters and it's objects
-    # must be included too.
-    #
-    # XXX all jobs have the cluster listed, filtering by cluster includes jobs
-    # for both the cluster itself and any of its VMs or Nodes
-    error_clause = Q(status='error')
-    vm_type = ContentType.objects.get_for_model(VirtualMachine)
-    select_clause = Q(content_type=vm_type, object_id__in=vms)
-    if admin:
-        select_clause |= Q(cluster__in=clusters)
-    job_errors = Job.objects.filter(error_clause & select_clause) \
-        .order_by("-finished")[:5]
-
-    # Build the list of job errors. Include jobs from any VMs for which the
-    # user has access.
-    qs = GanetiError.objects.filter(cleared=False)
-    ganeti_errors = qs.get_errors(obj=vms)
-    # If the user is an admin on any cluster, then include administrated
-    # clusters and related objects.
-    if admin:
-        ganeti_errors |= qs.get_errors(obj=clusters)
-
-    # merge error lists
-    errors = merge_errors(ganeti_errors, job_errors)
-
-    # get vm summary - running and totals need to be done as separate queries
-    # and then merged into a single list
-    vms_running = vms.filter(status='running') \
-                        .order_by() \
-                        .values('cluster__hostname','cluster__slug') \
-                        .annotate(running=Count('pk'))
-    vms_total = vms.order_by()\
-                        .values('cluster__hostname','cluster__slug') \
-                        .annotate(total=Count('pk'))
+    # get vm summary - running and totals of every cluster in a single query
     vm_summary = {}
-    for cluster in vms_total:
+    summary = vm_qs_for_admins(user).order_by() \
+                        .values('cluster__hostname','cluster__slug') \
+                        .annotate(total=Count('pk'),
+                                  running=CountIf('pk', condition=RUNNING))
+    for cluster in summary:
         vm_summary[cluster.pop('cluster__hostname')] = cluster
-    for cluster in vms_running:
-        vm_summary[cluster['cluster__hostname']]['running'] = cluster['running']
 
     # get list of personas for the user:  All groups, plus the user.
     # include the user only if it owns a vm or has perms on at least one cluster
     profile = user.get_profile()
     personas = list(Organization.objects.filter(group__user=user))
-    if profile.virtual_machines.count() \
+    if profile.virtual_machines.exists() \
         or user.has_any_perms(Cluster, ['admin', 'create_vm'], groups=False) \
         or not personas:
             personas.insert(0, profile)
 
-    # get resources used per cluster from the first persona in the list
-    resources = get_used_resources(personas[0])
+    dashboard = {
+        'admin': admin,
+        'cluster_ids': cluster_ids,
+        'create_vm': user.has_perm('create_vm', clusters),
+        'orphaned': orphaned,
+        'import_ready': import_ready,
+        'missing': missing,
+        # get resources used per cluster from the first persona in the list
+        'resources': get_used_resources(personas[0]),
+        'vm_summary': vm_summary,
+        'personas': personas,
+    }
+    if timeout:
+        cache.set(key, dashboard, timeout)
+    return dashboard
 
-    create_vm = user.has_perm('create_vm', clusters)
 
+@login_required
+def overview(request, rest=False):
+    """
+    Status page
+    """
+    user = request.user
+    dashboard = get_dashboard(user)
+    clusters = Cluster.objects.filter(pk__in=dashboard['cluster_ids'])
     if rest:
         return clusters
-    else:
-        return render_to_response("ganeti/overview.html", {
-            'admin':admin,
-            'cluster_list': clusters,
-            'create_vm': create_vm,
-            'user': request.user,
-            'errors': errors,
-            'orphaned': orphaned,
-            'import_ready': import_ready,
-            'missing': missing,
-            'resources': resources,
-            'vm_summary': vm_summary,
-            'personas': personas,
-            },
-            context_instance=RequestContext(request),
-        )
+    admin = dashboard['admin']
+
+    # Show the most recent errors that haven't been cleared, and failed jobs.
+    sources = error_sources(user, clusters, admin, cleared=False)
+    page = error_page(sources, settings.ITEMS_PER_PAGE)
+    errors = page.object_list
+
+    return render_to_response("ganeti/overview.html", {
+        'admin':admin,
+        'cluster_list': clusters.select_related('capacity'),
+        'create_vm': dashboard['create_vm'],
+        'user': request.user,
+        'errors': errors,
+        'more_errors': page.has_next(),
+        'orphaned': dashboard['orphaned'],
+        'import_ready': dashboard['import_ready'],
+        'missing': dashboard['missing'],
+        'resources': dashboard['resources'],
+        'vm_summary': dashboard['vm_summary'],
+        'personas': dashboard['personas'],
+        },
+        context_instance=RequestContext(request),
+    )
 
 
 @login_required
@@ -350,16 +413,4 @@ def ssh_keys(request, api_key):
     if settings.WEB_MGR_API_KEY != api_key:
         return HttpResponseForbidden(_("You're not allowed to view keys."))
 
-    users = set()
-    for cluster in Cluster.objects.all():
-        users = users.union(set(get_users_any(cluster).values_list("id", flat=True)))
-    for vm in VirtualMachine.objects.all():
-        users = users.union(set(get_users_any(vm).values_list('id', flat=True)))
-
-    keys = SSHKey.objects \
-        .filter(Q(user__in=users) | Q(user__is_superuser=True)) \
-        .values_list('key','user__username')\
-        .order_by('user__username')
-
-    keys_list = list(keys)
-    return HttpResponse(json.dumps(keys_list), mimetype="application/json")
+    return ssh_keys_response(request, SSHKeyIndex.objects.get_index())
@@ -4,10 +4,16 @@
 
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.http import Http404, HttpResponse, HttpResponseNotModified
+from django.utils import simplejson as json
 from django.utils.decorators import method_decorator
+from django.utils.http import parse_etags, quote_etag
 from django.utils.translation import ugettext as _
 from django.views.generic.list import ListView
 
+from ganeti_web.backend.events import stream
+from ganeti_web.backend.pagination import InvalidCursor, paginate_by_keyset
+
 # Standard translation messages. We use these everywhere.
 
 NO_PRIVS = _('You do not have sufficient privileges')
@@ -32,8 +38,25 @@ class PagedListView(ListView):
     paginated list.
 
     This helper should be mixed in *before* ListView or any of its relatives.
+
+    Lists are paginated by page number, or by cursor when
+    ``cursor_pagination`` is set. Cursor pages read only the rows they show,
+    so the last page of a long list is as quick as the first.
     """
 
+    # The orderings that clients may ask for with ``order_by``, by name. Each
+    # is a sequence of fields, to which pk is appended to break ties. Prefix
+    # the name with "-" to reverse it. Other names are ignored.
+    sort_keys = {}
+
+    # The ordering used when none is asked for. None keeps the ordering of
+    # the queryset for pages by number, and orders by pk for pages by cursor.
+    default_sort = None
+
+    # Whether to paginate by cursor unless a page number is asked for. The
+    # template must link pages with ``previous_url`` and ``next_url``.
+    cursor_pagination = False
+
     def get_paginate_by(self, queryset):
         """
         Return the number of items to paginate by.
@@ -42,7 +65,50 @@ class PagedListView(ListView):
         many objects should be displayed per page."
         """
 
-        return self.request.GET.get("count", settings.ITEMS_PER_PAGE)
+        try:
+            page_size = int(self.request.GET.get("count",
+                                                 settings.ITEMS_PER_PAGE))
+        except ValueError:
+            page_size = settings.ITEMS_PER_PAGE
+        return min(max(page_size, 1), settings.ITEMS_PER_PAGE * 10)
+
+    def get_sort(self):
+        """
+        Return the fields to order by, or None, and whether to reverse them.
+        """
+
+        name = self.request.GET.get("order_by", "")
+        descending = name.startswith("-")
+        name = name[1:] if descending else name
+        if name not in self.sort_keys:
+            name, descending = self.default_sort, False
+        if name is None:
+            return None, False
+
+        fields = list(self.sort_keys[name])
+        if fields[-1] != "pk":
+            fields.append("pk")
+        return fields, descending
+
+    def get_count_limit(self):
+        """
+        Return how many objects cursor pages count at most, or None to not
+        count them.
+        """
+
+        return getattr(settings, "PAGINATION_COUNT_LIMIT", 1000) or None
+
+    def list_url(self, **params):
+        """
+        Return the URL of this list with some query parameters changed.
+        """
+
+        query = self.request.GET.copy()
+        for name in ("cursor", "page"):
+            query.pop(name, None)
+        for name, value in params.items():
+            query[name] = value
+        return "%s?%s" % (self.request.path, query.urlencode())
 
     def paginate_queryset(self, queryset, page_size):
         """
@@ -52,9 +118,88 @@ class PagedListView(ListView):
         The Django docstring isn't super-helpful. This function is the actual
         workhorse of pagination. Our hook here is meant to order the queryset,
         if needed, prior to pagination since Django won't do it otherwise.
+
+        Pages by cursor have no paginator. Both kinds of page get
+        ``previous_url`` and ``next_url`` attributes linking to the pages
+        around them.
         """
 
-        if "order_by" in self.request.GET:
-            queryset = queryset.order_by(self.request.GET["order_by"])
-        return super(PagedListView, self).paginate_queryset(queryset,
-                                                            page_size)
+        fields, descending = self.get_sort()
+        page_number = self.kwargs.get("page") or self.request.GET.get("page")
+
+        if self.cursor_pagination and ("cursor" in self.request.GET
+                                       or not page_number):
+            # Cursors only continue the list they were made for.
+            try:
+                page = paginate_by_keyset(queryset, fields or ["pk"],
+                                          page_size,
+                                          self.request.GET.get("cursor"),
+                                          descending, self.get_count_limit(),
+                                          self.request.path)
+            except InvalidCursor:
+                raise Http404(_("Invalid cursor."))
+
+            page.previous_url = page.next_url = None
+            if page.has_previous():
+                page.previous_url = self.list_url(cursor=page.previous_cursor)
+            if page.has_next():
+                page.next_url = self.list_url(cursor=page.next_cursor)
+            return None, page, page.object_list, page.has_other_pages()
+
+        if fields:
+            prefix = "-" if descending else ""
+            queryset = queryset.order_by(*[prefix + f for f in fields])
+        paginator, page, object_list, is_paginated = \
+            super(PagedListView, self).paginate_queryset(queryset, page_size)
+
+        page.previous_url = page.next_url = None
+        if page.has_previous():
+            page.previous_url = self.list_url(
+                page=page.previous_page_number())
+        if page.has_next():
+            page.next_url = self.list_url(page=page.next_page_number())
+        return paginator, page, object_list, is_paginated
+
+
+def event_stream(feeds):
+    """
+    Respond with a stream of server-sent events for the given feeds.
+
+    Streams hold a worker for as long as the page is open, so they are only
+    served when EVENT_STREAMS is enabled. Otherwise the response is empty,
+    which tells browsers to fall back to polling.
+    """
+
+    if not getattr(settings, "EVENT_STREAMS", False):
+        return HttpResponse(status=204)
+
+    events = stream(feeds, getattr(settings, "EVENT_STREAM_INTERVAL", 1),
+                    getattr(settings, "EVENT_STREAM_DURATION", 300))
+    response = HttpResponse(events, mimetype="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # Keep nginx from buffering the stream.
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def ssh_keys_response(request, index):
+    """
+    Respond with the keys of an SSHKeyIndex.
+
+    Clients sending the ETag of the list they have in If-None-Match get a
+    304 while it is current. Clients that also pass ``delta=1`` and have the
+    previous list get only the keys added and removed since, as a
+    ``{"added": [...], "removed": [...]}`` object.
+    """
+
+    etags = parse_etags(request.META.get("HTTP_IF_NONE_MATCH", ""))
+    if index.etag in etags:
+        response = HttpResponseNotModified()
+    elif (request.GET.get("delta") and index.previous_etag
+          and index.previous_etag in etags):
+        response = HttpResponse(json.dumps(index.delta()),
+                                mimetype="application/json")
+    else:
+        response = HttpResponse(index.keys, mimetype="application/json")
+    response["ETag"] = quote_etag(index.etag)
+    return response
@@ -17,15 +17,24 @@
 from collections import defaultdict
 
 from django.contrib.auth.decorators import login_required
+from django.db import transaction
 from django.shortcuts import render_to_response
 from django.template import RequestContext
 
 from ganeti_web.forms.importing import ImportForm, OrphanForm, VirtualMachineForm
 from ganeti_web.middleware import Http403
-from ganeti_web.models import VirtualMachine, Cluster
+from ganeti_web.models import VirtualMachine, Cluster, invalidate_dashboards
 from ganeti_web.views.generic import NO_PRIVS
 
 
+def unreachable_clusters(errors):
+    """
+    Helper for listing the clusters that could not be queried, as a sorted
+    list of (cluster, error) tuples.
+    """
+    return sorted(errors.items(), key=lambda x: x[0].hostname)
+
+
 @login_required
 def orphans(request):
     """
@@ -55,15 +64,14 @@ def orphans(request):
             owner = data['owner']
             vm_ids = data['virtual_machines']
 
-            # update the owner and save the vm.  This isn't the most efficient
-            # way of updating the VMs but we would otherwise need to group them
-            # by cluster
-            orphaned = defaultdict(lambda:0)
-            for id in vm_ids:
-                vm = VirtualMachine.objects.get(id=id)
-                vm.owner = owner
-                vm.save()
-                orphaned[vm.cluster_id] -= 1
+            # update the owners all at once.  Ganeti is told about them
+            # later, see ganeti_web.backend.owner_tags
+            with transaction.commit_on_success():
+                vms = VirtualMachine.objects.filter(id__in=vm_ids)
+                vms.update(owner=owner)
+                vms.exclude(cluster__username='') \
+                    .update(owner_tag_pending=True)
+            invalidate_dashboards()
 
             # remove updated vms from the list
             vms_with_cluster = [i for i in vms_with_cluster
@@ -99,9 +107,11 @@ def missing_ganeti(request):
         if not clusters:
             raise Http403(NO_PRIVS)
 
+    chaff, not_in_ganeti, errors = Cluster.missing_vms(clusters)
+
     vms = []
-    for cluster in clusters:
-        for vm in cluster.missing_in_ganeti:
+    for hostnames in not_in_ganeti.values():
+        for vm in hostnames:
             vms.append((vm, vm))
 
     if request.method == 'POST':
@@ -125,10 +135,13 @@ def missing_ganeti(request):
     else:
         form = VirtualMachineForm(vms)
 
+    # only list vms that weren't just deleted
+    remaining = set(x[0] for x in vms)
     vms = {}
-    for cluster in clusters:
-        for vm in cluster.missing_in_ganeti:
-            vms[vm] = (cluster.hostname, vm)
+    for cluster, hostnames in not_in_ganeti.items():
+        for vm in hostnames:
+            if vm in remaining:
+                vms[vm] = (cluster.hostname, vm)
 
     vmhostnames = vms.keys()
     vmhostnames.sort()
@@ -142,6 +155,7 @@ def missing_ganeti(request):
     return render_to_response("ganeti/importing/missing.html", {
         'vms': vms,
         'form':form,
+        'unreachable': unreachable_clusters(errors),
         },
         context_instance=RequestContext(request),
     )
@@ -160,9 +174,11 @@ def missing_db(request):
         if not clusters:
             raise Http403(NO_PRIVS)
 
+    missing, chaff, errors = Cluster.missing_vms(clusters)
+
     vms = []
-    for cluster in clusters:
-        for hostname in cluster.missing_in_db:
+    for cluster, hostnames in missing.items():
+        for hostname in hostnames:
             vms.append(('%s:%s' % (cluster.id, hostname), hostname))
 
     if request.method == 'POST':
@@ -193,10 +209,14 @@ def missing_db(request):
     else:
         form = ImportForm(vms)
 
+    # only list vms that weren't just imported
+    remaining = set(x[0] for x in vms)
     vms = {}
-    for cluster in clusters:
-        for hostname in cluster.missing_in_db:
-            vms[hostname] = ('%s:%s' % (cluster.id, hostname), cluster.hostname, hostname)
+    for cluster, hostnames in missing.items():
+        for hostname in hostnames:
+            key = '%s:%s' % (cluster.id, hostname)
+            if key in remaining:
+                vms[hostname] = (key, cluster.hostname, hostname)
     vmhostnames = vms.keys()
     vmhostnames.sort()
 
@@ -209,6 +229,7 @@ def missing_db(request):
     return render_to_response("ganeti/importing/missing_db.html", {
         'vms': vms,
         'form':form,
+        'unreachable': unreachable_clusters(errors),
         },
         context_instance=RequestContext(request),
     )
@@ -24,6 +24,7 @@ from ganeti_web.forms.importing import NodeForm
 from ganeti_web.middleware import Http403
 from ganeti_web.models import Cluster, Node, VirtualMachine
 from ganeti_web.views.generic import NO_PRIVS
+from ganeti_web.views.importing import unreachable_clusters
 
 
 @login_required
@@ -52,9 +53,11 @@ def missing_ganeti(request):
         if not clusters:
             raise Http403(NO_PRIVS)
 
+    chaff, missing, errors = Cluster.missing_nodes(clusters)
+
     nodes = []
-    for cluster in clusters:
-        for node in cluster.nodes_missing_in_ganeti:
+    for hostnames in missing.values():
+        for node in hostnames:
             nodes.append((node, node))
 
     if request.method == 'POST':
@@ -66,13 +69,18 @@ def missing_ganeti(request):
             node_ids = data['nodes']
             Node.objects.filter(hostname__in=node_ids).delete()
 
+            # remove deleted nodes from the list
+            nodes = filter(lambda x: unicode(x[0]) not in node_ids, nodes)
+
     else:
         form = NodeForm(nodes)
 
+    remaining = set(x[0] for x in nodes)
     nodes = {}
-    for cluster in clusters:
-        for node in cluster.nodes_missing_in_ganeti:
-            nodes[node] = (cluster.hostname, node)
+    for cluster, hostnames in missing.items():
+        for node in hostnames:
+            if node in remaining:
+                nodes[node] = (cluster.hostname, node)
 
     node_hostnames = nodes.keys()
     node_hostnames.sort()
@@ -87,6 +95,7 @@ def missing_ganeti(request):
                               , {
         'nodes': nodes,
         'form':form,
+        'unreachable': unreachable_clusters(errors),
         },
         context_instance=RequestContext(request),
     )
@@ -105,9 +114,11 @@ def missing_db(request):
         if not clusters:
             raise Http403(NO_PRIVS)
 
+    missing, chaff, errors = Cluster.missing_nodes(clusters)
+
     nodes = []
-    for cluster in clusters:
-        for hostname in cluster.nodes_missing_in_db:
+    for cluster, hostnames in missing.items():
+        for hostname in hostnames:
             nodes.append(('%s:%s' % (cluster.id, hostname), hostname))
 
     if request.method == 'POST':
@@ -135,13 +146,21 @@ def missing_db(request):
                     .filter(cluster=cluster, hostname__in=node.info['sinst_list']) \
                     .update(secondary_node=node)
 
+                Node.objects.update_allocations([node.pk])
+
+            # remove imported nodes from the list
+            nodes = filter(lambda x: unicode(x[0]) not in node_ids, nodes)
+
     else:
         form = NodeForm(nodes)
 
+    remaining = set(x[0] for x in nodes)
     nodes = {}
-    for cluster in clusters:
-        for hostname in cluster.nodes_missing_in_db:
-            nodes[hostname] = ('%s:%s' % (cluster.id, hostname), cluster.hostname, hostname)
+    for cluster, hostnames in missing.items():
+        for hostname in hostnames:
+            key = '%s:%s' % (cluster.id, hostname)
+            if key in remaining:
+                nodes[hostname] = (key, cluster.hostname, hostname)
     node_hostnames = nodes.keys()
     node_hostnames.sort()
 
@@ -154,6 +173,7 @@ def missing_db(request):
     return render_to_response("ganeti/importing/nodes/import.html", {
         'nodes': nodes,
         'form':form,
+        'unreachable': unreachable_clusters(errors),
         },
         context_instance=RequestContext(request),
     )
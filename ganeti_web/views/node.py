@@ -30,13 +30,15 @@ from object_log.views import list_for_object
 
 log_action = LogItem.objects.log_action
 
+from ganeti_web.backend.events import job_feed
+from ganeti_web.backend.queries import VM_SORT_KEYS, vm_qs_for_table
 from ganeti_web.util.client import GanetiApiError
 from ganeti_web import constants
 from ganeti_web.forms.node import RoleForm, MigrateForm, EvacuateForm
 from ganeti_web.middleware import Http403
 from ganeti_web.models import Node, Job
 from ganeti_web.views.generic import (NO_PRIVS, LoginRequiredMixin,
-                                      PagedListView)
+                                      PagedListView, event_stream)
 
 
 def get_node_and_cluster_or_404(cluster_slug, host):
@@ -82,6 +84,9 @@ class NodePrimaryListView(LoginRequiredMixin, PagedListView):
     """
 
     template_name = "ganeti/virtual_machine/table.html"
+    sort_keys = VM_SORT_KEYS
+    default_sort = "hostname"
+    cursor_pagination = True
 
     def get_queryset(self):
         self.node, self.cluster = get_node_and_cluster_or_404(
@@ -92,15 +97,16 @@ class NodePrimaryListView(LoginRequiredMixin, PagedListView):
                 user.has_any_perms(self.cluster, ["admin", "migrate"])):
             raise Http403(NO_PRIVS)
 
-        return self.node.primary_vms.all()
+        return vm_qs_for_table(self.node.primary_vms.all())
 
     def get_context_data(self, **kwargs):
-        kwargs.update({
+        context = super(NodePrimaryListView, self).get_context_data(**kwargs)
+        context.update({
             "tableID": "table_primary",
             "primary_node": True,
             "node": self.node,
         })
-        return kwargs
+        return context
 
 class NodeSecondaryListView(LoginRequiredMixin, PagedListView):
     """
@@ -108,6 +114,9 @@ class NodeSecondaryListView(LoginRequiredMixin, PagedListView):
     """
 
     template_name = "ganeti/virtual_machine/table.html"
+    sort_keys = VM_SORT_KEYS
+    default_sort = "hostname"
+    cursor_pagination = True
 
     def get_queryset(self):
         self.node, self.cluster = get_node_and_cluster_or_404(
@@ -118,15 +127,16 @@ class NodeSecondaryListView(LoginRequiredMixin, PagedListView):
                 user.has_any_perms(self.cluster, ["admin", "migrate"])):
             raise Http403(NO_PRIVS)
 
-        return self.node.secondary_vms.all()
+        return vm_qs_for_table(self.node.secondary_vms.all())
 
     def get_context_data(self, **kwargs):
-        kwargs.update({
+        context = super(NodeSecondaryListView, self).get_context_data(**kwargs)
+        context.update({
             "tableID": "table_secondary",
             "secondary_node": True,
             "node": self.node,
         })
-        return kwargs
+        return context
 
 
 @login_required
@@ -282,3 +292,11 @@ def job_status(request, id, rest=False):
         return jobs
     else:
         return HttpResponse(json.dumps(jobs), mimetype='application/json')
+
+
+@login_required
+def job_stream(request, id):
+    """
+    Stream the same list of jobs as job_status whenever it changes.
+    """
+    return event_stream({'jobs': job_feed(Node, id)})
@@ -1,10 +1,9 @@
-from haystack.query import SearchQuerySet
-
 from django.contrib.auth.decorators import login_required
 from django.http import (HttpResponse, HttpResponseRedirect,
                          HttpResponseNotFound)
 from django.utils import simplejson as json
 
+from ganeti_web.backend.autocomplete import suggest
 from ganeti_web.models import VirtualMachine, Cluster, Node
 
 
@@ -43,25 +42,13 @@ def suggestions(request):
     # Start out with an empty result objects list
     result_objects = []
 
-    # If a query actually does exist, construct the result objects
+    # If a query actually does exist, construct the result objects from the
+    # objects the user may see. Suggestions come from an in-memory index
+    # rather than the search engine, since they're requested on every
+    # keystroke.
     if query is not None:
-
-        # Perform the actual query on the Haystack search query set
-        results = SearchQuerySet().autocomplete(content_auto=query)
-
-        # Construct the result objects
-        for result in results:
-            result_object = {}
-            result_object['value'] = result.content_auto
-            if result.model_name == 'virtualmachine':
-                result_object['type'] = 'vm'
-            elif result.model_name == 'cluster':
-                result_object['type'] = 'cluster'
-            elif result.model_name == 'node':
-                result_object['type'] = 'node'
-            else:
-                result_object['type'] = 'unknown'
-            result_objects.append(result_object)
+        for type, hostname in suggest(request.user, query):
+            result_objects.append({'value': hostname, 'type': type})
 
     # Return the results list as a json object
     return HttpResponse(json.dumps(result_objects, indent=4), 
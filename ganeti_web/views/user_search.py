@@ -1,6 +1,8 @@
 from django.http import HttpResponse
 from django.contrib.auth.models import User, Group
 from django.utils import simplejson
+from ganeti_web.backend.queries import (cluster_user_labels,
+                                        cluster_users_by_prefix)
 from ganeti_web.models import ClusterUser
 
 def search_users(request):
@@ -38,43 +40,23 @@ def search_owners(request):
     return HttpResponse(data, mimetype="application/json")
 
 def search_cluster_users(term=None, pk=None, limit=10):
-    
-    if pk:
-        clusterUsers = ClusterUser.objects.filter(id=int(pk))
-    elif term:
-        clusterUsers = ClusterUser.objects.filter(name__istartswith=term)
-    else:
-        clusterUsers = ClusterUser.objects.all()
-    
-    clusterUsers = clusterUsers.values('pk', 'name')
-    
+    """
+    Returns the top N users and groups with a name starting with term, or
+    the user or group with the given primary key.
+
+    @param term: the term to search for
+    @param pk: the primary key of the user/group to search for
+    @param limit: the number of results to return
+    """
     if pk:
-        query = clusterUsers[0]['name']
-    elif term:
-        query = term
+        query, real_type = ClusterUser.objects.filter(id=int(pk)) \
+            .values_list('name', 'real_type')[0]
+        label = cluster_user_labels().get(real_type, 'other')
+        clusterUsers = [(query, label, int(pk))]
     else:
-        query = ""
- 
-    if limit: 
-        clusterUsers = clusterUsers[:limit]
-     
-    # lable each item based on its real_type
-    labeledUsers = []
-    for i in clusterUsers:
-        f = 'other'
-        userType = str(ClusterUser.objects.get(id=i['pk']).cast()._get_real_type())
-        if userType == "profile":  
-            f = 'user'             
-        elif userType == "organization":   
-            f = 'group' 
-        labeledUsers.append((i['name'], f, i['pk']))
-    
-    clusterUsers = labeledUsers 
-   
-    # sort list and crop out all but the top [limit] results
-    clusterUsers = sorted(clusterUsers, key=lambda x: x[0]) 
-    clusterUsers = clusterUsers if len(clusterUsers) < limit else clusterUsers[:limit]
- 
+        query = term or ""
+        clusterUsers = cluster_users_by_prefix(query, limit)
+
     return {
         'query':query,
         'results':clusterUsers
@@ -96,7 +78,7 @@ def search_users_only(term=None, pk=None, limit=10):
     else:
         users = User.objects.all()
      
-    users = users.values('pk', 'username')
+    users = users.order_by('username').values('pk', 'username')
 
     if pk:
         query = users[0]['username']     
@@ -142,8 +124,8 @@ def search_users_and_groups(term=None, pk=None, limit=10):
         users = User.objects.all()
         groups = Group.objects.all()
 
-    users = users.values('pk', 'username')
-    groups = groups.values('pk', 'name')
+    users = users.order_by('username').values('pk', 'username')
+    groups = groups.order_by('name').values('pk', 'name')
 
     if pk:
         query = ""
@@ -21,7 +21,6 @@ from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib.contenttypes.models import ContentType
 from django.core.urlresolvers import reverse
-from django.db.models import Q
 from django.forms import CharField, HiddenInput
 from django.http import (HttpResponse, HttpResponseRedirect,
                          HttpResponseForbidden, HttpResponseBadRequest,
@@ -35,7 +34,6 @@ from django.views.generic.edit import DeleteView
 
 from object_log.views import list_for_object
 
-from object_permissions import get_users_any
 from object_permissions.signals import (view_add_user, view_edit_user,
                                         view_remove_user)
 from object_permissions.views.permissions import view_users, view_permissions
@@ -43,7 +41,9 @@ from object_permissions.views.permissions import view_users, view_permissions
 from object_log.models import LogItem
 log_action = LogItem.objects.log_action
 
-from ganeti_web.backend.queries import vm_qs_for_users
+from ganeti_web.backend.events import job_feed, vm_state_feed
+from ganeti_web.backend.queries import (VM_SORT_KEYS, vm_qs_for_table,
+                                       vm_qs_for_users)
 from ganeti_web.caps import has_shutdown_timeout
 from ganeti_web.forms.virtual_machine import (KvmModifyVirtualMachineForm,
                                               PvmModifyVirtualMachineForm,
@@ -52,13 +52,15 @@ from ganeti_web.forms.virtual_machine import (KvmModifyVirtualMachineForm,
                                               RenameForm, ChangeOwnerForm,
                                               ReplaceDisksForm)
 from ganeti_web.middleware import Http403
-from ganeti_web.models import Cluster, Job, SSHKey, Node, VirtualMachine
+from ganeti_web.models import (Cluster, Job, SSHKeyIndex, Node,
+                               VirtualMachine)
 from ganeti_web.templatetags.webmgr_tags import render_storage
 from ganeti_web.util.client import GanetiApiError
 from ganeti_web.utilities import (cluster_os_list, compare, os_prettify,
                                   get_hypervisor)
 from ganeti_web.views.generic import (NO_PRIVS, LoginRequiredMixin,
-                                      PagedListView)
+                                      PagedListView, event_stream,
+                                      ssh_keys_response)
 
 
 #XXX No more need for tastypie dependency for 0.8
@@ -89,10 +91,12 @@ class VMListView(LoginRequiredMixin, PagedListView):
     View for displaying a list of VirtualMachines.
     """
     template_name = "ganeti/virtual_machine/list.html"
+    sort_keys = VM_SORT_KEYS
+    default_sort = "hostname"
+    cursor_pagination = True
 
     def get_queryset(self):
-        qs = vm_qs_for_users(self.request.user)
-        return qs.select_related()
+        return vm_qs_for_table(vm_qs_for_users(self.request.user))
 
     def get_context_data(self, **kwargs):
         user = self.request.user
@@ -534,17 +538,12 @@ def ssh_keys(request, cluster_slug, instance, api_key):
     if settings.WEB_MGR_API_KEY != api_key:
         return HttpResponseForbidden(_("You're not allowed to view keys."))
 
-    vm = get_object_or_404(VirtualMachine, hostname=instance,
-                           cluster__slug=cluster_slug)
-
-    users = get_users_any(vm, ["admin",]).values_list("id",flat=True)
-    keys = SSHKey.objects \
-        .filter(Q(user__in=users) | Q(user__is_superuser=True)) \
-        .values_list('key','user__username') \
-        .order_by('user__username')
+    # The cached info isn't needed, so don't load or refresh it.
+    vm = get_object_or_404(VirtualMachine.objects.defer('serialized_info'),
+                           hostname=instance, cluster__slug=cluster_slug)
 
-    keys_list = list(keys)
-    return HttpResponse(json.dumps(keys_list), mimetype="application/json")
+    index = SSHKeyIndex.objects.get_index(virtual_machine=vm)
+    return ssh_keys_response(request, index)
 
 
 @login_required
@@ -1024,6 +1023,17 @@ def job_status(request, id, rest=False):
         return HttpResponse(json.dumps(jobs), mimetype='application/json')
 
 
+@login_required
+def job_stream(request, id):
+    """
+    Stream the same list of jobs as job_status whenever it changes.
+
+    A state event is also sent whenever the virtual machine changes.
+    """
+    return event_stream({'jobs': job_feed(VirtualMachine, id),
+                         'state': vm_state_feed(id)})
+
+
 def recv_user_add(sender, editor, user, obj, **kwargs):
     """
     receiver for object_permissions.signals.view_add_user, Logs action